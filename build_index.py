@@ -8,6 +8,10 @@ import sqlite3
 from pathlib import Path
 from collections import defaultdict
 
+from change_log import init_change_tables, update_versions
+from endpoints import init_endpoint_tables, link_endpoints
+from raw_store import RawStore
+
 # Austrian provinces (Bundesländer)
 PROVINCES = {
     'wien': 'Wien',
@@ -26,6 +30,28 @@ PROVINCES = {
     'vorarlberg': 'Vorarlberg'
 }
 
+DB_PATH = 'inspire_austria.db'
+RAW_DIR = 'raw_data'
+DELTA_FILE = 'raw_data/delta.json'
+
+INSPIRE_URL = 'https://geometadatensuche.inspire.gv.at/metadatensuche/inspire/ger/catalog.search#/metadata/{}'
+
+# Tables owned by the index build. Everything else in the database
+# (service status, feedback, schemas, validations, change log) survives a rebuild.
+INDEX_TABLES = [
+    'datasets', 'dataset_themes', 'dataset_topics', 'dataset_keywords',
+    'dataset_services', 'dataset_formats', 'topic_groups', 'dataset_docs', 'datasets_fts',
+    'endpoint_datasets'
+]
+
+# Column holding the dataset id in each index table, for incremental updates
+DATASET_KEYS = {
+    'datasets': 'id', 'dataset_themes': 'dataset_id', 'dataset_topics': 'dataset_id',
+    'dataset_keywords': 'dataset_id', 'dataset_services': 'dataset_id',
+    'dataset_formats': 'dataset_id', 'topic_groups': 'dataset_id',
+    'dataset_docs': 'dataset_id', 'datasets_fts': 'id', 'endpoint_datasets': 'dataset_id'
+}
+
 # Topic mappings for grouping related datasets
 TOPIC_KEYWORDS = {
     'grundwasser': ['grundwasser', 'groundwater', 'aquifer', 'wasserspiegel', 'pegel'],
@@ -118,6 +144,23 @@ def parse_links(links):
             })
     return result
 
+def detect_download_format(url):
+    """Detect download format from URL."""
+    url_lower = url.lower() if url else ''
+    if '.gpkg' in url_lower or 'geopackage' in url_lower:
+        return 'GeoPackage'
+    elif '.zip' in url_lower:
+        return 'ZIP'
+    elif '.geojson' in url_lower or 'geojson' in url_lower:
+        return 'GeoJSON'
+    elif '.gml' in url_lower:
+        return 'GML'
+    elif '.shp' in url_lower or 'shapefile' in url_lower:
+        return 'Shapefile'
+    elif '.csv' in url_lower:
+        return 'CSV'
+    return None
+
 def calculate_gem_score(dataset):
     """Calculate a 'gem' score based on data quality indicators."""
     score = 0
@@ -200,7 +243,7 @@ def process_dataset(hit):
         'abstract': abstract[:2000] if abstract else '',
         'type': source.get('resourceType', ['unknown'])[0] if source.get('resourceType') else 'unknown',
         'themes': source.get('inspireTheme', []),
-        'keywords': list(set(all_keywords)),
+        'keywords': sorted(set(all_keywords)),
         'province': province,
         'topics': topics,
         'year': year,
@@ -218,23 +261,87 @@ def process_dataset(hit):
     
     return dataset
 
-def load_all_datasets():
-    """Load all datasets from raw JSON files."""
+def build_dataset_doc(ds):
+    """Build the ready-to-serve detail document for /api/dataset."""
+    services = []
+    for svc in ds['services']:
+        entry = {'type': svc['type'], 'url': svc['url'], 'protocol': svc['protocol']}
+        fmt = detect_download_format(svc['url'])
+        if fmt:
+            entry['format'] = fmt
+        services.append(entry)
+    
+    doc = {
+        'id': ds['id'],
+        'uuid': ds['uuid'],
+        'title': ds['title'],
+        'abstract': ds['abstract'],
+        'type': ds['type'],
+        'province': ds['province'],
+        'year': ds['year'],
+        'themes': ds['themes'],
+        'topics': ds['topics'],
+        'keywords': [kw for kw in ds['keywords'] if kw],
+        'services': services,
+        'formats': ds['formats'],
+        'gem_score': ds['gem_score'],
+        'is_open_data': bool(ds['is_open_data']),
+        'org': ds['org'],
+        'contact': ds['contact'],
+        'create_date': ds['create_date'],
+        'update_date': ds['update_date'],
+        'bbox': ds['bbox'] or None,
+        'inspire_url': INSPIRE_URL.format(ds['uuid'])
+    }
+    # Stored pre-encoded so the server can write it out without re-serializing
+    return json.dumps(doc, ensure_ascii=False).encode('utf-8')
+
+def page_number(path):
+    try:
+        return int(path.stem.split('_')[1])
+    except (IndexError, ValueError):
+        return -1
+
+def raw_hits(raw_dir):
+    """Yield raw search hits from the record store, or legacy page files."""
+    store = RawStore(raw_dir)
+    if store.exists():
+        yield from store.records()
+        return
+
+    for filepath in sorted(raw_dir.glob('page_*.json'), key=page_number):
+        with open(filepath) as f:
+            data = json.load(f)
+        yield from data.get('hits', {}).get('hits', [])
+
+def process_hits(hits):
     datasets = []
-    raw_dir = Path('raw_data')
-    
-    for i in range(20):
-        filepath = raw_dir / f'page_{i}.json'
-        if filepath.exists():
-            with open(filepath) as f:
-                data = json.load(f)
-                hits = data.get('hits', {}).get('hits', [])
-                for hit in hits:
-                    try:
-                        ds = process_dataset(hit)
-                        datasets.append(ds)
-                    except Exception as e:
-                        print(f"Error processing dataset: {e}")
+    seen = set()
+    for hit in hits:
+        try:
+            ds = process_dataset(hit)
+        except Exception as e:
+            print(f"Error processing dataset: {e}")
+            continue
+        if ds['id'] in seen:
+            continue
+        seen.add(ds['id'])
+        datasets.append(ds)
+    return datasets
+
+def load_all_datasets():
+    """Load all datasets from the raw record store."""
+    raw_dir = Path(RAW_DIR)
+    datasets = process_hits(raw_hits(raw_dir))
+    
+    state_path = raw_dir / 'harvest_state.json'
+    if state_path.exists():
+        with open(state_path) as f:
+            state = json.load(f)
+        if not state.get('complete'):
+            print("Warning: last harvest did not complete, index may be partial")
+        elif len(datasets) < state['total'] - state.get('missing', 0):
+            print(f"Warning: harvest reported {state['total']} records")
     
     return datasets
 
@@ -253,15 +360,8 @@ def build_topic_groups(datasets):
     
     return dict(groups)
 
-def create_database(datasets, topic_groups):
-    """Create SQLite database with all data."""
-    db_path = 'inspire_austria.db'
-    if os.path.exists(db_path):
-        os.remove(db_path)
-    
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-    
+def create_index_tables(cur):
+    """Create the tables owned by the index build."""
     # Main datasets table
     cur.execute('''
         CREATE TABLE datasets (
@@ -338,6 +438,15 @@ def create_database(datasets, topic_groups):
         )
     ''')
     
+    # Precomputed detail documents (JSON, utf-8 encoded)
+    cur.execute('''
+        CREATE TABLE dataset_docs (
+            dataset_id TEXT PRIMARY KEY,
+            doc BLOB,
+            FOREIGN KEY (dataset_id) REFERENCES datasets(id)
+        )
+    ''')
+    
     # Full-text search table
     cur.execute('''
         CREATE VIRTUAL TABLE datasets_fts USING fts5(
@@ -350,49 +459,74 @@ def create_database(datasets, topic_groups):
             province
         )
     ''')
-    
-    # Insert data
-    for ds in datasets:
-        cur.execute('''
-            INSERT INTO datasets VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            ds['id'], ds['uuid'], ds['title'], ds['abstract'], ds['type'],
-            ds['province'], ds['year'], ds['is_open_data'], ds['org'], 
-            ds['contact'], ds['create_date'], ds['update_date'], ds['gem_score'],
-            json.dumps(ds['bbox']) if ds['bbox'] else None
-        ))
-        
-        for theme in ds['themes']:
-            cur.execute('INSERT INTO dataset_themes VALUES (?, ?)', (ds['id'], theme))
-        
-        for topic in ds['topics']:
-            cur.execute('INSERT INTO dataset_topics VALUES (?, ?)', (ds['id'], topic))
-            
-        for kw in ds['keywords']:
-            if kw:
-                cur.execute('INSERT INTO dataset_keywords VALUES (?, ?)', (ds['id'], kw))
-        
-        for svc in ds['services']:
-            cur.execute('INSERT INTO dataset_services (dataset_id, url, service_type, protocol) VALUES (?, ?, ?, ?)',
-                       (ds['id'], svc['url'], svc['type'], svc['protocol']))
-            
-        for fmt in ds['formats']:
-            cur.execute('INSERT INTO dataset_formats VALUES (?, ?)', (ds['id'], fmt))
-        
-        # FTS entry
-        cur.execute('''
-            INSERT INTO datasets_fts VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            ds['id'], ds['title'], ds['abstract'],
-            ' '.join(ds['keywords']), ' '.join(ds['themes']),
-            ' '.join(ds['topics']), ds['province'] or ''
-        ))
-    
-    # Insert topic groups
+
+def insert_dataset(cur, ds):
+    """Insert one dataset into all index tables and return its document."""
+    cur.execute('''
+        INSERT INTO datasets VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        ds['id'], ds['uuid'], ds['title'], ds['abstract'], ds['type'],
+        ds['province'], ds['year'], ds['is_open_data'], ds['org'],
+        ds['contact'], ds['create_date'], ds['update_date'], ds['gem_score'],
+        json.dumps(ds['bbox']) if ds['bbox'] else None
+    ))
+
+    for theme in ds['themes']:
+        cur.execute('INSERT INTO dataset_themes VALUES (?, ?)', (ds['id'], theme))
+
+    for topic in ds['topics']:
+        cur.execute('INSERT INTO dataset_topics VALUES (?, ?)', (ds['id'], topic))
+
+    for kw in ds['keywords']:
+        if kw:
+            cur.execute('INSERT INTO dataset_keywords VALUES (?, ?)', (ds['id'], kw))
+
+    for svc in ds['services']:
+        cur.execute('INSERT INTO dataset_services (dataset_id, url, service_type, protocol) VALUES (?, ?, ?, ?)',
+                   (ds['id'], svc['url'], svc['type'], svc['protocol']))
+
+    for fmt in ds['formats']:
+        cur.execute('INSERT INTO dataset_formats VALUES (?, ?)', (ds['id'], fmt))
+
+    doc = build_dataset_doc(ds)
+    cur.execute('INSERT INTO dataset_docs VALUES (?, ?)', (ds['id'], doc))
+
+    # FTS entry
+    cur.execute('''
+        INSERT INTO datasets_fts VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        ds['id'], ds['title'], ds['abstract'],
+        ' '.join(ds['keywords']), ' '.join(ds['themes']),
+        ' '.join(ds['topics']), ds['province'] or ''
+    ))
+    return doc
+
+def insert_topic_groups(cur, topic_groups):
     for topic, ds_ids in topic_groups.items():
         for ds_id in ds_ids:
             cur.execute('INSERT INTO topic_groups VALUES (?, ?)', (topic, ds_id))
-    
+
+def create_database(datasets, topic_groups):
+    """Create SQLite database with all data."""
+    conn = sqlite3.connect(DB_PATH)
+    cur = conn.cursor()
+
+    # Rebuild in one transaction so readers keep the old index until commit
+    cur.execute('BEGIN')
+    for table in INDEX_TABLES:
+        cur.execute(f'DROP TABLE IF EXISTS {table}')
+    init_change_tables(cur)
+    init_endpoint_tables(cur)
+    create_index_tables(cur)
+
+    # Insert data
+    docs = {}
+    for ds in datasets:
+        docs[ds['id']] = insert_dataset(cur, ds)
+
+    insert_topic_groups(cur, topic_groups)
+    links = link_endpoints(cur)
+
     # Create indexes
     cur.execute('CREATE INDEX idx_datasets_type ON datasets(type)')
     cur.execute('CREATE INDEX idx_datasets_province ON datasets(province)')
@@ -402,10 +536,65 @@ def create_database(datasets, topic_groups):
     cur.execute('CREATE INDEX idx_services_type ON dataset_services(service_type)')
     cur.execute('CREATE INDEX idx_groups_topic ON topic_groups(topic)')
     
+    # Record per-dataset versions and change events for /api/changes
+    cur.execute('SELECT dataset_id FROM dataset_versions WHERE removed = 0')
+    removed_ids = [r[0] for r in cur.fetchall() if r[0] not in docs]
+    changes = update_versions(cur, docs, removed_ids)
+    
+    cur.execute('SELECT COUNT(DISTINCT endpoint_id) FROM endpoint_datasets')
+    endpoint_count = cur.fetchone()[0]
+    
     conn.commit()
     conn.close()
     
     print(f"Database created with {len(datasets)} datasets")
+    print(f"Service links: {links} to {endpoint_count} unique endpoints")
+    print(f"Changes: {changes['added']} added, {changes['modified']} modified, {changes['removed']} removed")
+
+def load_delta(path=DELTA_FILE):
+    """Load a delta written by harvester.py --delta."""
+    with open(path) as f:
+        delta = json.load(f)
+
+    store = RawStore(RAW_DIR)
+    changed = process_hits(store.records(delta.get('changed', [])))
+    return changed, delta.get('removed', [])
+
+def apply_delta(changed, removed_ids):
+    """Update the index in place for changed and removed datasets only."""
+    conn = sqlite3.connect(DB_PATH)
+    cur = conn.cursor()
+
+    cur.execute("SELECT 1 FROM sqlite_master WHERE name = 'dataset_docs'")
+    if not cur.fetchone():
+        conn.close()
+        return None
+
+    cur.execute('BEGIN')
+    init_change_tables(cur)
+    init_endpoint_tables(cur)
+
+    ids = [ds['id'] for ds in changed] + list(removed_ids)
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        placeholders = ','.join('?' * len(chunk))
+        for table, key in DATASET_KEYS.items():
+            cur.execute(f'DELETE FROM {table} WHERE {key} IN ({placeholders})', chunk)
+
+    docs = {}
+    for ds in changed:
+        docs[ds['id']] = insert_dataset(cur, ds)
+    insert_topic_groups(cur, build_topic_groups(changed))
+    link_endpoints(cur, [ds['id'] for ds in changed])
+
+    changes = update_versions(cur, docs, removed_ids)
+
+    conn.commit()
+    conn.close()
+
+    print(f"Applied delta: {len(changed)} changed, {len(removed_ids)} removed")
+    print(f"Changes: {changes['added']} added, {changes['modified']} modified, {changes['removed']} removed")
+    return changes
 
 def generate_summary(datasets):
     """Generate a summary JSON for quick loading."""
@@ -459,6 +648,29 @@ def generate_summary(datasets):
     return summary
 
 if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Build the INSPIRE dataset index')
+    parser.add_argument('--delta', nargs='?', const=DELTA_FILE, metavar='PATH',
+                        help='Apply a harvester delta instead of rebuilding')
+    args = parser.parse_args()
+
+    if args.delta:
+        if not os.path.exists(args.delta):
+            print(f"No delta at {args.delta}, nothing to do")
+            raise SystemExit(0)
+
+        print("Applying delta...")
+        changed, removed_ids = load_delta(args.delta)
+        if apply_delta(changed, removed_ids) is not None:
+            os.remove(args.delta)
+
+            # The summary covers the whole catalog, so rebuild it from the raw pages
+            print("Generating summary...")
+            generate_summary(load_all_datasets())
+            raise SystemExit(0)
+        print("No index yet, running a full build")
+
     print("Loading datasets...")
     datasets = load_all_datasets()
     print(f"Loaded {len(datasets)} datasets")
@@ -469,6 +681,10 @@ if __name__ == '__main__':
     
     print("Creating database...")
     create_database(datasets, topic_groups)
+
+    # A full build already includes any pending delta
+    if os.path.exists(DELTA_FILE):
+        os.remove(DELTA_FILE)
     
     print("Generating summary...")
     summary = generate_summary(datasets)
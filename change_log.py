@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Append-only change log for incremental client sync.
+
+Every dataset carries a version that is bumped whenever its detail
+document changes. Each addition, modification, removal and service
+status change is appended to dataset_changes with a monotonically
+increasing sequence number, which /api/changes?since=SEQ serves.
+"""
+
+import hashlib
+import json
+from datetime import datetime, timezone
+
+CHANGE_TYPES = ('added', 'modified', 'removed', 'service_status')
+
+def init_change_tables(cur):
+    """Create change log tables (kept across index rebuilds)."""
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS dataset_versions (
+            dataset_id TEXT PRIMARY KEY,
+            version INTEGER,
+            content_hash TEXT,
+            updated_seq INTEGER,
+            removed BOOLEAN DEFAULT 0
+        )
+    ''')
+
+    # AUTOINCREMENT so sequence numbers are never reused, even after deletes
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS dataset_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            dataset_id TEXT,
+            change_type TEXT,
+            version INTEGER,
+            details TEXT,
+            changed_at TEXT
+        )
+    ''')
+
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_changes_dataset ON dataset_changes(dataset_id)')
+
+def record_change(cur, dataset_id, change_type, version=None, details=None):
+    """Append one event to the change log and return its sequence number."""
+    cur.execute('''
+        INSERT INTO dataset_changes (dataset_id, change_type, version, details, changed_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (
+        dataset_id, change_type, version,
+        json.dumps(details, ensure_ascii=False) if details else None,
+        datetime.now(timezone.utc).isoformat()
+    ))
+    return cur.lastrowid
+
+def content_hash(doc):
+    """Fingerprint of an encoded dataset document."""
+    return hashlib.sha1(doc).hexdigest()
+
+def update_versions(cur, docs, removed_ids=()):
+    """Compare documents against stored versions and log what changed.
+
+    docs maps dataset id to its encoded document. removed_ids lists
+    datasets that no longer exist. Returns counts per change type.
+    """
+    cur.execute('SELECT dataset_id, version, content_hash, removed FROM dataset_versions')
+    known = {r[0]: (r[1], r[2], r[3]) for r in cur.fetchall()}
+    counts = {'added': 0, 'modified': 0, 'removed': 0}
+
+    for ds_id, doc in docs.items():
+        digest = content_hash(doc)
+        if ds_id not in known or known[ds_id][2]:
+            change_type = 'added'
+        elif known[ds_id][1] != digest:
+            change_type = 'modified'
+        else:
+            continue
+
+        version = known[ds_id][0] + 1 if ds_id in known else 1
+        seq = record_change(cur, ds_id, change_type, version)
+        cur.execute('''
+            INSERT INTO dataset_versions (dataset_id, version, content_hash, updated_seq, removed)
+            VALUES (?, ?, ?, ?, 0)
+            ON CONFLICT(dataset_id) DO UPDATE SET
+                version = excluded.version,
+                content_hash = excluded.content_hash,
+                updated_seq = excluded.updated_seq,
+                removed = 0
+        ''', (ds_id, version, digest, seq))
+        counts[change_type] += 1
+
+    for ds_id in removed_ids:
+        if ds_id not in known or known[ds_id][2]:
+            continue
+        version = known[ds_id][0] + 1
+        seq = record_change(cur, ds_id, 'removed', version)
+        cur.execute('''
+            UPDATE dataset_versions SET version = ?, content_hash = NULL, updated_seq = ?, removed = 1
+            WHERE dataset_id = ?
+        ''', (version, seq, ds_id))
+        counts['removed'] += 1
+
+    return counts
+
+def record_status_change(cur, dataset_id, service_url, old_status, new_status):
+    """Log a service status transition (no-op if the status is unchanged)."""
+    if not dataset_id or old_status == new_status:
+        return None
+    return record_change(cur, dataset_id, 'service_status', details={
+        'url': service_url,
+        'from': old_status,
+        'to': new_status
+    })
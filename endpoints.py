@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""Canonical service endpoints shared by many datasets.
+
+Many datasets link to the same WFS/WMS server with different query
+strings (GetCapabilities, GetMap with layers, ...). service_endpoints holds
+one row per unique endpoint, keyed on service type plus the normalized
+URL with OGC request parameters stripped. endpoint_datasets links each
+endpoint to the datasets and dataset_services rows that use it, so the
+crawlers can fetch once per endpoint and fan results out.
+
+service_endpoints survives index rebuilds, so endpoint ids stay stable;
+endpoint_datasets is rebuilt with the index.
+"""
+
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+# Service types whose URLs carry OGC request parameters
+OGC_TYPES = {'WFS', 'WMS', 'WMTS', 'OGC-API'}
+
+# Request parameters that select an operation, not an endpoint (lowercase)
+OGC_PARAMS = {
+    'service', 'request', 'version', 'acceptversions', 'sections', 'language',
+    'typename', 'typenames', 'outputformat', 'count', 'maxfeatures', 'startindex',
+    'srsname', 'resulttype', 'layers', 'layer', 'styles', 'style', 'format',
+    'bbox', 'crs', 'srs', 'width', 'height', 'transparent', 'exceptions',
+    'tilematrixset', 'tilematrix', 'tilerow', 'tilecol', 'f', 'limit'
+}
+
+def normalize_endpoint(url, service_type):
+    """Return (key, canonical url, host) for a service URL."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    port = parts.port
+    netloc = host
+    if port and not (scheme == 'http' and port == 80) and not (scheme == 'https' and port == 443):
+        netloc = f'{host}:{port}'
+
+    path = parts.path
+    query = parts.query
+
+    if service_type in OGC_TYPES:
+        params = parse_qsl(query, keep_blank_values=True)
+        query = urlencode(sorted((k, v) for k, v in params if k.lower() not in OGC_PARAMS))
+        if service_type == 'OGC-API' and '/collections' in path:
+            path = path[:path.index('/collections')]
+        path = path.rstrip('/')
+
+    canonical = f'{scheme}://{netloc}{path}'
+    if query:
+        canonical += '?' + query
+    return f'{service_type}|{canonical}', canonical, host
+
+def probe_url(url, service_type):
+    """URL that checks an endpoint is alive (its capabilities document)."""
+    if service_type in ('WFS', 'WMS', 'WMTS'):
+        sep = '&' if '?' in url else '?'
+        return f'{url}{sep}SERVICE={service_type}&REQUEST=GetCapabilities'
+    return url
+
+def init_endpoint_tables(cur):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS service_endpoints (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            endpoint_key TEXT UNIQUE,
+            url TEXT,
+            service_type TEXT,
+            host TEXT,
+            first_seen TEXT
+        )
+    ''')
+
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS endpoint_datasets (
+            endpoint_id INTEGER,
+            dataset_id TEXT,
+            service_id INTEGER,
+            url TEXT,
+            FOREIGN KEY (endpoint_id) REFERENCES service_endpoints(id),
+            FOREIGN KEY (dataset_id) REFERENCES datasets(id),
+            FOREIGN KEY (service_id) REFERENCES dataset_services(id)
+        )
+    ''')
+
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_endpoint_datasets_endpoint ON endpoint_datasets(endpoint_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_endpoint_datasets_dataset ON endpoint_datasets(dataset_id)')
+
+def init_layer_size_table(cur):
+    """Size signals per endpoint layer, written by the crawlers.
+
+    A layer is a WFS feature type or OGC API collection; other endpoints
+    (downloads) have a single layer named ''. features comes from WFS
+    resultType=hits, OGC API numberMatched or a sample that held every
+    feature; bytes from Content-Length, or estimated from the average size
+    of sampled features times the feature count.
+    """
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS layer_sizes (
+            endpoint_id INTEGER,
+            layer TEXT,
+            features INTEGER,
+            features_source TEXT,
+            bytes INTEGER,
+            bytes_source TEXT,
+            measured_at TEXT,
+            PRIMARY KEY (endpoint_id, layer),
+            FOREIGN KEY (endpoint_id) REFERENCES service_endpoints(id)
+        )
+    ''')
+
+def save_layer_sizes(cur, rows):
+    """Upsert (endpoint_id, layer, features, features_source, bytes, bytes_source, measured_at) rows.
+
+    A signal missing from a new measurement keeps its previous value.
+    """
+    cur.executemany('''
+        INSERT INTO layer_sizes VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(endpoint_id, layer) DO UPDATE SET
+            features = COALESCE(excluded.features, features),
+            features_source = COALESCE(excluded.features_source, features_source),
+            bytes = COALESCE(excluded.bytes, bytes),
+            bytes_source = COALESCE(excluded.bytes_source, bytes_source),
+            measured_at = excluded.measured_at
+    ''', rows)
+
+def link_endpoints(cur, dataset_ids=None):
+    """Map dataset_services rows to endpoints, creating endpoints as needed.
+
+    With dataset_ids, only those datasets' services are linked (incremental
+    builds); otherwise all of them. Returns the number of links written.
+    """
+    sql = 'SELECT id, dataset_id, url, service_type FROM dataset_services WHERE url IS NOT NULL AND url != \'\''
+    params = []
+    if dataset_ids is not None:
+        if not dataset_ids:
+            return 0
+        sql += f" AND dataset_id IN ({','.join('?' * len(dataset_ids))})"
+        params = list(dataset_ids)
+    cur.execute(sql, params)
+    services = cur.fetchall()
+
+    now = datetime.now(timezone.utc).isoformat()
+    endpoint_ids = {}
+    links = []
+    for service_id, dataset_id, url, service_type in services:
+        key, canonical, host = normalize_endpoint(url, service_type)
+        if key not in endpoint_ids:
+            cur.execute('''
+                INSERT INTO service_endpoints (endpoint_key, url, service_type, host, first_seen)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(endpoint_key) DO NOTHING
+            ''', (key, canonical, service_type, host, now))
+            cur.execute('SELECT id FROM service_endpoints WHERE endpoint_key = ?', (key,))
+            endpoint_ids[key] = cur.fetchone()[0]
+        links.append((endpoint_ids[key], dataset_id, service_id, url))
+
+    cur.executemany('INSERT INTO endpoint_datasets VALUES (?, ?, ?, ?)', links)
+    return len(links)
+
+def ensure_column(cur, table, column, decl):
+    """Add a column to an existing table if it is missing."""
+    cur.execute(f'PRAGMA table_info({table})')
+    if column not in {row[1] for row in cur.fetchall()}:
+        cur.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+
+if __name__ == '__main__':
+    import sqlite3
+
+    conn = sqlite3.connect('inspire_austria.db')
+    cur = conn.cursor()
+    cur.execute('''
+        SELECT e.service_type, COUNT(DISTINCT e.id), COUNT(ed.service_id)
+        FROM service_endpoints e
+        JOIN endpoint_datasets ed ON ed.endpoint_id = e.id
+        GROUP BY e.service_type
+        ORDER BY COUNT(ed.service_id) DESC
+    ''')
+    print(f"{'Type':<10} {'Endpoints':>10} {'Links':>8}")
+    for service_type, endpoints, links in cur.fetchall():
+        print(f"{service_type:<10} {endpoints:>10} {links:>8}")
+    conn.close()
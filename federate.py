@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""Fetch the WFS / OGC API layers of a concept and merge them into one dataset.
+
+/api/combine describes how provincial layers could be combined;
+/api/combine/execute does it. Every member layer is fetched concurrently
+and page by page, properties are renamed to their canonical names through
+field_synonyms, a bundesland column is added, and each page is written out
+as soon as it arrives. A source that fails or reaches the feature cap does
+not stop the others; the summary records what each one delivered.
+"""
+
+import json
+import queue
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, unquote, urlencode, urlsplit
+
+from host_health import HostHealth
+from http_client import HostThrottle, HttpClient, HttpError
+
+DB_PATH = 'inspire_austria.db'
+TIMEOUT = 60  # seconds, for hosts without a latency history
+USER_AGENT = 'INSPIRE-Federator/1.0'
+PAGE_SIZE = 1000  # features per request
+MAX_FEATURES = 50000  # per source; larger layers are truncated
+MAX_PAGE_BYTES = 64 * 1024 * 1024
+MAX_SOURCES = 30
+SOURCE_WORKERS = 8  # sources fetched at once
+HOST_RATE = 2.0  # requests per second per host
+HOST_BURST = 2
+QUEUE_PAGES = 16  # fetched pages waiting to be written
+# WFS 2.0 servers honour EPSG:4326 axis order (lat/lon); GeoJSON and /ogc are lon/lat
+CRS84 = 'urn:ogc:def:crs:OGC:1.3:CRS84'
+
+SUMMARY_KEYS = ('dataset_id', 'title', 'province', 'type', 'url', 'layer', 'status', 'features', 'pages',
+                'error', 'seconds')
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Client shared by all requests, so connections and host health carry over."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient(timeout=TIMEOUT, user_agent=USER_AGENT, health=HostHealth(DB_PATH),
+                                 throttle=HostThrottle(HOST_RATE, HOST_BURST))
+        return _client
+
+def combine_sources(cur, concept_id=None, ids=None, limit=MAX_FEATURES):
+    """One source per member dataset: the layer its own OGC API or WFS link names.
+
+    The layer comes from the dataset's service URL (TYPENAME(S), or
+    /collections/{id}); a URL without one resolves only if the endpoint
+    has a single known feature type. Datasets whose layer cannot be
+    resolved are listed with an error, and datasets naming a layer
+    already fetched for another one are listed as duplicates.
+    """
+    if concept_id:
+        where, params = 'd.id IN (SELECT dataset_id FROM dataset_concepts WHERE concept_id = ?)', [concept_id]
+    else:
+        where, params = f"d.id IN ({','.join('?' * len(ids))})", list(ids)
+    cur.execute(f'''
+        SELECT d.id, d.title, d.province, e.service_type, e.url, ed.url,
+               (SELECT CASE WHEN COUNT(*) = 1 THEN MAX(type_name) END
+                FROM wfs_feature_types ft WHERE ft.endpoint_id = e.id),
+               (SELECT COUNT(*) FROM wfs_feature_types ft WHERE ft.endpoint_id = e.id)
+        FROM datasets d
+        JOIN endpoint_datasets ed ON ed.dataset_id = d.id
+        JOIN service_endpoints e ON e.id = ed.endpoint_id
+        WHERE {where} AND e.service_type IN ('OGC-API', 'WFS')
+        ORDER BY d.gem_score DESC, d.id, e.service_type = 'WFS'
+    ''', params)
+
+    # Every link of a dataset, best first; the first that names a layer wins
+    links = {}
+    for ds_id, title, province, service_type, url, link_url, only_layer, layer_count in cur.fetchall():
+        layer = url_layer(service_type, link_url) or only_layer
+        links.setdefault(ds_id, []).append((title, province, service_type, url, layer, layer_count))
+
+    sources = []
+    fetched = {}
+    for ds_id, candidates in links.items():
+        title, province, service_type, url, layer, layer_count = next(
+            (c for c in candidates if c[4]), candidates[0])
+        source = make_source(service_type, url, layer, limit, dataset_id=ds_id, title=title, province=province)
+        if not layer:
+            source['status'] = 'error'
+            source['error'] = ('No known layer; run fetch_schemas / inspect_schemas first' if not layer_count
+                               else f'Service URL names no layer and the endpoint has {layer_count}')
+        elif (url, layer) in fetched:
+            source['status'] = 'duplicate'
+            source['error'] = f'Same layer as dataset {fetched[url, layer]}'
+        else:
+            fetched[url, layer] = ds_id
+        sources.append(source)
+    return sources[:MAX_SOURCES]
+
+def url_layer(service_type, url):
+    """Layer a service URL names: WFS TYPENAME(S), or an OGC API /collections/{id}."""
+    parts = urlsplit(url or '')
+    if service_type == 'OGC-API':
+        match = re.search(r'/collections/([^/]+)', parts.path)
+        return unquote(match.group(1)) if match else None
+    for key, value in parse_qsl(parts.query):
+        if key.lower() in ('typename', 'typenames') and value.strip():
+            return value.split(',')[0].strip()
+    return None
+
+def make_source(service_type, url, layer, limit=MAX_FEATURES, **extra):
+    """A layer to fetch with fetch_source, plus any extra keys the caller tracks."""
+    return {
+        'type': service_type, 'url': url, 'layer': layer, 'limit': limit, 'page_size': min(PAGE_SIZE, limit),
+        'status': 'pending', 'features': 0, 'pages': 0, 'error': None, 'seconds': None, **extra
+    }
+
+def field_renames(cur):
+    """{province: {lowercase field name: canonical id}}; None holds names used everywhere."""
+    try:
+        cur.execute('SELECT canonical_id, source, field_name FROM field_synonyms')
+    except sqlite3.OperationalError:
+        return {}  # field_mappings.py has not been run
+    renames = {}
+    for canonical, source, name in cur.fetchall():
+        province = None if source.startswith('_') else source
+        renames.setdefault(province, {})[name.lower()] = canonical
+    return renames
+
+def harmonize(feature, renames, source):
+    """Rename properties to canonical names and tag the feature with its origin.
+
+    When two properties map to the same canonical name, the first keeps
+    it and the other keeps its own name.
+    """
+    props = {}
+    for name, value in (feature.get('properties') or {}).items():
+        key = renames.get(name.lower(), name)
+        props[key if key not in props else name] = value
+    props['bundesland'] = source['province'] or 'National'
+    props['dataset_id'] = source['dataset_id']
+    return {'type': 'Feature', 'id': feature.get('id'), 'geometry': feature.get('geometry'), 'properties': props}
+
+def page_url(source, offset):
+    """First page of an OGC API collection, or any page of a WFS layer."""
+    if source['type'] == 'OGC-API':
+        return f"{source['url']}/collections/{source['layer']}/items?limit={source['page_size']}&f=json"
+    sep = '&' if '?' in source['url'] else '?'
+    return source['url'] + sep + urlencode({
+        'SERVICE': 'WFS', 'REQUEST': 'GetFeature', 'VERSION': '2.0.0', 'TYPENAMES': source['layer'],
+        'OUTPUTFORMAT': 'application/json', 'SRSNAME': CRS84, 'COUNT': source['page_size'],
+        'STARTINDEX': offset
+    })
+
+def next_page_url(source, page, offset):
+    """URL of the page after offset features, or None after the last one.
+
+    OGC API servers link the next page; WFS pages continue until one comes
+    back short or numberMatched is reached.
+    """
+    if source['type'] == 'OGC-API':
+        for link in page.get('links') or []:
+            if link.get('rel') == 'next' and link.get('href'):
+                return link['href']
+        return None
+    matched = page.get('numberMatched')
+    if len(page.get('features') or []) < source['page_size'] or (isinstance(matched, int) and offset >= matched):
+        return None
+    return page_url(source, offset)
+
+def fetch_source(client, source, emit, stop):
+    """Fetch one source page by page, passing each page's features to emit.
+
+    Updates the source's status, features, pages, error and seconds.
+    """
+    start = time.time()
+    offset = 0
+    url = page_url(source, 0)
+    source['status'] = 'running'
+    try:
+        while url:
+            if stop.is_set():
+                source['status'] = 'cancelled'
+                return
+            resp = client.stream(url, lambda chunk: False, {'Accept': 'application/geo+json,application/json'},
+                                 MAX_PAGE_BYTES)
+            if resp.status != 200:
+                raise ValueError(f'HTTP {resp.status}')
+            if not resp.complete:
+                raise ValueError(f'Page larger than {MAX_PAGE_BYTES // (1024 * 1024)} MB')
+            try:
+                page = json.loads(resp.body)
+            except ValueError:
+                raise ValueError('Response is not GeoJSON') from None
+            if not isinstance(page, dict) or not isinstance(page.get('features') or [], list):
+                raise ValueError('Response is not a GeoJSON FeatureCollection')
+
+            features = page.get('features') or []
+            offset += len(features)
+            url = next_page_url(source, page, offset) if features else None
+            room = source['limit'] - source['features']
+            if len(features) > room or (url and len(features) == room):
+                features = features[:room]
+                source['status'] = 'truncated'
+                url = None
+            emit(source, features)
+            source['features'] += len(features)
+            source['pages'] += 1
+        if source['status'] == 'running':
+            source['status'] = 'ok'
+    except (HttpError, ValueError) as e:
+        source['status'] = 'partial' if source['features'] else 'error'
+        source['error'] = str(e)[:200]
+    finally:
+        source['seconds'] = round(time.time() - start, 1)
+
+def merged_pages(sources, renames, stop):
+    """Yield lists of harmonized features from all sources as pages arrive.
+
+    Sources are fetched on a thread pool. A bounded queue holds the pages
+    not yet written, so a slow reader pauses the fetchers instead of
+    buffering whole layers. Once stop is set, or the generator is closed,
+    fetchers give up after their current page.
+    """
+    client = get_client()
+    pages = queue.Queue(QUEUE_PAGES)
+    done = object()
+
+    def emit(source, features):
+        while not stop.is_set():
+            try:
+                pages.put((source, features), timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def run(source):
+        try:
+            fetch_source(client, source, emit, stop)
+        finally:
+            emit(source, done)
+
+    runnable = [s for s in sources if s['status'] == 'pending']
+
+    executor = ThreadPoolExecutor(max_workers=SOURCE_WORKERS)
+    for source in runnable:
+        executor.submit(run, source)
+    remaining = len(runnable)
+    try:
+        while remaining:
+            source, features = pages.get()
+            if features is done:
+                remaining -= 1
+                continue
+            source_renames = {**renames.get(None, {}), **renames.get(source['province'], {})}
+            yield [harmonize(f, source_renames, source) for f in features]
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+        client.health.save()
+
+def summary(sources, started):
+    """Final record: overall outcome and what each source delivered."""
+    return {
+        'complete': all(s['status'] in ('ok', 'duplicate') for s in sources),
+        'features': sum(s['features'] for s in sources),
+        'failed': sum(s['status'] in ('error', 'partial') for s in sources),
+        'truncated': sum(s['status'] == 'truncated' for s in sources),
+        'seconds': round(time.time() - started, 1),
+        'sources': [{k: s[k] for k in SUMMARY_KEYS} for s in sources]
+    }
@@ -1,23 +1,35 @@
 #!/usr/bin/env python3
 """Fetch and analyze WFS schemas to build field mappings."""
 
+import asyncio
+import queue
 import sqlite3
 import json
 import re
+import threading
 import xml.etree.ElementTree as ET
-import urllib.request
-import ssl
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from datetime import datetime, timezone
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse
+
+from change_log import content_hash
+from endpoints import ensure_column, init_layer_size_table, save_layer_sizes
+from http_cache import HttpCache, cached_get, print_cache_report
+from host_health import HostHealth, print_health_report
+from http_client import CHUNK_SIZE, HttpClient, HttpError, print_host_report
 
 DB_PATH = 'inspire_austria.db'
 TIMEOUT = 30
-MAX_WORKERS = 5
-
-# SSL context
-ssl_context = ssl.create_default_context()
-ssl_context.check_hostname = False
-ssl_context.verify_mode = ssl.CERT_NONE
+MAX_CAPABILITIES_BYTES = 8 * 1024 * 1024  # stop reading capabilities past this
+MAX_SAMPLE_BYTES = 1024 * 1024  # and GetFeature samples past this
+MAX_SCHEMA_BYTES = 4 * 1024 * 1024  # DescribeFeatureType schemas larger than this are ignored
+MAX_HITS_BYTES = 64 * 1024  # resultType=hits responses are a single empty element
+MAX_CONCURRENCY = 16  # requests in flight overall
+MAX_PER_HOST = 2  # requests in flight per host
+WRITE_BATCH = 20  # endpoints per results commit
+FLUSH_SECONDS = 5  # commit a partial batch after this long without results
+USER_AGENT = 'INSPIRE-Schema-Fetcher/1.0'
 
 # Namespace mappings
 NAMESPACES = {
@@ -45,20 +57,87 @@ def init_schema_tables():
     conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
     
-    # Feature types table
+    # Feature types from before schemas were keyed by endpoint
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'wfs_feature_types'")
+    if cur.fetchone():
+        cur.execute('PRAGMA table_info(wfs_feature_types)')
+        if 'fingerprint' not in {row[1] for row in cur.fetchall()}:
+            migrate_feature_types(cur)
+    
+    create_feature_type_tables(cur)
+    init_layer_size_table(cur)
+    
+    # Field mappings table (cross-provincial equivalents)
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS field_mappings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            concept_id TEXT,
+            canonical_name TEXT,
+            canonical_type TEXT,
+            description_de TEXT,
+            description_en TEXT
+        )
+    ''')
+    
+    # Field mapping instances
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS field_mapping_instances (
+            mapping_id INTEGER,
+            field_id INTEGER,
+            province TEXT,
+            local_name TEXT,
+            transformation TEXT,
+            FOREIGN KEY (mapping_id) REFERENCES field_mappings(id),
+            FOREIGN KEY (field_id) REFERENCES wfs_fields(id)
+        )
+    ''')
+    
+    # Crawl checkpoints: one row per run, and each endpoint's last outcome
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS schema_crawl_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            started_at TEXT,
+            finished_at TEXT
+        )
+    ''')
+    
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS schema_crawl_state (
+            endpoint_id INTEGER PRIMARY KEY,
+            status TEXT,
+            error TEXT,
+            feature_types INTEGER,
+            crawled_at TEXT
+        )
+    ''')
+    
+    conn.commit()
+    conn.close()
+
+def create_feature_type_tables(cur):
+    """Current schema per (endpoint, feature type), plus its history.
+    
+    wfs_feature_types and wfs_fields hold the latest schema of each feature
+    type and are only rewritten when its fingerprint changes. Distinct
+    field lists are stored once in wfs_schemas (many endpoints serve the
+    same INSPIRE schema); wfs_schema_versions records when each feature
+    type took on which fingerprint.
+    """
     cur.execute('''
         CREATE TABLE IF NOT EXISTS wfs_feature_types (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            service_id INTEGER,
-            dataset_id TEXT,
+            endpoint_id INTEGER,
             type_name TEXT,
             type_namespace TEXT,
             title TEXT,
             is_inspire BOOLEAN,
             inspire_theme TEXT,
-            fetched_at TEXT,
-            FOREIGN KEY (service_id) REFERENCES dataset_services(id),
-            FOREIGN KEY (dataset_id) REFERENCES datasets(id)
+            schema_source TEXT,
+            fingerprint TEXT,
+            first_seen TEXT,
+            changed_at TEXT,
+            UNIQUE (endpoint_id, type_name),
+            FOREIGN KEY (endpoint_id) REFERENCES service_endpoints(id)
         )
     ''')
     
@@ -76,202 +155,493 @@ def init_schema_tables():
         )
     ''')
     
-    # Field mappings table (cross-provincial equivalents)
     cur.execute('''
-        CREATE TABLE IF NOT EXISTS field_mappings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            concept_id TEXT,
-            canonical_name TEXT,
-            canonical_type TEXT,
-            description_de TEXT,
-            description_en TEXT
+        CREATE TABLE IF NOT EXISTS wfs_schemas (
+            fingerprint TEXT PRIMARY KEY,
+            fields TEXT
         )
     ''')
     
-    # Field mapping instances
     cur.execute('''
-        CREATE TABLE IF NOT EXISTS field_mapping_instances (
-            mapping_id INTEGER,
-            field_id INTEGER,
-            province TEXT,
-            local_name TEXT,
-            transformation TEXT,
-            FOREIGN KEY (mapping_id) REFERENCES field_mappings(id),
-            FOREIGN KEY (field_id) REFERENCES wfs_fields(id)
+        CREATE TABLE IF NOT EXISTS wfs_schema_versions (
+            feature_type_id INTEGER,
+            fingerprint TEXT,
+            schema_source TEXT,
+            recorded_at TEXT,
+            FOREIGN KEY (feature_type_id) REFERENCES wfs_feature_types(id),
+            FOREIGN KEY (fingerprint) REFERENCES wfs_schemas(fingerprint)
         )
     ''')
     
-    cur.execute('CREATE INDEX IF NOT EXISTS idx_ft_dataset ON wfs_feature_types(dataset_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_ft_endpoint ON wfs_feature_types(endpoint_id)')
     cur.execute('CREATE INDEX IF NOT EXISTS idx_fields_ft ON wfs_fields(feature_type_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_schema_versions_ft ON wfs_schema_versions(feature_type_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_schema_versions_time ON wfs_schema_versions(recorded_at)')
+
+def migrate_feature_types(cur):
+    """Collapse per-dataset, per-crawl feature type rows into one per endpoint and type.
     
-    conn.commit()
-    conn.close()
+    The most recent row of each (endpoint, type) is kept with its fields.
+    Rows from crawls before endpoints existed have no endpoint and are
+    dropped; the next crawl fills them in.
+    """
+    ensure_column(cur, 'wfs_feature_types', 'endpoint_id', 'INTEGER')
+    ensure_column(cur, 'wfs_feature_types', 'schema_source', 'TEXT')
+    cur.execute('ALTER TABLE wfs_feature_types RENAME TO wfs_feature_types_legacy')
+    cur.execute('ALTER TABLE wfs_fields RENAME TO wfs_fields_legacy')
+    cur.execute('DROP INDEX IF EXISTS idx_ft_dataset')
+    cur.execute('DROP INDEX IF EXISTS idx_fields_ft')
+    create_feature_type_tables(cur)
+    
+    cur.execute('''
+        INSERT INTO wfs_feature_types
+            (id, endpoint_id, type_name, type_namespace, title, is_inspire, inspire_theme,
+             schema_source, first_seen, changed_at)
+        SELECT id, endpoint_id, type_name, type_namespace, title, is_inspire, inspire_theme,
+               schema_source, fetched_at, fetched_at
+        FROM wfs_feature_types_legacy
+        WHERE id IN (
+            SELECT MAX(id) FROM wfs_feature_types_legacy
+            WHERE endpoint_id IS NOT NULL
+            GROUP BY endpoint_id, type_name
+        )
+    ''')
+    cur.execute('''
+        INSERT INTO wfs_fields (id, feature_type_id, field_name, field_type, is_geometry, is_nullable, description)
+        SELECT id, feature_type_id, field_name, field_type, is_geometry, is_nullable, description
+        FROM wfs_fields_legacy
+        WHERE feature_type_id IN (SELECT id FROM wfs_feature_types)
+    ''')
+    
+    cur.execute('SELECT id, schema_source, changed_at FROM wfs_feature_types')
+    for ft_id, source, changed_at in cur.fetchall():
+        cur.execute('''
+            SELECT field_name AS name, field_type AS type, is_geometry, is_nullable
+            FROM wfs_fields WHERE feature_type_id = ? ORDER BY id
+        ''', (ft_id,))
+        fields = [dict(zip(('name', 'type', 'is_geometry', 'is_nullable'), row)) for row in cur.fetchall()]
+        fingerprint = store_schema(cur, fields)
+        cur.execute('UPDATE wfs_feature_types SET fingerprint = ? WHERE id = ?', (fingerprint, ft_id))
+        cur.execute('INSERT INTO wfs_schema_versions VALUES (?, ?, ?, ?)', (ft_id, fingerprint, source, changed_at))
+    
+    cur.execute('DROP TABLE wfs_fields_legacy')
+    cur.execute('DROP TABLE wfs_feature_types_legacy')
 
-def fetch_capabilities(url):
-    """Fetch WFS GetCapabilities."""
-    try:
-        # Ensure we're requesting capabilities
-        if 'GetCapabilities' not in url:
-            if '?' in url:
-                url += '&REQUEST=GetCapabilities&SERVICE=WFS&VERSION=2.0.0'
-            else:
-                url += '?REQUEST=GetCapabilities&SERVICE=WFS&VERSION=2.0.0'
-        
-        req = urllib.request.Request(url, headers={'User-Agent': 'INSPIRE-Schema-Fetcher/1.0'})
-        response = urllib.request.urlopen(req, timeout=TIMEOUT, context=ssl_context)
-        return response.read().decode('utf-8', errors='ignore')
-    except Exception as e:
-        return None
+def schema_key(fields):
+    """Sorted, normalized field list that identifies a schema."""
+    return sorted([f['name'], f['type'], bool(f['is_geometry']), bool(f.get('is_nullable', True))]
+                  for f in fields)
 
-def fetch_feature_sample(base_url, type_name):
-    """Fetch a sample feature to analyze actual data structure."""
-    try:
-        # Build GetFeature request
-        if '?' in base_url:
-            base = base_url.split('?')[0]
+def schema_fingerprint(fields):
+    """Return (fingerprint, canonical JSON) of a field list."""
+    key = json.dumps(schema_key(fields), separators=(',', ':'), ensure_ascii=False)
+    return content_hash(key.encode('utf-8')), key
+
+def store_schema(cur, fields):
+    """Store a field list once under its fingerprint and return the fingerprint."""
+    fingerprint, key = schema_fingerprint(fields)
+    cur.execute('INSERT OR IGNORE INTO wfs_schemas VALUES (?, ?)', (fingerprint, key))
+    return fingerprint
+
+def capabilities_url(url):
+    """Ensure we're requesting capabilities."""
+    if 'GetCapabilities' not in url:
+        if '?' in url:
+            url += '&REQUEST=GetCapabilities&SERVICE=WFS&VERSION=2.0.0'
         else:
-            base = base_url
-        
-        url = f"{base}?SERVICE=WFS&REQUEST=GetFeature&VERSION=2.0.0&TYPENAMES={type_name}&COUNT=1"
-        
-        req = urllib.request.Request(url, headers={'User-Agent': 'INSPIRE-Schema-Fetcher/1.0'})
-        response = urllib.request.urlopen(req, timeout=TIMEOUT, context=ssl_context)
-        return response.read().decode('utf-8', errors='ignore')
-    except Exception as e:
-        return None
+            url += '?REQUEST=GetCapabilities&SERVICE=WFS&VERSION=2.0.0'
+    return url
 
-def parse_capabilities(xml_content):
-    """Parse WFS capabilities to extract feature types."""
-    if not xml_content:
-        return []
+def feature_sample_url(base_url, type_name):
+    """Build a GetFeature request for a single feature."""
+    base = base_url.split('?')[0]
+    return f"{base}?SERVICE=WFS&REQUEST=GetFeature&VERSION=2.0.0&TYPENAMES={type_name}&COUNT=1"
+
+def feature_hits_url(base_url, type_name):
+    """Build a GetFeature request for the feature count only."""
+    base = base_url.split('?')[0]
+    return f"{base}?SERVICE=WFS&REQUEST=GetFeature&VERSION=2.0.0&TYPENAMES={type_name}&RESULTTYPE=hits"
+
+def describe_feature_type_url(base_url, type_names):
+    """Build one DescribeFeatureType request covering several feature types."""
+    base = base_url.split('?')[0]
+    return f"{base}?SERVICE=WFS&REQUEST=DescribeFeatureType&VERSION=2.0.0&TYPENAMES={','.join(type_names)}"
+
+class Crawler:
+    """Runs blocking fetches from the event loop under concurrency caps.
     
-    try:
-        root = ET.fromstring(xml_content)
-    except ET.ParseError:
-        return []
+    A global cap bounds total requests in flight and a per-host cap keeps
+    one slow server from occupying every slot. Requests go through one
+    HttpClient, so connections to the same host are reused, and through
+    the HTTP cache when one is given.
+    """
     
-    feature_types = []
+    def __init__(self, client, max_concurrency=MAX_CONCURRENCY, per_host=MAX_PER_HOST, cache=None):
+        self.client = client
+        self.cache = cache
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.per_host = per_host
+        self.host_slots = {}
     
-    # Try WFS 2.0 structure
-    for ft in root.findall('.//{http://www.opengis.net/wfs/2.0}FeatureType'):
-        name_el = ft.find('{http://www.opengis.net/wfs/2.0}Name')
-        title_el = ft.find('{http://www.opengis.net/wfs/2.0}Title')
+    async def _run(self, url, func, *args):
+        host = urlparse(url).hostname or ''
+        if host not in self.host_slots:
+            self.host_slots[host] = asyncio.Semaphore(self.per_host)
         
-        if name_el is None:
-            # Try without namespace
-            name_el = ft.find('Name')
-            title_el = ft.find('Title')
+        # Wait for the host first so a busy host never holds a global slot
+        async with self.host_slots[host]:
+            async with self.slots:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self.executor, func, *args)
+    
+    async def fetch_parsed(self, url, kind, make_parser, max_bytes):
+        """Stream url into a new parser and return its result.
         
-        if name_el is not None:
-            name = name_el.text
-            # Extract namespace prefix if present
-            if ':' in name:
-                ns_prefix, local_name = name.split(':', 1)
-            else:
-                ns_prefix, local_name = '', name
-            
-            feature_types.append({
-                'name': name,
-                'namespace_prefix': ns_prefix,
-                'local_name': local_name,
-                'title': title_el.text if title_el is not None else local_name
-            })
+        Returns None if the fetch failed. With a cache, the request is
+        conditional; on 304 the result stored for the cached content is
+        reused without parsing.
+        """
+        return await self._run(url, self._fetch_parsed, url, kind, make_parser, max_bytes)
     
-    # Try WFS 1.1 structure
-    if not feature_types:
-        for ft in root.findall('.//{http://www.opengis.net/wfs}FeatureType'):
-            name_el = ft.find('{http://www.opengis.net/wfs}Name')
-            title_el = ft.find('{http://www.opengis.net/wfs}Title')
-            
-            if name_el is not None:
-                name = name_el.text
-                if ':' in name:
-                    ns_prefix, local_name = name.split(':', 1)
-                else:
-                    ns_prefix, local_name = '', name
-                
-                feature_types.append({
-                    'name': name,
-                    'namespace_prefix': ns_prefix,
-                    'local_name': local_name,
-                    'title': title_el.text if title_el is not None else local_name
-                })
+    def _fetch_parsed(self, url, kind, make_parser, max_bytes):
+        parser = make_parser()
+        if self.cache is None:
+            try:
+                resp = self.client.stream(url, parser.feed, max_bytes=max_bytes)
+            except HttpError:
+                return None
+            return parser.result() if resp.status < 400 else None
+        
+        res = cached_get(self.client, self.cache, url, feed=parser.feed, max_bytes=max_bytes)
+        if res is None:
+            return None
+        if not res.not_modified:
+            value = parser.result()
+            self.cache.put_derived(res.hash, kind, value)
+            return value
+        
+        value = self.cache.get_derived(res.hash, kind)
+        if value is None:
+            value = feed_in_chunks(parser, res.body())
+            self.cache.put_derived(res.hash, kind, value)
+        return value
     
-    return feature_types
+    def close(self):
+        self.executor.shutdown()
+        self.client.close()
 
-def extract_fields_from_sample(xml_content, type_name):
-    """Extract field names and types from a sample feature."""
-    if not xml_content:
-        return []
+def local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+def feature_type_entry(ft):
+    """Feature type dict from a capabilities FeatureType element."""
+    children = {local_name(child.tag): child for child in ft}
+    name_el = children.get('Name')
+    title_el = children.get('Title')
+    if name_el is None or not name_el.text:
+        return None
     
-    try:
-        root = ET.fromstring(xml_content)
-    except ET.ParseError:
-        return []
+    name = name_el.text.strip()
+    # Extract namespace prefix if present
+    if ':' in name:
+        ns_prefix, local = name.split(':', 1)
+    else:
+        ns_prefix, local = '', name
+    
+    return {
+        'name': name,
+        'namespace_prefix': ns_prefix,
+        'local_name': local,
+        'title': title_el.text if title_el is not None and title_el.text else local
+    }
+
+class CapabilitiesParser:
+    """Incremental WFS capabilities parser (WFS 1.x and 2.0).
+    
+    feed() takes chunks of the document as they arrive and returns True
+    once the FeatureTypeList has been read, so the rest (often most of
+    the document) need not be downloaded. Finished top-level sections are
+    cleared to keep memory flat.
+    """
+    
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=('start', 'end'))
+        self._depth = 0
+        self.feature_types = []
+        self.done = False
     
+    def feed(self, chunk):
+        if self.done:
+            return True
+        try:
+            self._parser.feed(chunk)
+            for event, elem in self._parser.read_events():
+                if event == 'start':
+                    self._depth += 1
+                    continue
+                self._depth -= 1
+                tag = local_name(elem.tag)
+                if tag == 'FeatureType':
+                    entry = feature_type_entry(elem)
+                    if entry:
+                        self.feature_types.append(entry)
+                    elem.clear()
+                elif tag == 'FeatureTypeList':
+                    self.done = True
+                    break
+                elif self._depth == 1:
+                    elem.clear()
+        except ET.ParseError:
+            self.done = True
+        return self.done
+    
+    def result(self):
+        return self.feature_types
+
+def sample_fields(feature):
+    """Field names and inferred types from one GML feature element."""
     fields = []
     seen = set()
     
-    # Find the first feature element
-    # Could be in various namespaces
-    for elem in root.iter():
-        # Skip container elements
-        if 'FeatureCollection' in elem.tag or 'member' in elem.tag:
+    for child in feature:
+        # Extract local name from tag
+        if '}' in child.tag:
+            ns, local = child.tag.rsplit('}', 1)
+            ns = ns[1:]  # Remove leading {
+        else:
+            ns, local = '', child.tag
+        
+        if local in seen:
             continue
+        seen.add(local)
         
-        # Check if this looks like a feature
-        if elem.attrib.get('{http://www.opengis.net/gml/3.2}id'):
-            # This is likely our feature - examine its children
-            for child in elem:
-                # Extract local name from tag
-                if '}' in child.tag:
-                    ns, local = child.tag.rsplit('}', 1)
-                    ns = ns[1:]  # Remove leading {
-                else:
-                    ns, local = '', child.tag
-                
-                if local in seen:
-                    continue
-                seen.add(local)
-                
-                # Determine if geometry
-                is_geom = any(g in local.lower() for g in ['geometry', 'geom', 'shape', 'position'])
-                is_geom = is_geom or any(g in str(child.tag) for g in ['Point', 'Polygon', 'Surface', 'Curve', 'MultiSurface'])
-                
-                # Try to infer type from content
-                field_type = 'string'
-                if child.text:
-                    text = child.text.strip()
-                    if re.match(r'^-?\d+$', text):
-                        field_type = 'integer'
-                    elif re.match(r'^-?\d+\.\d+$', text):
-                        field_type = 'decimal'
-                    elif re.match(r'^\d{4}-\d{2}-\d{2}', text):
-                        field_type = 'dateTime'
-                    elif text.lower() in ('true', 'false'):
-                        field_type = 'boolean'
-                elif is_geom:
-                    field_type = 'geometry'
-                elif len(list(child)) > 0:
-                    field_type = 'complex'
-                
-                # Check for xlink:href (code list reference)
-                href = child.attrib.get('{http://www.w3.org/1999/xlink}href')
-                if href:
-                    field_type = 'codelist'
-                
-                fields.append({
-                    'name': local,
-                    'namespace': ns,
-                    'type': field_type,
-                    'is_geometry': is_geom,
-                    'sample_value': child.text[:100] if child.text else (href[:100] if href else None)
-                })
-            
-            break  # Only process first feature
+        # Determine if geometry
+        is_geom = any(g in local.lower() for g in ['geometry', 'geom', 'shape', 'position'])
+        is_geom = is_geom or any(g in str(child.tag) for g in ['Point', 'Polygon', 'Surface', 'Curve', 'MultiSurface'])
+        
+        # Try to infer type from content
+        field_type = 'string'
+        if child.text:
+            text = child.text.strip()
+            if re.match(r'^-?\d+$', text):
+                field_type = 'integer'
+            elif re.match(r'^-?\d+\.\d+$', text):
+                field_type = 'decimal'
+            elif re.match(r'^\d{4}-\d{2}-\d{2}', text):
+                field_type = 'dateTime'
+            elif text.lower() in ('true', 'false'):
+                field_type = 'boolean'
+        elif is_geom:
+            field_type = 'geometry'
+        elif len(list(child)) > 0:
+            field_type = 'complex'
+        
+        # Check for xlink:href (code list reference)
+        href = child.attrib.get('{http://www.w3.org/1999/xlink}href')
+        if href:
+            field_type = 'codelist'
+        
+        fields.append({
+            'name': local,
+            'namespace': ns,
+            'type': field_type,
+            'is_geometry': is_geom,
+            'sample_value': child.text[:100] if child.text else (href[:100] if href else None)
+        })
     
     return fields
 
+class SampleParser:
+    """Incremental GetFeature parser that stops after the first feature.
+    
+    Servers that ignore COUNT=1 may send thousands of features; feed()
+    returns True as soon as the first one is complete.
+    """
+    
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=('start', 'end'))
+        self._feature = None
+        self.fields = []
+        self.done = False
+    
+    def feed(self, chunk):
+        if self.done:
+            return True
+        try:
+            self._parser.feed(chunk)
+            for event, elem in self._parser.read_events():
+                if event == 'start':
+                    # Skip container elements; the feature carries a gml:id
+                    if (self._feature is None and elem.get('{http://www.opengis.net/gml/3.2}id')
+                            and 'FeatureCollection' not in elem.tag and 'member' not in elem.tag):
+                        self._feature = elem
+                elif elem is self._feature:
+                    self.fields = sample_fields(elem)
+                    self.done = True
+                    break
+        except ET.ParseError:
+            self.done = True
+        return self.done
+    
+    def result(self):
+        return self.fields
+
+def feed_in_chunks(parser, content, chunk_size=CHUNK_SIZE):
+    """Feed a complete document to a streaming parser, stopping when it is done."""
+    for start in range(0, len(content or ''), chunk_size):
+        if parser.feed(content[start:start + chunk_size]):
+            break
+    return parser.result()
+
+XSD = '{http://www.w3.org/2001/XMLSchema}'
+
+# XML Schema built-in types, mapped to the types inferred from samples
+XSD_TYPES = {
+    'string': 'string', 'normalizedString': 'string', 'token': 'string', 'anyURI': 'string',
+    'int': 'integer', 'integer': 'integer', 'long': 'integer', 'short': 'integer', 'byte': 'integer',
+    'nonNegativeInteger': 'integer', 'positiveInteger': 'integer', 'unsignedInt': 'integer',
+    'unsignedLong': 'integer', 'unsignedShort': 'integer',
+    'decimal': 'decimal', 'double': 'decimal', 'float': 'decimal',
+    'date': 'dateTime', 'dateTime': 'dateTime', 'time': 'dateTime',
+    'boolean': 'boolean',
+}
+
+GEOMETRY_WORDS = ('Point', 'Curve', 'Surface', 'Polygon', 'LineString', 'Geometry', 'Solid')
+
+def schema_property_elements(node):
+    """Property declarations of a complexType, through extensions and groups."""
+    for child in node:
+        tag = local_name(child.tag)
+        if tag == 'element':
+            yield child
+        elif tag in ('complexContent', 'extension', 'restriction', 'sequence', 'choice', 'all'):
+            yield from schema_property_elements(child)
+
+def schema_fields(root):
+    """Fields per feature element name from a DescribeFeatureType XSD."""
+    target_ns = root.get('targetNamespace', '')
+    complex_types = {ct.get('name'): ct for ct in root.findall(XSD + 'complexType')}
+    simple_types = {st.get('name'): st for st in root.findall(XSD + 'simpleType')}
+    
+    def field_type(prop):
+        type_ref = prop.get('type')
+        if not type_ref:
+            restriction = prop.find(f'{XSD}simpleType/{XSD}restriction')
+            if restriction is not None:
+                return XSD_TYPES.get(restriction.get('base', '').split(':')[-1], 'string')
+            return 'complex' if prop.find(XSD + 'complexType') is not None else 'string'
+        
+        name = type_ref.split(':')[-1]
+        if name in simple_types:
+            restriction = simple_types[name].find(XSD + 'restriction')
+            base = restriction.get('base', '') if restriction is not None else ''
+            return XSD_TYPES.get(base.split(':')[-1], 'string')
+        if name in XSD_TYPES and name not in complex_types:
+            return XSD_TYPES[name]
+        if name.endswith('PropertyType') and any(w in name for w in GEOMETRY_WORDS):
+            return 'geometry'
+        if name in ('CodeType', 'ReferenceType'):
+            return 'codelist'
+        return 'complex'
+    
+    result = {}
+    for element in root.findall(XSD + 'element'):
+        name = element.get('name')
+        type_ref = element.get('type')
+        ct = complex_types.get(type_ref.split(':')[-1]) if type_ref else element.find(XSD + 'complexType')
+        if not name or ct is None:
+            continue
+        
+        fields = []
+        for prop in schema_property_elements(ct):
+            prop_name = prop.get('name') or prop.get('ref', '').split(':')[-1]
+            if not prop_name:
+                continue
+            ftype = field_type(prop)
+            fields.append({
+                'name': prop_name,
+                'namespace': target_ns,
+                'type': ftype,
+                'is_geometry': ftype == 'geometry',
+                'is_nullable': prop.get('minOccurs') == '0' or prop.get('nillable') == 'true',
+                'sample_value': None
+            })
+        if fields:
+            result[name] = fields
+    
+    return result
+
+class HitsParser:
+    """Reads the feature count from a resultType=hits response.
+    
+    WFS 2.0 reports numberMatched, 1.x numberOfFeatures, on the root
+    element; feed() returns True as soon as it has been seen. Servers that
+    cannot count say "unknown", which yields None.
+    """
+    
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=('start',))
+        self.count = None
+        self.done = False
+    
+    def feed(self, chunk):
+        if self.done:
+            return True
+        try:
+            self._parser.feed(chunk)
+            for _, elem in self._parser.read_events():
+                value = elem.get('numberMatched') or elem.get('numberOfFeatures') or ''
+                self.count = int(value) if value.isdigit() else None
+                self.done = True
+                break
+        except ET.ParseError:
+            self.done = True
+        return self.done
+    
+    def result(self):
+        return self.count
+
+class SchemaParser:
+    """Collects a DescribeFeatureType response; result() parses the XSD.
+    
+    Schemas must be read whole, so feed() only stops on malformed XML.
+    A schema cut off by the byte cap yields nothing and the caller falls
+    back to sampling.
+    """
+    
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=('start',))
+        self._root = None
+        self.failed = False
+    
+    def feed(self, chunk):
+        try:
+            self._parser.feed(chunk)
+            for _, elem in self._parser.read_events():
+                if self._root is None:
+                    self._root = elem
+        except ET.ParseError:
+            self.failed = True
+        return self.failed
+    
+    def result(self):
+        if self.failed or self._root is None or local_name(self._root.tag) != 'schema':
+            return {}
+        try:
+            self._parser.close()
+        except ET.ParseError:
+            return {}
+        return schema_fields(self._root)
+
+def parse_capabilities(xml_content):
+    """Parse WFS capabilities to extract feature types."""
+    return feed_in_chunks(CapabilitiesParser(), xml_content)
+
+def extract_fields_from_sample(xml_content, type_name):
+    """Extract field names and types from a sample feature."""
+    return feed_in_chunks(SampleParser(), xml_content)
+
 def determine_inspire_theme(namespace, type_name):
     """Determine INSPIRE theme from namespace/type."""
     themes = {
@@ -301,94 +671,259 @@ def determine_inspire_theme(namespace, type_name):
     
     return None
 
-def process_service(service_info):
-    """Process a single WFS service."""
-    service_id, dataset_id, url, province, title = service_info
+async def process_service(crawler, service_info):
+    """Process a single WFS endpoint."""
+    endpoint_id, url, dataset_count = service_info
     
     result = {
-        'service_id': service_id,
-        'dataset_id': dataset_id,
-        'province': province,
-        'title': title,
+        'endpoint_id': endpoint_id,
+        'url': url,
+        'dataset_count': dataset_count,
         'feature_types': [],
         'error': None
     }
     
-    # Fetch capabilities
-    caps_xml = fetch_capabilities(url)
-    if not caps_xml:
+    # Fetch capabilities and parse feature types
+    feature_types = await crawler.fetch_parsed(capabilities_url(url), 'wfs_feature_types',
+                                               CapabilitiesParser, MAX_CAPABILITIES_BYTES)
+    if feature_types is None:
         result['error'] = 'Failed to fetch capabilities'
         return result
     
-    # Parse feature types
-    feature_types = parse_capabilities(caps_xml)
     if not feature_types:
         result['error'] = 'No feature types found'
         return result
     
-    # For each feature type, fetch a sample and extract fields
-    for ft in feature_types[:3]:  # Limit to 3 feature types per service
-        sample_xml = fetch_feature_sample(url, ft['name'])
-        fields = extract_fields_from_sample(sample_xml, ft['name'])
+    feature_types = feature_types[:3]  # Limit to 3 feature types per service
+    
+    # One DescribeFeatureType for all types; sample features only for
+    # types the schema does not describe
+    schemas = await crawler.fetch_parsed(
+        describe_feature_type_url(url, [ft['name'] for ft in feature_types]),
+        'wfs_schema_fields', SchemaParser, MAX_SCHEMA_BYTES
+    ) or {}
+    missing = [ft for ft in feature_types if not schemas.get(ft['local_name'])]
+    samples = await asyncio.gather(*(
+        crawler.fetch_parsed(feature_sample_url(url, ft['name']), 'wfs_sample_fields',
+                             SampleParser, MAX_SAMPLE_BYTES)
+        for ft in missing
+    ))
+    sampled = {ft['name']: fields for ft, fields in zip(missing, samples)}
+    
+    # Feature counts let clients choose a paging strategy before pulling data
+    counts = await asyncio.gather(*(
+        crawler.fetch_parsed(feature_hits_url(url, ft['name']), 'wfs_hits', HitsParser, MAX_HITS_BYTES)
+        for ft in feature_types
+    ))
+    
+    for ft, count in zip(feature_types, counts):
+        ft['feature_count'] = count
+        if ft['name'] in sampled:
+            fields, source = sampled[ft['name']] or [], 'sample'
+        else:
+            fields, source = schemas[ft['local_name']], 'xsd'
         
         is_inspire = ft['namespace_prefix'] in NAMESPACES or 'inspire' in url.lower()
         inspire_theme = determine_inspire_theme(ft['namespace_prefix'], ft['name'])
         
         ft['fields'] = fields
+        ft['schema_source'] = source
         ft['is_inspire'] = is_inspire
         ft['inspire_theme'] = inspire_theme
         result['feature_types'].append(ft)
     
     return result
 
-def save_schema_results(results):
-    """Save schema analysis results to database."""
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
+def upsert_feature_type(cur, endpoint_id, ft, now):
+    """Store a crawled feature type if its schema changed.
+    
+    Returns 'added', 'changed' or 'unchanged'. Unchanged schemas cost a
+    single indexed read and no writes.
+    """
+    fields = ft.get('fields', [])
+    fingerprint, _ = schema_fingerprint(fields)
+    
+    cur.execute('SELECT id, fingerprint FROM wfs_feature_types WHERE endpoint_id = ? AND type_name = ?',
+                (endpoint_id, ft['name']))
+    row = cur.fetchone()
+    if row and row[1] == fingerprint:
+        return 'unchanged'
     
+    store_schema(cur, fields)
+    if row:
+        ft_id = row[0]
+        cur.execute('''
+            UPDATE wfs_feature_types SET
+                type_namespace = ?, title = ?, is_inspire = ?, inspire_theme = ?,
+                schema_source = ?, fingerprint = ?, changed_at = ?
+            WHERE id = ?
+        ''', (ft['namespace_prefix'], ft['title'], ft['is_inspire'], ft['inspire_theme'],
+              ft['schema_source'], fingerprint, now, ft_id))
+        cur.execute('DELETE FROM wfs_fields WHERE feature_type_id = ?', (ft_id,))
+    else:
+        cur.execute('''
+            INSERT INTO wfs_feature_types
+            (endpoint_id, type_name, type_namespace, title, is_inspire, inspire_theme,
+             schema_source, fingerprint, first_seen, changed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (endpoint_id, ft['name'], ft['namespace_prefix'], ft['title'], ft['is_inspire'],
+              ft['inspire_theme'], ft['schema_source'], fingerprint, now, now))
+        ft_id = cur.lastrowid
+    
+    cur.executemany('''
+        INSERT INTO wfs_fields 
+        (feature_type_id, field_name, field_type, is_geometry, is_nullable, description)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(
+        ft_id, field['name'], field['type'], field['is_geometry'],
+        field.get('is_nullable', True), field['sample_value'][:500] if field.get('sample_value') else None
+    ) for field in fields])
+    cur.execute('INSERT INTO wfs_schema_versions VALUES (?, ?, ?, ?)',
+                (ft_id, fingerprint, ft['schema_source'], now))
+    return 'changed' if row else 'added'
+
+def write_schema_results(cur, results):
+    """Write crawl results and record each endpoint's outcome.
+    
+    Feature types are stored once per endpoint; datasets reach them
+    through endpoint_datasets. Returns counts of added, changed and
+    unchanged schemas.
+    """
     now = datetime.now(timezone.utc).isoformat()
+    counts = {'added': 0, 'changed': 0, 'unchanged': 0}
     
     for r in results:
         if r['error']:
             continue
-        
         for ft in r['feature_types']:
-            # Insert feature type
-            cur.execute('''
-                INSERT INTO wfs_feature_types 
-                (service_id, dataset_id, type_name, type_namespace, title, is_inspire, inspire_theme, fetched_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                r['service_id'], r['dataset_id'], ft['name'], ft['namespace_prefix'],
-                ft['title'], ft['is_inspire'], ft['inspire_theme'], now
-            ))
-            ft_id = cur.lastrowid
+            counts[upsert_feature_type(cur, r['endpoint_id'], ft, now)] += 1
+    
+    save_layer_sizes(cur, [
+        (r['endpoint_id'], ft['name'], ft['feature_count'], 'hits', None, None, now)
+        for r in results for ft in r['feature_types'] if ft.get('feature_count') is not None
+    ])
+    
+    cur.executemany('''
+        INSERT INTO schema_crawl_state (endpoint_id, status, error, feature_types, crawled_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(endpoint_id) DO UPDATE SET
+            status = excluded.status,
+            error = excluded.error,
+            feature_types = excluded.feature_types,
+            crawled_at = excluded.crawled_at
+    ''', [(r['endpoint_id'], 'error' if r['error'] else 'done', r['error'], len(r['feature_types']), now)
+          for r in results])
+    return counts
+
+def save_schema_results(results):
+    """Save schema analysis results to database."""
+    conn = sqlite3.connect(DB_PATH)
+    write_schema_results(conn.cursor(), results)
+    conn.commit()
+    conn.close()
+
+class SchemaWriter:
+    """Single writer thread that commits crawl results in small batches.
+    
+    Results are handed over as each endpoint finishes, so they never pile
+    up in memory, and a crawl that is stopped keeps everything up to the
+    last commit. Endpoints are marked done in the same transaction as
+    their rows.
+    """
+    
+    def __init__(self, batch_size=WRITE_BATCH, flush_seconds=FLUSH_SECONDS):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.queue = queue.Queue()
+        self.written = 0
+        self.changes = {'added': 0, 'changed': 0, 'unchanged': 0}
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+    
+    def put(self, result):
+        self.queue.put(result)
+    
+    def _run(self):
+        conn = sqlite3.connect(DB_PATH, timeout=60)
+        cur = conn.cursor()
+        batch = []
+        done = False
+        while not done:
+            try:
+                item = self.queue.get(timeout=self.flush_seconds)
+                if item is None:
+                    done = True
+                else:
+                    batch.append(item)
+                    if len(batch) < self.batch_size:
+                        continue
+            except queue.Empty:
+                pass
             
-            # Insert fields
-            for field in ft.get('fields', []):
-                cur.execute('''
-                    INSERT INTO wfs_fields 
-                    (feature_type_id, field_name, field_type, is_geometry, is_nullable, description)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (
-                    ft_id, field['name'], field['type'], field['is_geometry'],
-                    True, field.get('sample_value', '')[:500] if field.get('sample_value') else None
-                ))
+            if not batch:
+                continue
+            try:
+                counts = write_schema_results(cur, batch)
+                conn.commit()
+                self.written += len(batch)
+                for change, n in counts.items():
+                    self.changes[change] += n
+            except sqlite3.Error as e:
+                # Endpoints stay unmarked and are crawled again on resume
+                conn.rollback()
+                print(f"  Failed to save {len(batch)} results: {e}")
+            batch = []
+        conn.close()
+    
+    def close(self):
+        """Flush remaining results and stop the thread."""
+        self.queue.put(None)
+        self.thread.join()
+
+def start_crawl_run(resume=False, force=False):
+    """Continue the last crawl or start a new one.
+    
+    An unfinished last run is continued unless force is set; resume
+    continues it even if it finished (picking up only new endpoints).
+    Returns (run id, endpoint ids already crawled in that run).
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cur = conn.cursor()
+    cur.execute('SELECT id, started_at, finished_at FROM schema_crawl_runs ORDER BY id DESC LIMIT 1')
+    last = cur.fetchone()
+    
+    if last and not force and (resume or last[2] is None):
+        run_id, started_at, _ = last
+        cur.execute('SELECT endpoint_id FROM schema_crawl_state WHERE crawled_at >= ?', (started_at,))
+        finished = {row[0] for row in cur.fetchall()}
+        cur.execute('UPDATE schema_crawl_runs SET finished_at = NULL WHERE id = ?', (run_id,))
+    else:
+        cur.execute('INSERT INTO schema_crawl_runs (started_at) VALUES (?)',
+                    (datetime.now(timezone.utc).isoformat(),))
+        run_id, finished = cur.lastrowid, set()
     
     conn.commit()
     conn.close()
+    return run_id, finished
+
+def finish_crawl_run(run_id):
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute('UPDATE schema_crawl_runs SET finished_at = ? WHERE id = ?',
+                 (datetime.now(timezone.utc).isoformat(), run_id))
+    conn.commit()
+    conn.close()
 
 def get_wfs_services(limit=None):
-    """Get WFS services to analyze."""
+    """Get unique WFS endpoints to analyze, with how many datasets use each."""
     conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
     
     sql = '''
-        SELECT s.id, d.id, s.url, d.province, d.title
-        FROM dataset_services s
-        JOIN datasets d ON s.dataset_id = d.id
-        WHERE s.service_type = 'WFS'
-        AND s.url IS NOT NULL
+        SELECT e.id, e.url, COUNT(DISTINCT ed.dataset_id)
+        FROM service_endpoints e
+        JOIN endpoint_datasets ed ON ed.endpoint_id = e.id
+        WHERE e.service_type = 'WFS'
+        GROUP BY e.id
     '''
     
     if limit:
@@ -409,7 +944,8 @@ def generate_field_mapping_report():
     cur.execute('''
         SELECT ft.inspire_theme, ft.type_name, d.province, GROUP_CONCAT(DISTINCT f.field_name) as fields
         FROM wfs_feature_types ft
-        JOIN datasets d ON ft.dataset_id = d.id
+        JOIN endpoint_datasets ed ON ed.endpoint_id = ft.endpoint_id
+        JOIN datasets d ON ed.dataset_id = d.id
         LEFT JOIN wfs_fields f ON ft.id = f.feature_type_id
         WHERE ft.inspire_theme IS NOT NULL
         GROUP BY ft.inspire_theme, ft.type_name, d.province
@@ -430,58 +966,144 @@ def generate_field_mapping_report():
     
     return by_theme
 
-def run_schema_analysis(limit=None, verbose=True):
-    """Run the schema analysis."""
-    init_schema_tables()
+def schema_changes(days=7):
+    """Feature types whose schema appeared or changed in the last days."""
+    conn = sqlite3.connect(DB_PATH)
+    cur = conn.cursor()
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+    cur.execute('''
+        SELECT v.recorded_at, e.url, ft.type_name, v.schema_source, v.recorded_at = ft.first_seen
+        FROM wfs_schema_versions v
+        JOIN wfs_feature_types ft ON ft.id = v.feature_type_id
+        JOIN service_endpoints e ON e.id = ft.endpoint_id
+        WHERE v.recorded_at >= ?
+        ORDER BY v.recorded_at DESC
+    ''', (since,))
+    changes = [{
+        'recorded_at': recorded_at,
+        'url': url,
+        'type_name': type_name,
+        'schema_source': source,
+        'new': bool(is_new)
+    } for recorded_at, url, type_name, source, is_new in cur.fetchall()]
+    conn.close()
+    return changes
+
+def order_by_latency(services, latency):
+    """Schedule the hosts with the most expected work first.
     
-    services = get_wfs_services(limit)
-    total = len(services)
+    Expected work is historical latency times the number of services on
+    the host. Starting the long-running hosts early keeps them from
+    becoming the tail of the crawl. Unknown hosts go first so they get
+    measured.
+    """
+    per_host = defaultdict(int)
+    for svc in services:
+        per_host[urlparse(svc[1]).hostname or ''] += 1
     
-    if verbose:
-        print(f"Analyzing {total} WFS services...")
+    def expected_work(svc):
+        host = urlparse(svc[1]).hostname or ''
+        if host not in latency:
+            return float('inf')
+        return latency[host] * per_host[host]
     
-    results = []
+    return sorted(services, key=expected_work, reverse=True)
+
+async def crawl_services(services, crawler, writer, verbose=True):
+    """Process all services concurrently, in the given priority order.
     
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = {executor.submit(process_service, svc): svc for svc in services}
-        
-        completed = 0
-        for future in as_completed(futures):
-            result = future.result()
-            results.append(result)
-            completed += 1
-            
-            if verbose and completed % 20 == 0:
-                print(f"  Progress: {completed}/{total}")
+    Each result goes to the writer as soon as it completes; only running
+    totals are kept here.
+    """
+    summary = {'endpoints': len(services), 'success': 0, 'feature_types': 0, 'fields': 0, 'from_xsd': 0}
+    done = 0
+    
+    for future in asyncio.as_completed([asyncio.create_task(process_service(crawler, svc)) for svc in services]):
+        r = await future
+        writer.put(r)
+        done += 1
+        if not r['error']:
+            summary['success'] += 1
+        summary['feature_types'] += len(r['feature_types'])
+        summary['fields'] += sum(len(ft.get('fields', [])) for ft in r['feature_types'])
+        summary['from_xsd'] += sum(1 for ft in r['feature_types'] if ft['schema_source'] == 'xsd')
+        if verbose and done % 20 == 0:
+            print(f"  Progress: {done}/{len(services)}")
+    
+    return summary
+
+def run_schema_analysis(limit=None, verbose=True, max_concurrency=MAX_CONCURRENCY, per_host=MAX_PER_HOST,
+                        use_cache=True, resume=False, force=False):
+    """Run the schema analysis, resuming an unfinished run unless forced."""
+    init_schema_tables()
+    
+    run_id, finished = start_crawl_run(resume, force)
+    services = [svc for svc in get_wfs_services(limit) if svc[0] not in finished]
+    health = HostHealth()
+    services = order_by_latency(services, health.latencies())
+    total = len(services)
     
     if verbose:
-        print("Saving results...")
+        if finished:
+            print(f"Resuming crawl: {len(finished)} endpoints already done")
+        links = sum(svc[2] for svc in services)
+        print(f"Analyzing {total} WFS endpoints used by {links} datasets "
+              f"({max_concurrency} concurrent, {per_host} per host)...")
     
-    save_schema_results(results)
+    cache = HttpCache() if use_cache else None
+    crawler = Crawler(HttpClient(timeout=TIMEOUT, user_agent=USER_AGENT, health=health),
+                      max_concurrency, per_host, cache)
+    writer = SchemaWriter()
+    try:
+        summary = asyncio.run(crawl_services(services, crawler, writer, verbose))
+    finally:
+        crawler.close()
+        writer.close()
+        health.save()
     
-    # Generate summary
-    success = sum(1 for r in results if not r['error'])
-    total_ft = sum(len(r['feature_types']) for r in results)
-    total_fields = sum(len(ft.get('fields', [])) for r in results for ft in r['feature_types'])
+    finish_crawl_run(run_id)
     
     if verbose:
         print(f"\n=== Schema Analysis Summary ===")
-        print(f"Services analyzed: {success}/{total}")
-        print(f"Feature types found: {total_ft}")
-        print(f"Fields cataloged: {total_fields}")
+        print(f"Endpoints analyzed: {summary['success']}/{total}")
+        print(f"Feature types found: {summary['feature_types']}")
+        print(f"Fields cataloged: {summary['fields']}")
+        print(f"Schemas from DescribeFeatureType: {summary['from_xsd']}, "
+              f"from samples: {summary['feature_types'] - summary['from_xsd']}")
+        print(f"Schema changes: {writer.changes['added']} new, {writer.changes['changed']} changed, "
+              f"{writer.changes['unchanged']} unchanged")
+        print_host_report(crawler.client.stats)
+        print_health_report(health)
+        if cache:
+            print_cache_report(cache)
     
-    return results
+    if cache:
+        cache.close()
+    return summary
 
 if __name__ == '__main__':
     import argparse
+    import signal
+    import sys
     
     parser = argparse.ArgumentParser(description='Analyze WFS schemas')
     parser.add_argument('--limit', type=int, help='Limit services to analyze')
     parser.add_argument('--report', action='store_true', help='Show field mapping report')
+    parser.add_argument('--changes', type=int, metavar='DAYS', help='List schema changes in the last DAYS days')
+    parser.add_argument('--concurrency', type=int, default=MAX_CONCURRENCY, help='Requests in flight overall')
+    parser.add_argument('--per-host', type=int, default=MAX_PER_HOST, help='Requests in flight per host')
+    parser.add_argument('--no-cache', action='store_true', help='Bypass the HTTP response cache')
+    parser.add_argument('--resume', action='store_true', help='Continue the last crawl even if it finished')
+    parser.add_argument('--force', action='store_true', help='Start a new crawl, ignoring finished endpoints')
     
     args = parser.parse_args()
     
-    if args.report:
+    if args.changes is not None:
+        init_schema_tables()
+        for change in schema_changes(args.changes):
+            kind = 'new' if change['new'] else 'changed'
+            print(f"{change['recorded_at'][:19]}  {kind:<7} {change['type_name']:<40} {change['url']}")
+    elif args.report:
         by_theme = generate_field_mapping_report()
         for theme, types in sorted(by_theme.items()):
             print(f"\n=== {theme} ===")
@@ -490,4 +1112,10 @@ if __name__ == '__main__':
                 for province, fields in provinces.items():
                     print(f"    {province}: {', '.join(fields[:10])}{'...' if len(fields) > 10 else ''}")
     else:
-        run_schema_analysis(limit=args.limit)
+        # Let systemd stops unwind normally so queued results are committed
+        def stop(signum, frame):
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
+            sys.exit(128 + signum)
+        signal.signal(signal.SIGTERM, stop)
+        run_schema_analysis(limit=args.limit, max_concurrency=args.concurrency, per_host=args.per_host,
+                            use_cache=not args.no_cache, resume=args.resume, force=args.force)
@@ -489,7 +489,8 @@ def analyze_schema_coverage():
         SELECT DISTINCT f.field_name, ft.inspire_theme, d.province
         FROM wfs_fields f
         JOIN wfs_feature_types ft ON f.feature_type_id = ft.id
-        JOIN datasets d ON ft.dataset_id = d.id
+        JOIN endpoint_datasets ed ON ed.endpoint_id = ft.endpoint_id
+        JOIN datasets d ON ed.dataset_id = d.id
         WHERE ft.inspire_theme IS NOT NULL
     ''')
     
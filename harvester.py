@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+"""Harvest INSPIRE metadata records from the Austrian catalog search API.
+
+The harvest runs in two phases:
+
+1. An ids-only pass pages through the whole catalog with search_after,
+   sorted on metadataIdentifier. This is cheap, gives the real hit count
+   and fixes the set of records to fetch, so edits made to the catalog
+   while harvesting cannot shift records between pages.
+2. The ids are cut into pages which are fetched concurrently with a terms
+   query and written to the compressed record store (raw_store.py).
+
+Progress is checkpointed to raw_data/harvest_state.json after every step,
+so an interrupted harvest resumes where it stopped. Transient failures
+(connection errors, 429, 5xx) are retried with exponential backoff.
+
+--delta fetches only records whose changeDate is at or after the last
+watermark, finds deletions by comparing against an ids-only listing,
+updates just those records in the store and collects their ids in
+raw_data/delta.json for build_index.py --delta.
+
+For offline testing, --serve-stub DIR answers the same queries from a
+previously harvested record store (or legacy page_N.json files).
+"""
+
+import json
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+
+from http_client import HttpClient, HttpError
+from raw_store import RawStore
+
+SEARCH_URL = 'https://geometadatensuche.inspire.gv.at/metadatensuche/inspire/api/search/records/_search'
+RAW_DIR = 'raw_data'
+STATE_FILE = 'harvest_state.json'
+DELTA_FILE = 'delta.json'
+PAGE_SIZE = 100
+ID_PAGE_SIZE = 1000
+MAX_WORKERS = 4
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+COMPACT_RATIO = 0.5
+TIMEOUT = 60
+SORT_FIELD = 'metadataIdentifier'
+QUERY = {'match_all': {}}
+
+# One keep-alive pool for all harvest workers; it retries 429/5xx and
+# dropped connections with jittered exponential backoff
+client = HttpClient(timeout=TIMEOUT, user_agent='INSPIRE-Harvester/1.0', max_idle=MAX_WORKERS,
+                    retries=MAX_RETRIES, backoff=BACKOFF_BASE)
+
+class HarvestError(Exception):
+    pass
+
+def post_search(url, body, retries=MAX_RETRIES):
+    """POST a search body; transient failures are retried by the client."""
+    try:
+        resp = client.request('POST', url, {
+            'Content-Type': 'application/json',
+            'Accept': 'application/json'
+        }, body=json.dumps(body).encode('utf-8'), retries=retries)
+    except HttpError as e:
+        raise HarvestError(f"Search API failed ({e.kind}): {e}")
+    if resp.status != 200:
+        raise HarvestError(f"HTTP {resp.status} from search API")
+    try:
+        return json.loads(resp.body)
+    except ValueError as e:
+        raise HarvestError(f"Search API returned invalid JSON: {e}")
+
+def hit_total(result):
+    """Total hit count from a search response (ES 6 and 7+ formats)."""
+    total = result.get('hits', {}).get('total', 0)
+    return total.get('value', 0) if isinstance(total, dict) else total
+
+def hit_id(hit):
+    return hit.get('_source', {}).get(SORT_FIELD) or hit.get('_id')
+
+def load_state(raw_dir):
+    path = raw_dir / STATE_FILE
+    if path.exists():
+        with open(path) as f:
+            return json.load(f)
+    return None
+
+def write_json_atomic(path, data):
+    """Write JSON so a crash never leaves a truncated file behind."""
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def save_state(raw_dir, state):
+    write_json_atomic(raw_dir / STATE_FILE, state)
+
+def count_records(url):
+    result = post_search(url, {'query': QUERY, 'size': 0, 'track_total_hits': True})
+    return hit_total(result)
+
+def fetch_id_page(url, cursor=None):
+    """One page of the ids-only listing. Returns (ids, next cursor or None)."""
+    body = {
+        'query': QUERY,
+        'size': ID_PAGE_SIZE,
+        '_source': [SORT_FIELD],
+        'sort': [{SORT_FIELD: 'asc'}]
+    }
+    if cursor:
+        body['search_after'] = cursor
+
+    hits = post_search(url, body).get('hits', {}).get('hits', [])
+    ids = [ds_id for ds_id in (hit_id(h) for h in hits) if ds_id]
+    if len(hits) < ID_PAGE_SIZE:
+        return ids, None
+    return ids, hits[-1].get('sort') or [hit_id(hits[-1])]
+
+def collect_ids(url, raw_dir, state):
+    """Page through all record ids with search_after, checkpointing each page."""
+    while not state['ids_complete']:
+        ids, cursor = fetch_id_page(url, state['cursor'])
+        state['ids'].extend(ids)
+        state['cursor'] = cursor
+        state['ids_complete'] = cursor is None
+        save_state(raw_dir, state)
+        print(f"  ids: {len(state['ids'])}/{state['total']}")
+
+def list_ids(url):
+    """All current record ids (a handful of small requests)."""
+    ids, cursor = fetch_id_page(url)
+    while cursor:
+        more, cursor = fetch_id_page(url, cursor)
+        ids.extend(more)
+    return ids
+
+def max_change_date(hits, current=None):
+    """Latest changeDate among hits, used as the delta watermark."""
+    for hit in hits:
+        changed = hit.get('_source', {}).get('changeDate')
+        if changed and (current is None or changed > current):
+            current = changed
+    return current
+
+def fetch_page(url, ids):
+    """Fetch the full records for one page of ids."""
+    result = post_search(url, {
+        'query': {'terms': {SORT_FIELD: ids}},
+        'size': len(ids)
+    })
+    return result.get('hits', {}).get('hits', [])
+
+def remove_page_files(raw_dir):
+    """Remove page_N.json files from before the record store."""
+    for path in raw_dir.glob('page_*.json'):
+        path.unlink()
+
+def harvest(url=SEARCH_URL, raw_dir=RAW_DIR, page_size=PAGE_SIZE, workers=MAX_WORKERS, restart=False):
+    """Run (or resume) a full harvest into the record store in raw_dir."""
+    raw_dir = Path(raw_dir)
+    raw_dir.mkdir(parents=True, exist_ok=True)
+    store = RawStore(raw_dir)
+
+    state = None if restart else load_state(raw_dir)
+    if state and state.get('complete'):
+        print("Previous harvest complete, starting a new one")
+        state = None
+    if state and state.get('page_size') != page_size:
+        print("Page size changed, starting a new harvest")
+        state = None
+
+    if state:
+        print(f"Resuming harvest started {state['started_at']} "
+              f"({len(state['done'])} pages done)")
+    else:
+        total = count_records(url)
+        print(f"Catalog reports {total} records")
+        state = {
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'url': url,
+            'total': total,
+            'page_size': page_size,
+            'ids': [],
+            'cursor': None,
+            'ids_complete': False,
+            'done': [],
+            'missing': 0,
+            'watermark': None,
+            'complete': False
+        }
+        save_state(raw_dir, state)
+
+    collect_ids(url, raw_dir, state)
+
+    ids = state['ids']
+    pages = [ids[i:i + page_size] for i in range(0, len(ids), page_size)]
+    done = set(state['done'])
+    todo = [p for p in range(len(pages)) if p not in done]
+    print(f"Fetching {len(todo)}/{len(pages)} pages with {workers} workers...")
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(fetch_page, url, pages[p]): p for p in todo}
+        for future in as_completed(futures):
+            page = futures[future]
+            try:
+                hits = future.result()
+            except HarvestError as e:
+                print(f"  page {page} failed: {e}")
+                failed.append(page)
+                continue
+
+            # Store writes stay on this thread; workers only fetch
+            updated = store.put_many(hits)
+
+            # Records deleted since the ids pass are simply missing here
+            missing = len(pages[page]) - len(hits)
+            state['done'].append(page)
+            state['missing'] += missing
+            state['watermark'] = max_change_date(hits, state['watermark'])
+            save_state(raw_dir, state)
+            print(f"  page {page + 1}/{len(pages)}: {len(hits)} records, {len(updated)} updated"
+                  + (f" ({missing} deleted since listing)" if missing else ""))
+
+    if failed:
+        print(f"\n{len(failed)} pages failed; run again to resume")
+        return False
+
+    stale = store.remove(set(store.ids()) - set(ids))
+    if store.garbage_ratio() > COMPACT_RATIO:
+        store.compact()
+    remove_page_files(raw_dir)
+
+    # A full harvest supersedes any delta not yet applied to the index
+    if (raw_dir / DELTA_FILE).exists():
+        (raw_dir / DELTA_FILE).unlink()
+    state['complete'] = True
+    state['finished_at'] = datetime.now(timezone.utc).isoformat()
+    save_state(raw_dir, state)
+
+    fetched = len(ids) - state['missing']
+    print(f"\nDone: {fetched} records, {len(stale)} dropped from the store")
+    if len(ids) != state['total']:
+        print(f"Warning: listed {len(ids)} ids but catalog reported {state['total']}")
+    return True
+
+def fetch_records(url, query):
+    """Fetch all full records matching a query, paging with search_after."""
+    hits, cursor = [], None
+    while True:
+        body = {'query': query, 'size': PAGE_SIZE, 'sort': [{SORT_FIELD: 'asc'}]}
+        if cursor:
+            body['search_after'] = cursor
+        page = post_search(url, body).get('hits', {}).get('hits', [])
+        hits.extend(page)
+        if len(page) < PAGE_SIZE:
+            return hits
+        cursor = page[-1].get('sort') or [hit_id(page[-1])]
+
+def merge_delta_file(raw_dir, changed, removed):
+    """Add changed and removed ids to raw_data/delta.json, merging with any not yet applied."""
+    path = raw_dir / DELTA_FILE
+    pending_changed, pending_removed = set(), set()
+    if path.exists():
+        with open(path) as f:
+            pending = json.load(f)
+        pending_changed = set(pending.get('changed', []))
+        pending_removed = set(pending.get('removed', []))
+
+    pending_changed = (pending_changed | set(changed)) - set(removed)
+    pending_removed = (pending_removed | set(removed)) - set(changed)
+
+    write_json_atomic(path, {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'changed': sorted(pending_changed),
+        'removed': sorted(pending_removed)
+    })
+
+def harvest_delta(url=SEARCH_URL, raw_dir=RAW_DIR, workers=MAX_WORKERS):
+    """Fetch only records changed since the last harvest and detect deletions.
+
+    Changed records are written to the record store and their ids
+    collected in raw_data/delta.json for build_index.py --delta.
+    """
+    raw_dir = Path(raw_dir)
+    store = RawStore(raw_dir)
+    state = load_state(raw_dir)
+    if not state or not state.get('complete') or not state.get('watermark') or not store.exists():
+        print("No complete harvest to update, running a full harvest")
+        return harvest(url, raw_dir, workers=workers)
+
+    watermark = state['watermark']
+    print(f"Fetching records changed since {watermark}...")
+
+    # Cheap ids-only listing finds deletions and records that appeared
+    # without a newer changeDate (e.g. newly published)
+    current = list_ids(url)
+    known = set(store.ids())
+    removed = sorted(known - set(current))
+
+    # gte so records sharing the watermark timestamp are not missed;
+    # the store skips the ones that did not change
+    hits = fetch_records(url, {'range': {'changeDate': {'gte': watermark}}})
+    fetched = {hit_id(h) for h in hits}
+    unseen = [ds_id for ds_id in current if ds_id not in known and ds_id not in fetched]
+    for i in range(0, len(unseen), PAGE_SIZE):
+        hits.extend(fetch_records(url, {'terms': {SORT_FIELD: unseen[i:i + PAGE_SIZE]}}))
+
+    # Deletions leave the store only once they are recorded in the delta;
+    # dropped earlier, a failed fetch would lose them for good
+    changed = store.put_many(hits)
+    if changed or removed:
+        merge_delta_file(raw_dir, changed, removed)
+    store.remove(removed)
+
+    state['watermark'] = max_change_date(hits, watermark)
+    state['total'] = len(current)
+    state['missing'] = 0
+    state['last_delta_at'] = datetime.now(timezone.utc).isoformat()
+    save_state(raw_dir, state)
+
+    print(f"Done: {len(changed)} changed, {len(removed)} removed")
+    return True
+
+def load_stub_records(source_dir):
+    store = RawStore(source_dir)
+    if store.exists():
+        return sorted(store.records(), key=hit_id)
+    records = []
+    for path in Path(source_dir).glob('page_*.json'):
+        with open(path) as f:
+            records.extend(json.load(f).get('hits', {}).get('hits', []))
+    records.sort(key=hit_id)
+    return records
+
+class StubSearchHandler(BaseHTTPRequestHandler):
+    """Minimal stand-in for the catalog _search endpoint.
+
+    Supports size=0 counts, search_after on the sort field, terms queries
+    and changeDate range queries, which is all the harvester uses. Records
+    are re-read on every request, so editing them simulates catalog
+    changes. A fraction of requests can be failed with 503 to exercise
+    the retry path.
+    """
+    source_dir = None
+    fail_rate = 0.0
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+
+        if random.random() < self.fail_rate:
+            self.send_error(503)
+            return
+
+        hits = load_stub_records(self.source_dir)
+        query = body.get('query', {})
+        terms = query.get('terms', {}).get(SORT_FIELD)
+        if terms is not None:
+            wanted = set(terms)
+            hits = [h for h in hits if hit_id(h) in wanted]
+
+        since = query.get('range', {}).get('changeDate', {}).get('gte')
+        if since is not None:
+            hits = [h for h in hits if h.get('_source', {}).get('changeDate', '') >= since]
+
+        total = len(hits)
+        if body.get('search_after'):
+            after = body['search_after'][0]
+            hits = [h for h in hits if hit_id(h) > after]
+
+        page = hits[:body.get('size', 10)]
+        if '_source' in body:
+            page = [{'_id': h['_id'], '_source': {SORT_FIELD: hit_id(h)}} for h in page]
+        if 'sort' in body:
+            page = [dict(h, sort=[hit_id(h)]) for h in page]
+
+        data = json.dumps({'hits': {'total': {'value': total}, 'hits': page}}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', len(data))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve_stub(source_dir, port=9200, fail_rate=0.0):
+    """Serve previously harvested records as a local search endpoint."""
+    StubSearchHandler.source_dir = source_dir
+    StubSearchHandler.fail_rate = fail_rate
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubSearchHandler)
+    count = len(load_stub_records(source_dir))
+    print(f"Stub search API with {count} records on http://127.0.0.1:{port}/_search")
+    server.serve_forever()
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Harvest INSPIRE metadata records')
+    parser.add_argument('--url', default=SEARCH_URL, help='Search API endpoint')
+    parser.add_argument('--out', default=RAW_DIR, help='Directory for the record store and harvest state')
+    parser.add_argument('--page-size', type=int, default=PAGE_SIZE, help='Records per fetch request')
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS, help='Concurrent page fetches')
+    parser.add_argument('--restart', action='store_true', help='Ignore any checkpoint and start over')
+    parser.add_argument('--delta', action='store_true', help='Only fetch records changed since the last harvest')
+    parser.add_argument('--serve-stub', metavar='DIR', help='Serve records from DIR as a local search API')
+    parser.add_argument('--port', type=int, default=9200, help='Port for --serve-stub')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Fraction of stub requests answered with 503')
+
+    args = parser.parse_args()
+
+    if args.serve_stub:
+        serve_stub(args.serve_stub, args.port, args.fail_rate)
+    else:
+        try:
+            if args.delta:
+                ok = harvest_delta(args.url, args.out, args.workers)
+            else:
+                ok = harvest(args.url, args.out, args.page_size, args.workers, args.restart)
+        except HarvestError as e:
+            print(f"\nHarvest failed: {e}; run again to resume")
+            ok = False
+        raise SystemExit(0 if ok else 1)
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""Per-host health registry shared by the crawlers.
+
+validate_links, fetch_schemas and inspect_schemas all talk to the same
+few dozen government servers. Each request outcome is folded into a row
+per host in the host_health table: EWMA latency and error rate, a window
+of recent latencies, and a circuit breaker.
+
+After FAILURE_THRESHOLD consecutive failures (transport errors or 5xx)
+the circuit opens and requests to the host are refused without touching
+the network until the cool-down passes. Then a single probe request is let
+through: success closes the circuit, failure reopens it with twice the
+cool-down.
+
+Timeouts are sized from the host's observed latency (a multiple of its
+p95) instead of one fixed value, so fast hosts fail fast and known slow
+hosts get the time they need.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+DB_PATH = 'inspire_austria.db'
+ALPHA = 0.2  # weight of the newest sample in the EWMAs
+WINDOW = 50  # recent latencies kept per host
+MIN_SAMPLES = 10  # latencies needed before sizing timeouts from them
+TIMEOUT_FACTOR = 3  # timeout as a multiple of the p95 latency
+MIN_TIMEOUT = 5
+MAX_TIMEOUT = 60
+FAILURE_THRESHOLD = 5
+COOLDOWN = 10 * 60  # seconds a circuit first stays open
+MAX_COOLDOWN = 6 * 3600
+
+def init_host_health_table(cur):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS host_health (
+            host TEXT PRIMARY KEY,
+            requests INTEGER,
+            failures INTEGER,
+            consecutive_failures INTEGER,
+            latency REAL,
+            error_rate REAL,
+            recent TEXT,
+            circuit TEXT,
+            cooldown REAL,
+            open_until REAL,
+            updated_at TEXT
+        )
+    ''')
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+HEALTH_COLUMNS = ('requests', 'failures', 'consecutive_failures', 'latency', 'error_rate', 'recent',
+                  'circuit', 'cooldown', 'open_until')
+
+def new_host():
+    return {
+        'requests': 0, 'failures': 0, 'consecutive_failures': 0, 'latency': None,
+        'error_rate': 0.0, 'recent': [], 'circuit': 'closed', 'cooldown': COOLDOWN, 'open_until': None
+    }
+
+def read_host(row):
+    """Health dict from a host_health row without its host column."""
+    h = dict(zip(HEALTH_COLUMNS, row))
+    h['recent'] = json.loads(h['recent'] or '[]')
+    return h
+
+def fold(h, at, seconds, ok, probe):
+    """Fold one request outcome, made at time at, into a host's health.
+
+    probe marks the single request let through a half-open circuit.
+    """
+    h['requests'] += 1
+    h['recent'] = (h['recent'] + [round(seconds, 3)])[-WINDOW:]
+    h['error_rate'] = ALPHA * (not ok) + (1 - ALPHA) * h['error_rate']
+    if ok:
+        h['latency'] = seconds if h['latency'] is None else ALPHA * seconds + (1 - ALPHA) * h['latency']
+        h['consecutive_failures'] = 0
+        h['circuit'] = 'closed'
+        h['cooldown'] = COOLDOWN
+    else:
+        h['failures'] += 1
+        h['consecutive_failures'] += 1
+        if probe:
+            h['cooldown'] = min(MAX_COOLDOWN, h['cooldown'] * 2)
+            open_circuit(h, at)
+        elif h['circuit'] == 'closed' and h['consecutive_failures'] >= FAILURE_THRESHOLD:
+            open_circuit(h, at)
+
+def open_circuit(h, at):
+    h['circuit'] = 'open'
+    h['open_until'] = at + h['cooldown']
+
+class HostHealth:
+    """In-memory view of host_health, merged back by save().
+
+    Several processes (the crawlers, the link validator, the mirror job
+    and the server) record outcomes for the same hosts. Each keeps the
+    outcomes it recorded since its last save; save() replays them onto
+    the stored rows inside one write transaction, so no process
+    overwrites what the others wrote in the meantime.
+
+    Thread-safe; HttpClient consults it around every request.
+    """
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self.hosts = {}
+        self.pending = {}
+        self.skipped = 0
+        self._probing = set()
+        self._lock = threading.Lock()
+        conn = sqlite3.connect(path)
+        cur = conn.cursor()
+        init_host_health_table(cur)
+        conn.commit()
+        cur.execute(f"SELECT host, {', '.join(HEALTH_COLUMNS)} FROM host_health")
+        for row in cur.fetchall():
+            self.hosts[row[0]] = read_host(row[1:])
+        conn.close()
+
+    def _host(self, host):
+        if host not in self.hosts:
+            self.hosts[host] = new_host()
+        return self.hosts[host]
+
+    def allow(self, host):
+        """Whether a request to host may go out now."""
+        with self._lock:
+            h = self.hosts.get(host)
+            if h is None or h['circuit'] == 'closed':
+                return True
+            # Open, or half-open with its probe already in flight
+            if host in self._probing or time.time() < (h['open_until'] or 0):
+                self.skipped += 1
+                return False
+            h['circuit'] = 'half_open'
+            self._probing.add(host)
+            return True
+
+    def timeout(self, host, default):
+        """Socket timeout for host: TIMEOUT_FACTOR times its p95 latency."""
+        with self._lock:
+            h = self.hosts.get(host)
+            if h is None or len(h['recent']) < MIN_SAMPLES:
+                return default
+            p95 = percentile(h['recent'], 95)
+        return min(MAX_TIMEOUT, max(MIN_TIMEOUT, TIMEOUT_FACTOR * p95))
+
+    def record(self, host, seconds, ok):
+        """Fold one request outcome into the host's health."""
+        with self._lock:
+            h = self._host(host)
+            self._probing.discard(host)
+            outcome = (time.time(), seconds, ok, h['circuit'] == 'half_open')
+            fold(h, *outcome)
+            self.pending.setdefault(host, []).append(outcome)
+
+    def latencies(self):
+        """EWMA latency per host that has had a successful request."""
+        with self._lock:
+            return {host: h['latency'] for host, h in self.hosts.items() if h['latency'] is not None}
+
+    def open_hosts(self):
+        with self._lock:
+            return sorted(host for host, h in self.hosts.items() if h['circuit'] != 'closed')
+
+    def save(self):
+        """Merge the outcomes recorded since the last save into host_health.
+
+        Each host's stored row is re-read under the write lock and the
+        pending outcomes are replayed onto it. The merged state, which
+        includes other processes' outcomes, then replaces the in-memory one.
+        """
+        with self._lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        now = datetime.now(timezone.utc).isoformat()
+        merged = {}
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            cur = conn.cursor()
+            cur.execute('BEGIN IMMEDIATE')
+            for host, outcomes in pending.items():
+                cur.execute(f"SELECT {', '.join(HEALTH_COLUMNS)} FROM host_health WHERE host = ?", (host,))
+                row = cur.fetchone()
+                h = read_host(row) if row else new_host()
+                for outcome in outcomes:
+                    fold(h, *outcome)
+                merged[host] = h
+                cur.execute('INSERT OR REPLACE INTO host_health VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (
+                    host, h['requests'], h['failures'], h['consecutive_failures'], h['latency'],
+                    h['error_rate'], json.dumps(h['recent']), h['circuit'], h['cooldown'], h['open_until'], now
+                ))
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            # Keep the outcomes for the next save
+            with self._lock:
+                for host, outcomes in pending.items():
+                    self.pending[host] = outcomes + self.pending.get(host, [])
+            raise
+        finally:
+            conn.close()
+
+        with self._lock:
+            for host, h in merged.items():
+                # Outcomes recorded while the transaction ran
+                for outcome in self.pending.get(host, []):
+                    fold(h, *outcome)
+                if host in self._probing:
+                    h['circuit'] = 'half_open'
+                self.hosts[host] = h
+
+    def reset(self, host):
+        """Close a host's circuit, here and in host_health."""
+        with self._lock:
+            h = self._host(host)
+            h['circuit'] = 'closed'
+            h['consecutive_failures'] = 0
+            h['cooldown'] = COOLDOWN
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('''
+            UPDATE host_health SET circuit = 'closed', consecutive_failures = 0, cooldown = ?, updated_at = ?
+            WHERE host = ?
+        ''', (COOLDOWN, datetime.now(timezone.utc).isoformat(), host))
+        conn.commit()
+        conn.close()
+
+def print_health_report(health, limit=20):
+    """Print hosts with open circuits, then the slowest hosts."""
+    if health.skipped:
+        print(f"\nSkipped {health.skipped} requests to hosts with open circuits")
+    rows = sorted(health.hosts.items(), key=lambda kv: (kv[1]['circuit'] == 'closed', -(kv[1]['latency'] or 0)))
+    print(f"\n{'Host':<40} {'Circuit':<9} {'Req':>6} {'Err %':>6} {'EWMA s':>7} {'Timeout':>7}")
+    for host, h in rows[:limit]:
+        latency = f"{h['latency']:.2f}" if h['latency'] is not None else '-'
+        timeout = f"{health.timeout(host, 0):.0f}" if len(h['recent']) >= MIN_SAMPLES else '-'
+        print(f"{host[:40]:<40} {h['circuit']:<9} {h['requests']:>6} {100 * h['error_rate']:>6.0f} "
+              f"{latency:>7} {timeout:>7}")
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Show per-host health')
+    parser.add_argument('--limit', type=int, default=20, help='Hosts to list')
+    parser.add_argument('--reset', metavar='HOST', help='Close the circuit for a host')
+
+    args = parser.parse_args()
+    health = HostHealth()
+    if args.reset:
+        health.reset(args.reset)
+    print_health_report(health, args.limit)
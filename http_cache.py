@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""Persistent HTTP response cache with conditional requests.
+
+Response bodies are stored content-addressed (sha256, zlib-compressed)
+under http_cache/objects, so identical documents served from different
+URLs are kept once. For each URL the cache remembers the ETag and
+Last-Modified validators, which later runs send as If-None-Match /
+If-Modified-Since.
+
+Results derived from a body (parsed feature types, field lists) are
+stored against its content hash. When a server answers 304, or returns
+the same bytes again, callers reuse the derived result and skip parsing.
+
+Blobs are evicted least-recently-used once their total size exceeds the
+byte budget. For streamed responses that were cut short, the part that
+was read is what gets stored.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+
+from http_client import HttpError
+
+CACHE_DIR = 'http_cache'
+MAX_BYTES = 256 * 1024 * 1024
+
+class CacheResult:
+    """Outcome of a cached fetch."""
+
+    def __init__(self, cache, content_hash, body=None, not_modified=False):
+        self.cache = cache
+        self.hash = content_hash
+        self.not_modified = not_modified
+        self._body = body
+
+    def body(self):
+        if self._body is None:
+            self._body = self.cache.read_blob(self.hash)
+        return self._body
+
+    def text(self):
+        body = self.body()
+        return body.decode('utf-8', errors='ignore') if body is not None else None
+
+class HttpCache:
+    def __init__(self, path=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.path = Path(path)
+        self.objects = self.path / 'objects'
+        self.objects.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.stats = {'hits': 0, 'not_modified': 0, 'stored': 0, 'derived_hits': 0, 'evicted': 0}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path / 'cache.db', check_same_thread=False)
+        self._init_tables()
+
+    def _init_tables(self):
+        cur = self._db.cursor()
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY,
+                size INTEGER,
+                last_used REAL
+            )
+        ''')
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS entries (
+                url TEXT PRIMARY KEY,
+                hash TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at TEXT
+            )
+        ''')
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS derived (
+                hash TEXT,
+                kind TEXT,
+                value TEXT,
+                PRIMARY KEY (hash, kind)
+            )
+        ''')
+        cur.execute('CREATE INDEX IF NOT EXISTS idx_blobs_used ON blobs(last_used)')
+        cur.execute('CREATE INDEX IF NOT EXISTS idx_entries_hash ON entries(hash)')
+        self._db.commit()
+
+    def _blob_path(self, content_hash):
+        return self.objects / content_hash[:2] / content_hash
+
+    def read_blob(self, content_hash):
+        try:
+            with open(self._blob_path(content_hash), 'rb') as f:
+                return zlib.decompress(f.read())
+        except (FileNotFoundError, zlib.error):
+            return None
+
+    def conditional_headers(self, url):
+        """Validators for a conditional request, if the URL's body is cached."""
+        with self._lock:
+            row = self._db.execute('SELECT hash, etag, last_modified FROM entries WHERE url = ?',
+                                   (url,)).fetchone()
+        headers = {}
+        if not row or not self._blob_path(row[0]).exists():
+            return headers
+        if row[1]:
+            headers['If-None-Match'] = row[1]
+        if row[2]:
+            headers['If-Modified-Since'] = row[2]
+        return headers
+
+    def update(self, url, status, headers, body):
+        """Record a response. Returns a CacheResult, or None for errors."""
+        now = time.time()
+        with self._lock:
+            if status == 304:
+                row = self._db.execute('SELECT hash FROM entries WHERE url = ?', (url,)).fetchone()
+                if not row:
+                    return None
+                self._db.execute('UPDATE blobs SET last_used = ? WHERE hash = ?', (now, row[0]))
+                self._db.commit()
+                self.stats['not_modified'] += 1
+                return CacheResult(self, row[0], not_modified=True)
+
+            if not 200 <= status < 300:
+                return None
+
+            content_hash = hashlib.sha256(body).hexdigest()
+            path = self._blob_path(content_hash)
+            if path.exists():
+                self.stats['hits'] += 1
+            else:
+                path.parent.mkdir(exist_ok=True)
+                tmp = path.with_name(content_hash + '.tmp')
+                with open(tmp, 'wb') as f:
+                    f.write(zlib.compress(body))
+                os.replace(tmp, path)
+                self.stats['stored'] += 1
+
+            self._db.execute('''
+                INSERT INTO blobs (hash, size, last_used) VALUES (?, ?, ?)
+                ON CONFLICT(hash) DO UPDATE SET last_used = excluded.last_used
+            ''', (content_hash, path.stat().st_size, now))
+            self._db.execute('''
+                INSERT INTO entries (url, hash, etag, last_modified, fetched_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    hash = excluded.hash,
+                    etag = excluded.etag,
+                    last_modified = excluded.last_modified,
+                    fetched_at = excluded.fetched_at
+            ''', (url, content_hash, headers.get('ETag'), headers.get('Last-Modified'),
+                  datetime.now(timezone.utc).isoformat()))
+            self._db.commit()
+            self._evict()
+        return CacheResult(self, content_hash, body)
+
+    def get_derived(self, content_hash, kind):
+        """A previously stored result derived from this content, or None."""
+        with self._lock:
+            row = self._db.execute('SELECT value FROM derived WHERE hash = ? AND kind = ?',
+                                   (content_hash, kind)).fetchone()
+        if row is None:
+            return None
+        self.stats['derived_hits'] += 1
+        return json.loads(row[0])
+
+    def put_derived(self, content_hash, kind, value):
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO derived VALUES (?, ?, ?)',
+                             (content_hash, kind, json.dumps(value, ensure_ascii=False)))
+            self._db.commit()
+
+    def _evict(self):
+        """Drop least recently used blobs until under the byte budget."""
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        for content_hash, size in self._db.execute('SELECT hash, size FROM blobs ORDER BY last_used').fetchall():
+            if total <= self.max_bytes:
+                break
+            try:
+                self._blob_path(content_hash).unlink()
+            except FileNotFoundError:
+                pass
+            self._db.execute('DELETE FROM blobs WHERE hash = ?', (content_hash,))
+            self._db.execute('DELETE FROM entries WHERE hash = ?', (content_hash,))
+            self._db.execute('DELETE FROM derived WHERE hash = ?', (content_hash,))
+            total -= size
+            self.stats['evicted'] += 1
+        self._db.commit()
+
+    def total_bytes(self):
+        with self._lock:
+            return self._db.execute('SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+
+    def close(self):
+        self._db.close()
+
+def cached_get(client, cache, url, headers=None, feed=None, max_bytes=None):
+    """GET through the cache with a conditional request.
+
+    With feed, the body is streamed to it (see HttpClient.stream).
+    Returns a CacheResult (not_modified=True on 304), or None if the
+    request failed or the status was an error.
+    """
+    all_headers = dict(headers or {})
+    all_headers.update(cache.conditional_headers(url))
+    try:
+        if feed is None:
+            resp = client.get(url, all_headers)
+        else:
+            resp = client.stream(url, feed, all_headers, max_bytes)
+    except HttpError:
+        return None
+    return cache.update(url, resp.status, resp.headers, resp.body)
+
+def print_cache_report(cache):
+    s = cache.stats
+    print(f"\nHTTP cache: {s['not_modified']} not modified, {s['hits']} unchanged bodies, "
+          f"{s['stored']} new, {s['derived_hits']} parses skipped, {s['evicted']} evicted "
+          f"({cache.total_bytes() / 1024 / 1024:.1f} MB)")
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Inspect the HTTP response cache')
+    parser.add_argument('--dir', default=CACHE_DIR, help='Cache directory')
+    parser.add_argument('--max-mb', type=int, help='Evict down to this many MB')
+
+    args = parser.parse_args()
+    cache = HttpCache(args.dir)
+    if args.max_mb is not None:
+        cache.max_bytes = args.max_mb * 1024 * 1024
+        with cache._lock:
+            cache._evict()
+
+    urls = cache._db.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+    blobs = cache._db.execute('SELECT COUNT(*) FROM blobs').fetchone()[0]
+    print(f"{urls} URLs, {blobs} documents, {cache.total_bytes() / 1024 / 1024:.1f} MB")
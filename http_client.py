@@ -0,0 +1,476 @@
+#!/usr/bin/env python3
+"""Small HTTP client with keep-alive connection pools per host.
+
+urllib opens a new TCP (and TLS) connection for every request. The
+crawlers talk to a few dozen hosts many times each, so this client keeps
+idle http.client connections per host and reuses them. It also records
+per-host request counts, bytes and time for throughput reports, with
+DNS, connect, TLS and time-to-first-byte broken out.
+
+Failures are raised as HttpError subclasses (InvalidUrlError, HttpTimeout,
+DNSError, ConnectError, TLSError, ProtocolError, CircuitOpenError) whose kind
+attribute callers can report. Timeouts, dropped connections and 429/5xx
+responses are retried with exponential backoff, honouring Retry-After.
+
+Calls are blocking and thread-safe; the asyncio crawlers run them in an
+executor.
+"""
+
+import gzip
+import http.client
+import random
+import socket
+import ssl
+import threading
+import time
+import zlib
+from collections import defaultdict
+from urllib.parse import quote, urljoin, urlsplit
+
+USER_AGENT = 'INSPIRE-Austria/1.0'
+TIMEOUT = 30
+MAX_IDLE_PER_HOST = 4
+MAX_REDIRECTS = 5
+CHUNK_SIZE = 64 * 1024
+RETRIES = 2
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 60.0
+
+# Characters left as they are in the request target; '%' keeps escapes intact
+TARGET_SAFE = "/%:@!$&'()*+,;=?~-._"
+
+# Statuses worth retrying; anything else is the server's real answer
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Some government sites have certificate issues
+ssl_context = ssl.create_default_context()
+ssl_context.check_hostname = False
+ssl_context.verify_mode = ssl.CERT_NONE
+
+class HttpError(Exception):
+    kind = 'error'
+    retryable = False
+
+class InvalidUrlError(HttpError):
+    kind = 'invalid_url'
+
+class HttpTimeout(HttpError):
+    kind = 'timeout'
+    retryable = True
+
+class DNSError(HttpError):
+    kind = 'dns'
+
+class ConnectError(HttpError):
+    """Connection refused, reset or dropped."""
+    kind = 'connect'
+    retryable = True
+
+class TLSError(HttpError):
+    kind = 'tls'
+
+class ProtocolError(HttpError):
+    """Malformed response, bad compression or a redirect loop."""
+    kind = 'protocol'
+
+class CircuitOpenError(HttpError):
+    """The host's circuit is open; no request was sent."""
+    kind = 'circuit_open'
+
+def classify(e):
+    """Map a low-level exception to an HttpError subclass."""
+    if isinstance(e, HttpError):
+        return e
+    message = str(e) or type(e).__name__
+    if isinstance(e, TimeoutError):
+        return HttpTimeout(message)
+    if isinstance(e, socket.gaierror):
+        return DNSError(message)
+    if isinstance(e, (ssl.SSLError, ssl.CertificateError)):
+        return TLSError(message)
+    if isinstance(e, ConnectionError):
+        return ConnectError(message)
+    if isinstance(e, (http.client.HTTPException, zlib.error, EOFError)):
+        return ProtocolError(message)
+    return ConnectError(message)
+
+class Response:
+    def __init__(self, url, status, headers, body, complete=True, timings=None):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.complete = complete  # False if reading stopped before the end
+        self.timings = timings or {}  # seconds: dns, connect, tls, ttfb, total
+
+    def text(self):
+        return self.body.decode('utf-8', errors='ignore')
+
+def host_key(url):
+    try:
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        port = parts.port or (443 if scheme == 'https' else 80)
+    except ValueError as e:  # e.g. a port out of range
+        raise InvalidUrlError(f"Invalid URL {url}: {e}") from None
+    return scheme, parts.hostname or '', port
+
+def decode_body(body, encoding):
+    encoding = (encoding or '').lower()
+    if encoding == 'gzip':
+        return gzip.decompress(body)
+    if encoding == 'deflate':
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+    return body
+
+def stream_decoder(encoding):
+    """Incremental counterpart of decode_body.
+
+    Returns decode(chunk), which yields the decoded data in pieces of at
+    most CHUNK_SIZE bytes, so a small compressed chunk that expands to
+    megabytes can still be stopped early.
+    """
+    encoding = (encoding or '').lower()
+    if encoding not in ('gzip', 'deflate'):
+        return lambda chunk: [chunk]
+
+    state = {}
+
+    def decode(chunk):
+        if 'obj' not in state:
+            if encoding == 'gzip':
+                wbits = 16 + zlib.MAX_WBITS
+            elif len(chunk) >= 2 and chunk[0] & 0x0f == 8 and ((chunk[0] << 8) | chunk[1]) % 31 == 0:
+                wbits = zlib.MAX_WBITS  # zlib-wrapped deflate
+            else:
+                wbits = -zlib.MAX_WBITS  # raw deflate
+            state['obj'] = zlib.decompressobj(wbits)
+        obj = state['obj']
+        while True:
+            data = obj.decompress(chunk, CHUNK_SIZE)
+            if not data:
+                return
+            yield data
+            chunk = obj.unconsumed_tail
+
+    return decode
+
+def read_all(resp):
+    return decode_body(resp.read(), resp.getheader('Content-Encoding')), True
+
+def retry_after(headers):
+    """Seconds from a numeric Retry-After header, or None."""
+    value = (headers.get('Retry-After') or '').strip()
+    return min(BACKOFF_MAX, float(value)) if value.isdigit() else None
+
+class TokenBucket:
+    """Allows rate requests per second on average, in bursts of up to burst."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        """Block until a token is available, then use it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class HostThrottle:
+    """One token bucket per host, so politeness never slows other hosts."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def wait(self, host):
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(self.rate, self.burst)
+            bucket = self._buckets[host]
+        bucket.take()
+
+class TimedConnection(http.client.HTTPConnection):
+    """HTTPConnection that times DNS lookup and TCP connect separately."""
+
+    def connect(self):
+        self.timings = {}
+        start = time.monotonic()
+        addresses = socket.getaddrinfo(self.host, self.port, type=socket.SOCK_STREAM)
+        self.timings['dns'] = time.monotonic() - start
+
+        start = time.monotonic()
+        error = None
+        for family, socktype, proto, _, address in addresses:
+            sock = socket.socket(family, socktype, proto)
+            try:
+                sock.settimeout(self.timeout)
+                sock.connect(address)
+            except OSError as e:
+                sock.close()
+                error = e
+                continue
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.sock = sock
+            self.timings['connect'] = time.monotonic() - start
+            return
+        raise error or OSError(f'No addresses for {self.host}')
+
+class TimedTLSConnection(TimedConnection):
+    default_port = http.client.HTTPS_PORT
+
+    def connect(self):
+        super().connect()
+        start = time.monotonic()
+        self.sock = ssl_context.wrap_socket(self.sock, server_hostname=self.host)
+        self.timings['tls'] = time.monotonic() - start
+
+class HttpClient:
+    """Pool of keep-alive connections, keyed by (scheme, host, port)."""
+
+    def __init__(self, timeout=TIMEOUT, user_agent=USER_AGENT, max_idle=MAX_IDLE_PER_HOST, health=None,
+                 retries=RETRIES, backoff=BACKOFF_BASE, throttle=None):
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.max_idle = max_idle
+        self.health = health  # optional host_health.HostHealth
+        self.throttle = throttle  # optional HostThrottle
+        self.retries = retries
+        self.backoff = backoff
+        self._idle = defaultdict(list)
+        self._lock = threading.Lock()
+        self.stats = defaultdict(lambda: {
+            'requests': 0, 'errors': 0, 'retries': 0, 'bytes': 0, 'seconds': 0.0, 'reused': 0,
+            'dns': 0.0, 'connect': 0.0, 'tls': 0.0, 'ttfb': 0.0
+        })
+
+    def _timeout(self, host):
+        return self.health.timeout(host, self.timeout) if self.health else self.timeout
+
+    def _connect(self, key):
+        scheme, host, port = key
+        if scheme == 'https':
+            return TimedTLSConnection(host, port, timeout=self._timeout(host))
+        return TimedConnection(host, port, timeout=self._timeout(host))
+
+    def _checkout(self, key, fresh=False):
+        with self._lock:
+            if self._idle[key] and not fresh:
+                return self._idle[key].pop(), True
+        return self._connect(key), False
+
+    def _checkin(self, key, conn):
+        with self._lock:
+            if len(self._idle[key]) < self.max_idle:
+                self._idle[key].append(conn)
+                return
+        conn.close()
+
+    def _request_once(self, method, url, headers, read=None, body=None):
+        key = host_key(url)
+        if key[0] not in ('http', 'https') or not key[1]:
+            raise InvalidUrlError(f"Unsupported URL: {url}")
+
+        parts = urlsplit(url)
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        # Catalog URLs often hold umlauts or spaces; send them percent-encoded
+        target = quote(target, safe=TARGET_SAFE)
+
+        all_headers = {
+            'User-Agent': self.user_agent,
+            'Accept-Encoding': 'gzip, deflate',
+            'Host': parts.netloc.rsplit('@', 1)[-1]
+        }
+        all_headers.update(headers or {})
+
+        # A pooled connection may have been closed by the server while idle;
+        # retry once on a fresh connection in that case
+        for attempt in range(2):
+            conn, reused = self._checkout(key, fresh=attempt > 0)
+            if reused and conn.sock:
+                conn.sock.settimeout(self._timeout(key[1]))
+            try:
+                start = time.monotonic()
+                conn.request(method, target, body=body, headers=all_headers)
+                resp = conn.getresponse()
+                timings = {} if reused else dict(conn.timings)
+                connecting = sum(timings.values())
+                timings['ttfb'] = time.monotonic() - start - connecting
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as e:
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise classify(e)
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                raise classify(e)
+            except ValueError as e:  # UnicodeError from a host or header that cannot be encoded
+                conn.close()
+                raise InvalidUrlError(f"Invalid URL {url}: {e}") from None
+
+        # Only successful bodies are streamed; errors and redirects are small
+        streamed = read and 200 <= resp.status < 300
+        try:
+            data, complete = (read if streamed else read_all)(resp)
+        except (OSError, http.client.HTTPException, zlib.error) as e:
+            conn.close()
+            error = classify(e)
+            # Part of the body may already have been passed to the reader
+            error.retryable = error.retryable and not streamed
+            raise error
+
+        # A partly read response leaves data on the socket; don't reuse it
+        if resp.will_close or not complete:
+            conn.close()
+        else:
+            self._checkin(key, conn)
+        return resp, data, reused, complete, timings
+
+    def _send(self, method, url, headers, read, body):
+        """One attempt, following redirects."""
+        host = host_key(url)[1]
+        start = time.monotonic()
+        timings = {}
+        try:
+            for _ in range(MAX_REDIRECTS + 1):
+                resp, data, reused, complete, hop = self._request_once(method, url, headers, read, body)
+                for phase, seconds in hop.items():
+                    timings[phase] = timings.get(phase, 0.0) + seconds
+                if resp.status in (301, 302, 303, 307, 308) and resp.getheader('Location'):
+                    url = urljoin(url, resp.getheader('Location'))
+                    if resp.status == 303:
+                        method, body = 'GET', None
+                    continue
+                timings['total'] = time.monotonic() - start
+                self._record(host, timings, len(data), reused, server_error=resp.status >= 500)
+                return Response(url, resp.status, resp.headers, data, complete, timings)
+            raise ProtocolError('Too many redirects')
+        except (HttpError, OSError, zlib.error, EOFError) as e:
+            timings['total'] = time.monotonic() - start
+            self._record(host, timings, 0, False, error=True)
+            raise classify(e)
+
+    def request(self, method, url, headers=None, read=None, body=None, retries=None):
+        """Send a request, following redirects. Returns a Response.
+
+        read(resp), if given, consumes a successful response body and
+        returns (decoded body, complete). Timeouts, dropped connections
+        and RETRY_STATUSES are retried up to retries times (default: the
+        client's) with jittered exponential backoff; the last response is
+        returned even if its status is still retryable. With a health
+        registry, requests to hosts with an open circuit raise
+        CircuitOpenError unsent, and every attempt is reported to it.
+        With a throttle, each attempt first waits for the host's token.
+        """
+        host = host_key(url)[1]
+        retries = self.retries if retries is None else retries
+        for attempt in range(retries + 1):
+            if self.health and not self.health.allow(host):
+                raise CircuitOpenError(f'Circuit open for {host}')
+            if self.throttle:
+                self.throttle.wait(host)
+            try:
+                resp = self._send(method, url, headers, read, body)
+            except HttpError as e:
+                if not e.retryable or attempt == retries:
+                    raise
+                delay = None
+            else:
+                if resp.status not in RETRY_STATUSES or attempt == retries:
+                    return resp
+                delay = retry_after(resp.headers)
+            if delay is None:
+                delay = min(BACKOFF_MAX, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+            with self._lock:
+                self.stats[host]['retries'] += 1
+            time.sleep(delay)
+
+    def get(self, url, headers=None):
+        return self.request('GET', url, headers)
+
+    def stream(self, url, feed, headers=None, max_bytes=None):
+        """GET url, passing the decoded body to feed(chunk) as it arrives.
+
+        Reading stops at the end of the body, when feed returns True, or
+        after max_bytes. The Response holds the part that was read.
+        """
+        def read(resp):
+            decode = stream_decoder(resp.getheader('Content-Encoding'))
+            parts = []
+            total = 0
+            while True:
+                chunk = resp.read(CHUNK_SIZE)
+                if not chunk:
+                    return b''.join(parts), True
+                for data in decode(chunk):
+                    parts.append(data)
+                    total += len(data)
+                    if feed(data) or (max_bytes and total >= max_bytes):
+                        # Stopped early; the connection is reusable only
+                        # if the body happened to be read to the end
+                        return b''.join(parts), resp.isclosed()
+
+        return self.request('GET', url, headers, read)
+
+    def get_text(self, url, headers=None):
+        """GET and decode the body, or None on any failure or non-2xx status."""
+        try:
+            resp = self.get(url, headers)
+        except HttpError:
+            return None
+        if resp.status >= 400:
+            return None
+        return resp.text()
+
+    def _record(self, host, timings, nbytes, reused, error=False, server_error=False):
+        with self._lock:
+            s = self.stats[host]
+            s['requests'] += 1
+            s['seconds'] += timings['total']
+            s['bytes'] += nbytes
+            s['reused'] += int(reused)
+            s['errors'] += int(error)
+            for phase in ('dns', 'connect', 'tls', 'ttfb'):
+                s[phase] += timings.get(phase, 0.0)
+        if self.health:
+            self.health.record(host, timings['total'], not (error or server_error))
+
+    def close(self):
+        with self._lock:
+            for conns in self._idle.values():
+                for conn in conns:
+                    conn.close()
+            self._idle.clear()
+
+def print_host_report(stats, limit=20):
+    """Print per-host throughput, slowest hosts first."""
+    rows = sorted(stats.items(), key=lambda kv: -kv[1]['seconds'])
+    print(f"\n{'Host':<40} {'Req':>5} {'Err':>4} {'Retry':>5} {'Reuse':>5} {'DNS ms':>6} {'Conn ms':>7} "
+          f"{'TLS ms':>6} {'TTFB ms':>7} {'Avg s':>6} {'KB/s':>8}")
+    for host, s in rows[:limit]:
+        avg = s['seconds'] / s['requests'] if s['requests'] else 0
+        rate = s['bytes'] / 1024 / s['seconds'] if s['seconds'] else 0
+        # Connection setup is paid per new connection, not per request
+        opened = max(1, s['requests'] - s['reused'])
+        dns, connect, tls = (1000 * s[phase] / opened for phase in ('dns', 'connect', 'tls'))
+        ttfb = 1000 * s['ttfb'] / s['requests'] if s['requests'] else 0
+        print(f"{host[:40]:<40} {s['requests']:>5} {s['errors']:>4} {s['retries']:>5} {s['reused']:>5} "
+              f"{dns:>6.0f} {connect:>7.0f} {tls:>6.0f} {ttfb:>7.0f} {avg:>6.2f} {rate:>8.1f}")
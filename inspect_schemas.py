@@ -5,87 +5,351 @@ Fetches small samples from services and stores discovered column names.
 Can be run as a background job or triggered via API.
 """
 
+import codecs
 import sqlite3
 import json
-import requests
 import time
 import re
 from datetime import datetime
 from urllib.parse import urlparse, parse_qs, urlencode
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from change_log import record_status_change
+from endpoints import ensure_column, save_layer_sizes
+from fetch_schemas import (MAX_CAPABILITIES_BYTES, MAX_SCHEMA_BYTES, CapabilitiesParser, SchemaParser,
+                           determine_inspire_theme, feed_in_chunks, init_schema_tables, upsert_feature_type)
+from host_health import HostHealth, print_health_report
+from http_cache import HttpCache, print_cache_report
+from http_client import HostThrottle, HttpClient, HttpError, print_host_report
 
 DB_PATH = 'inspire_austria.db'
-TIMEOUT = 15  # seconds
+TIMEOUT = 15  # seconds, for hosts without a latency history
 MAX_RETRIES = 2
+MAX_SAMPLE_BYTES = 1024 * 1024  # GetFeature / items responses
+SAMPLE_FEATURES = 10  # features sampled per collection
+MAX_COLLECTIONS = 50  # collections sampled per OGC API endpoint
+COLLECTION_WORKERS = 4  # collections of one endpoint sampled at once
+MAX_WORKERS = 8  # endpoints inspected at once
+HOST_RATE = 2.0  # requests per second per host
+HOST_BURST = 2
+WRITE_BATCH = 20  # endpoints per commit
 
 def get_db():
     return sqlite3.connect(DB_PATH)
 
-def discover_ogc_api_fields(base_url, limit=5):
-    """Fetch sample from OGC API Features and extract fields."""
+def make_client(health=None, throttle=None):
+    return HttpClient(timeout=TIMEOUT, health=health, retries=MAX_RETRIES, throttle=throttle)
+
+def get_json(client, url, headers=None, max_bytes=None):
+    """GET and decode JSON. Returns (data, error message)."""
+    if max_bytes:
+        resp = client.stream(url, lambda chunk: False, headers, max_bytes)
+    else:
+        resp = client.get(url, headers)
+    if resp.status != 200:
+        return None, f"HTTP {resp.status}"
+    if not resp.complete:
+        return None, f"Response larger than {max_bytes // 1024} KB"
+    try:
+        return json.loads(resp.body), None
+    except ValueError:
+        return None, "Response is not JSON"
+
+JSON_TOKEN = re.compile(r'\\.?|["{}\[\]]', re.S)
+JSON_COUNT = re.compile(r'\s*:\s*(\d+)')
+
+class FeatureSampler:
+    """Incremental GeoJSON parser that keeps the first limit features.
+    
+    Only the brackets and strings of the response are scanned, to find
+    the top-level "features" array; each of the first limit features is
+    decoded on its own and later ones are skipped. Scanning continues past
+    the sample to find numberMatched, which servers such as pygeoapi and
+    GeoServer send after the features. feed() returns True once the
+    sample and numberMatched are both in, or the root object has closed,
+    so a server that ignores limit costs at most the byte cap and the
+    whole response is never held or decoded at once. feature_bytes sums
+    the encoded size of the sampled features.
+    """
+    
+    def __init__(self, limit):
+        self.limit = limit
+        self.features = []
+        self.number_matched = None
+        self.feature_bytes = 0
+        self.finished = False  # the root object closed: every feature was seen
+        self.done = False
+        self._decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        self._depth = 0
+        self._in_string = False
+        self._skip = False  # a backslash ended the previous chunk
+        self._in_features = False
+        self._key = None  # last string read directly inside the root object
+        self._capture = None  # pieces of the key or feature being read
+        self._count_tail = None  # text after a numberMatched key cut off by the chunk end
+    
+    def _match_count(self, text, pos):
+        count = JSON_COUNT.match(text, pos)
+        if count and count.end() < len(text):
+            self.number_matched = int(count.group(1))
+            self._count_tail = None
+        elif len(text) - pos < 32:
+            self._count_tail = text[pos:]  # the value may continue in the next chunk
+    
+    def feed(self, chunk):
+        if self.done:
+            return True
+        text = self._decoder.decode(chunk)
+        if self._count_tail is not None:
+            tail, self._count_tail = self._count_tail, None
+            self._match_count(tail + text[:32], 0)
+        pos = 1 if self._skip else 0
+        self._skip = False
+        start = 0 if self._capture is not None else None
+        try:
+            for m in JSON_TOKEN.finditer(text, pos):
+                c = m.group()
+                if c[0] == '\\':
+                    self._skip = len(c) == 1
+                    continue
+                if self._in_string:
+                    if c == '"':
+                        self._in_string = False
+                        if self._depth == 1:
+                            self._capture.append(text[start:m.start()])
+                            self._key = ''.join(self._capture)
+                            self._capture = start = None
+                            if self._key == 'numberMatched':
+                                self._match_count(text, m.end())
+                                if self.number_matched is not None and len(self.features) >= self.limit:
+                                    self.done = True
+                                    return True
+                    continue
+                if c == '"':
+                    self._in_string = True
+                    if self._depth == 1:
+                        self._capture, start = [], m.end()
+                elif c in '{[':
+                    if self._depth == 1 and c == '[':
+                        self._in_features = self._key == 'features'
+                    elif (self._depth == 2 and self._in_features and c == '{'
+                          and len(self.features) < self.limit):
+                        self._capture, start = [], m.start()
+                    self._depth += 1
+                else:
+                    self._depth -= 1
+                    if self._depth == 2 and self._capture is not None:
+                        self._capture.append(text[start:m.end()])
+                        feature = ''.join(self._capture)
+                        self.features.append(json.loads(feature))
+                        self.feature_bytes += len(feature.encode('utf-8'))
+                        self._capture = start = None
+                        if len(self.features) >= self.limit and self.number_matched is not None:
+                            self.done = True
+                            return True
+                    elif self._depth == 1:
+                        self._in_features = False
+                    elif self._depth == 0:
+                        self.finished = self.done = True
+                        return True
+        except ValueError:
+            self.done = True
+            return True
+        if self._capture is not None:
+            self._capture.append(text[start:])
+        return False
+    
+    def result(self):
+        return self.features
+
+def json_field_type(value):
+    """Field type of a GeoJSON property value, in the WFS field type names."""
+    if isinstance(value, bool):
+        return 'boolean'
+    if isinstance(value, int):
+        return 'integer'
+    if isinstance(value, float):
+        return 'decimal'
+    if isinstance(value, (dict, list)):
+        return 'complex'
+    if re.match(r'^\d{4}-\d{2}-\d{2}', value):
+        return 'dateTime'
+    return 'string'
+
+def union_fields(features):
+    """Fields across sampled features, in first-seen order.
+    
+    A field is nullable when any feature lacks it or has it null. Types
+    that disagree widen integer to decimal, and anything else to string.
+    The feature geometry comes last, named "_geometry" if a property is
+    already called "geometry".
+    """
+    fields = {}
+    with_geometry = 0
+    for feature in features:
+        if feature.get('geometry') is not None:
+            with_geometry += 1
+        for name, value in (feature.get('properties') or {}).items():
+            field = fields.setdefault(name, {
+                'name': name, 'type': None, 'is_geometry': False,
+                'is_nullable': False, 'sample_value': None, 'seen': 0
+            })
+            if value is None:
+                continue
+            field['seen'] += 1
+            kind = json_field_type(value)
+            if field['type'] is None or field['type'] == kind:
+                field['type'] = kind
+            elif {field['type'], kind} == {'integer', 'decimal'}:
+                field['type'] = 'decimal'
+            else:
+                field['type'] = 'string'
+            if field['sample_value'] is None and not isinstance(value, (dict, list)):
+                field['sample_value'] = str(value)[:100]
+    
+    result = []
+    for field in fields.values():
+        field['is_nullable'] = field.pop('seen') < len(features)
+        field['type'] = field['type'] or 'string'
+        result.append(field)
+    if with_geometry:
+        result.append({
+            'name': '_geometry' if 'geometry' in fields else 'geometry', 'type': 'geometry',
+            'is_geometry': True, 'is_nullable': with_geometry < len(features), 'sample_value': None
+        })
+    return result
+
+def sample_collection(client, base, collection, limit=SAMPLE_FEATURES):
+    """Sample one collection's items. Returns (feature type dict, error)."""
+    collection_id = collection.get('id') or collection.get('name')
+    if not collection_id:
+        return None, "Collection has no id"
+    
+    items_url = f"{base}/collections/{collection_id}/items?limit={limit}&f=json"
+    sampler = FeatureSampler(limit)
+    try:
+        resp = client.stream(items_url, sampler.feed, {'Accept': 'application/geo+json,application/json'},
+                             MAX_SAMPLE_BYTES)
+    except HttpError as e:
+        return None, "Timeout" if e.kind == 'timeout' else f"{e.kind}: {e}"
+    if resp.status != 200:
+        return None, f"Items request failed: HTTP {resp.status}"
+    
+    features = sampler.result()
+    if not features:
+        return None, "No features returned"
+    
+    # A response read to the end with room to spare held every feature
+    count, count_source = sampler.number_matched, 'numberMatched'
+    if count is None and (sampler.finished or resp.complete) and len(features) < limit:
+        count, count_source = len(features), 'sample'
+    
+    return {
+        'name': collection_id,
+        'namespace_prefix': '',
+        'title': collection.get('title') or collection_id,
+        'is_inspire': 'inspire' in base.lower(),
+        'inspire_theme': determine_inspire_theme('', collection_id),
+        'schema_source': 'sample',
+        'sample_count': len(features),
+        'feature_count': count,
+        'count_source': count_source if count is not None else None,
+        'avg_feature_bytes': sampler.feature_bytes // len(features),
+        'fields': union_fields(features)
+    }, None
+
+def discover_ogc_api_fields(base_url, limit=SAMPLE_FEATURES, client=None):
+    """Sample every collection of an OGC API Features endpoint.
+    
+    Collections are sampled concurrently. The result describes the first
+    collection that returned features, as before, and lists all of them
+    under 'collections' for storage per feature type.
+    """
+    client = client or make_client()
     try:
         # Ensure URL ends properly for OGC API
         base = base_url.rstrip('/')
         
         # Try to get collections
         collections_url = f"{base}/collections"
-        resp = requests.get(collections_url, timeout=TIMEOUT, headers={'Accept': 'application/json'})
+        data, error = get_json(client, collections_url, {'Accept': 'application/json'})
         
-        if resp.status_code != 200:
-            return None, f"Collections request failed: {resp.status_code}"
+        if data is None:
+            return None, f"Collections request failed: {error}"
         
-        data = resp.json()
         collections = data.get('collections', [])
         
         # If no collections array, check if this IS the collections response with links
         if not collections and 'links' in data:
             # Try parsing the root endpoint
-            root_resp = requests.get(base, timeout=TIMEOUT, headers={'Accept': 'application/json'})
-            if root_resp.status_code == 200:
-                root_data = root_resp.json()
+            root_data, _ = get_json(client, base, {'Accept': 'application/json'})
+            if root_data:
                 collections = root_data.get('collections', [])
         
         if not collections:
             return None, "No collections found"
         
-        # Get first collection's items
-        collection_id = collections[0].get('id') or collections[0].get('name')
-        if not collection_id:
-            return None, "Collection has no id"
-            
-        items_url = f"{base}/collections/{collection_id}/items?limit={limit}&f=json"
-        
-        resp = requests.get(items_url, timeout=TIMEOUT, headers={'Accept': 'application/geo+json,application/json'})
-        if resp.status_code != 200:
-            return None, f"Items request failed: {resp.status_code}"
+        collections = collections[:MAX_COLLECTIONS]
+        with ThreadPoolExecutor(max_workers=COLLECTION_WORKERS) as executor:
+            samples = list(executor.map(lambda c: sample_collection(client, base, c, limit), collections))
         
-        geojson = resp.json()
-        features = geojson.get('features', [])
-        if not features:
-            return None, "No features returned"
-        
-        # Extract field names from first feature
-        props = features[0].get('properties', {})
-        fields = list(props.keys())
-        
-        # Add geometry field indicator
-        if features[0].get('geometry'):
-            fields.append('geometry')
+        sampled = [ft for ft, _ in samples if ft]
+        if not sampled:
+            return None, samples[0][1]
         
+        first = sampled[0]
         return {
-            'fields': fields,
-            'sample_count': len(features),
-            'collection': collection_id,
-            'field_types': {k: type(v).__name__ for k, v in props.items()}
+            'fields': [f['name'] for f in first['fields']],
+            'sample_count': first['sample_count'],
+            'collection': first['name'],
+            'field_types': {f['name']: f['type'] for f in first['fields']},
+            'nullable': [f['name'] for f in first['fields'] if f['is_nullable']],
+            'collections': sampled,
+            'source': 'sample'
         }, None
         
-    except requests.Timeout:
-        return None, "Timeout"
+    except HttpError as e:
+        return None, "Timeout" if e.kind == 'timeout' else f"{e.kind}: {e}"
     except Exception as e:
         return None, str(e)
 
-def discover_wfs_fields(wfs_url, limit=5):
-    """Fetch sample from WFS and extract fields."""
+def parse_wfs_type_names(content):
+    """Feature type names listed in a WFS capabilities document."""
+    return wfs_type_names(feed_in_chunks(CapabilitiesParser(), content))
+
+def wfs_type_names(feature_types):
+    return [ft['name'] for ft in feature_types]
+
+def describe_wfs_type(base_url, typename, version='2.0.0', client=None):
+    """Fields of a feature type from DescribeFeatureType, or None.
+    
+    The schema is streamed into SchemaParser; one larger than
+    MAX_SCHEMA_BYTES is ignored and the caller falls back to sampling.
+    """
+    describe_params = {
+        'SERVICE': 'WFS',
+        'REQUEST': 'DescribeFeatureType',
+        'VERSION': version,
+        'TYPENAMES': typename
+    }
+    client = client or make_client()
+    parser = SchemaParser()
+    try:
+        resp = client.stream(f"{base_url}?{urlencode(describe_params)}", parser.feed, max_bytes=MAX_SCHEMA_BYTES)
+    except HttpError:
+        return None
+    if resp.status != 200 or not resp.complete:
+        return None
+    return parser.result().get(typename.split(':')[-1])
+
+def discover_wfs_fields(wfs_url, limit=5, cache=None, client=None):
+    """Fetch sample from WFS and extract fields.
+    
+    With a cache, GetCapabilities is a conditional request and the type
+    names parsed from an unchanged document are reused.
+    """
+    client = client or make_client()
     try:
         # Parse the URL to get base and add GetFeature params
         parsed = urlparse(wfs_url)
@@ -101,34 +365,41 @@ def discover_wfs_fields(wfs_url, limit=5):
         base_url = f"{parsed.scheme}://{parsed.netloc}{parsed.path}"
         caps_url = f"{base_url}?{urlencode(caps_params)}"
         
-        resp = requests.get(caps_url, timeout=TIMEOUT)
-        if resp.status_code != 200:
-            return None, f"GetCapabilities failed: {resp.status_code}"
-        
-        # Parse XML to find feature type names
-        root = ET.fromstring(resp.content)
-        ns = {
-            'wfs': 'http://www.opengis.net/wfs/2.0',
-            'wfs11': 'http://www.opengis.net/wfs',
-            'ows': 'http://www.opengis.net/ows/1.1'
-        }
+        # Streamed: reading stops after the FeatureTypeList or the byte cap
+        parser = CapabilitiesParser()
+        headers = cache.conditional_headers(caps_url) if cache else {}
+        resp = client.stream(caps_url, parser.feed, headers, MAX_CAPABILITIES_BYTES)
+        if resp.status != 200 and not (cache and resp.status == 304):
+            return None, f"GetCapabilities failed: {resp.status}"
         
-        # Try different namespace patterns
-        feature_types = []
-        for ft in root.findall('.//wfs:FeatureType/wfs:Name', ns):
-            feature_types.append(ft.text)
-        if not feature_types:
-            for ft in root.findall('.//{http://www.opengis.net/wfs/2.0}Name'):
-                feature_types.append(ft.text)
-        if not feature_types:
-            for ft in root.findall('.//{http://www.opengis.net/wfs}Name'):
-                feature_types.append(ft.text)
+        if cache:
+            cached = cache.update(caps_url, resp.status, resp.headers, resp.body)
+            if cached is None:
+                return None, f"GetCapabilities failed: {resp.status}"
+            feature_types = cache.get_derived(cached.hash, 'wfs_type_names')
+            if feature_types is None:
+                feature_types = (parse_wfs_type_names(cached.body()) if cached.not_modified
+                                 else wfs_type_names(parser.result()))
+                cache.put_derived(cached.hash, 'wfs_type_names', feature_types)
+        else:
+            feature_types = wfs_type_names(parser.result())
         
         if not feature_types:
             return None, "No feature types found in capabilities"
         
-        # Get features from first type
+        # Prefer the declared schema; only sample features without one
         typename = feature_types[0]
+        schema = describe_wfs_type(base_url, typename, params.get('VERSION', ['2.0.0'])[0], client)
+        if schema:
+            return {
+                'fields': [f['name'] for f in schema],
+                'sample_count': 0,
+                'feature_type': typename,
+                'field_types': {f['name']: f['type'] for f in schema},
+                'source': 'xsd'
+            }, None
+        
+        # Get features from first type
         get_feature_params = {
             'SERVICE': 'WFS',
             'REQUEST': 'GetFeature',
@@ -139,14 +410,16 @@ def discover_wfs_fields(wfs_url, limit=5):
         }
         
         feature_url = f"{base_url}?{urlencode(get_feature_params)}"
-        resp = requests.get(feature_url, timeout=TIMEOUT)
+        resp = client.stream(feature_url, lambda chunk: False, max_bytes=MAX_SAMPLE_BYTES)
         
-        if resp.status_code != 200:
-            return None, f"GetFeature failed: {resp.status_code}"
+        if resp.status != 200:
+            return None, f"GetFeature failed: {resp.status}"
+        if not resp.complete:
+            return None, f"GetFeature response larger than {MAX_SAMPLE_BYTES // 1024} KB"
         
         # Try to parse as JSON
         try:
-            geojson = resp.json()
+            geojson = json.loads(resp.body)
             features = geojson.get('features', [])
             if features:
                 props = features[0].get('properties', {})
@@ -157,14 +430,15 @@ def discover_wfs_fields(wfs_url, limit=5):
                     'fields': fields,
                     'sample_count': len(features),
                     'feature_type': typename,
-                    'field_types': {k: type(v).__name__ for k, v in props.items()}
+                    'field_types': {k: type(v).__name__ for k, v in props.items()},
+                    'source': 'sample'
                 }, None
         except:
             pass
         
         # Try parsing as GML
         try:
-            root = ET.fromstring(resp.content)
+            root = ET.fromstring(resp.body)
             # Find first feature and extract property names
             for elem in root.iter():
                 if 'member' in elem.tag.lower():
@@ -175,15 +449,16 @@ def discover_wfs_fields(wfs_url, limit=5):
                             'fields': fields,
                             'sample_count': 1,
                             'feature_type': typename,
-                            'format': 'GML'
+                            'format': 'GML',
+                            'source': 'sample'
                         }, None
         except:
             pass
         
         return None, "Could not parse response"
         
-    except requests.Timeout:
-        return None, "Timeout"
+    except HttpError as e:
+        return None, "Timeout" if e.kind == 'timeout' else f"{e.kind}: {e}"
     except Exception as e:
         return None, str(e)
 
@@ -193,7 +468,7 @@ def discover_download_fields(download_url):
     return None, "Download URLs require manual inspection"
 
 def update_service_status(conn, dataset_id, service_url, service_type, result, error):
-    """Update service_status table with discovery results."""
+    """Update service_status table with discovery results (caller commits)."""
     cur = conn.cursor()
     
     now = datetime.utcnow().isoformat()
@@ -201,16 +476,22 @@ def update_service_status(conn, dataset_id, service_url, service_type, result, e
     
     fields_json = json.dumps(result.get('fields')) if result else None
     details_json = json.dumps(result) if result else None
+    schema_source = result.get('source') if result else None
+    
+    cur.execute('SELECT status FROM service_status WHERE service_url = ?', (service_url,))
+    row = cur.fetchone()
+    old_status = row[0] if row else None
     
     cur.execute('''
         INSERT INTO service_status 
             (dataset_id, service_url, service_type, last_checked, status, 
-             sample_fields, error_message, check_count, success_count)
-        VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?)
+             sample_fields, schema_source, error_message, check_count, success_count)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1, ?)
         ON CONFLICT(service_url) DO UPDATE SET
             last_checked = excluded.last_checked,
             status = excluded.status,
             sample_fields = COALESCE(excluded.sample_fields, service_status.sample_fields),
+            schema_source = COALESCE(excluded.schema_source, service_status.schema_source),
             error_message = excluded.error_message,
             check_count = service_status.check_count + 1,
             success_count = service_status.success_count + excluded.success_count
@@ -221,15 +502,17 @@ def update_service_status(conn, dataset_id, service_url, service_type, result, e
         now,
         status,
         fields_json,
+        schema_source,
         error,
         1 if result else 0
     ))
     
-    conn.commit()
+    record_status_change(cur, dataset_id, service_url, old_status, status)
+    
     return status
 
 def log_as_feedback(conn, dataset_id, service_url, service_type, result, error):
-    """Also log discovery as feedback for tracking."""
+    """Also log discovery as feedback for tracking (caller commits)."""
     cur = conn.cursor()
     
     cur.execute('''
@@ -245,71 +528,117 @@ def log_as_feedback(conn, dataset_id, service_url, service_type, result, error):
             'service_type': service_type,
             'fields': result.get('fields') if result else None,
             'error': error,
-            'discovery_details': result
+            # Per-collection schemas are stored in wfs_feature_types
+            'discovery_details': {k: v for k, v in result.items() if k != 'collections'} if result else None
         }),
         datetime.utcnow().isoformat(),
         'auto-discovered'
     ))
-    
-    conn.commit()
 
-def inspect_services(limit=50, service_types=None, skip_recent_hours=24):
-    """Main inspection loop."""
+def inspect_services(limit=50, service_types=None, skip_recent_hours=24, max_workers=MAX_WORKERS,
+                     host_rate=HOST_RATE):
+    """Inspect due endpoints concurrently, once per unique endpoint.
+    
+    Politeness is per host: each host gets a token bucket of host_rate
+    requests per second, so slow or busy hosts never hold up the others.
+    """
     conn = get_db()
     cur = conn.cursor()
+    ensure_column(cur, 'service_status', 'schema_source', 'TEXT')
     
-    # Get services to inspect (prioritize OGC-API, then WFS)
+    # Get endpoints to inspect (prioritize OGC-API, then WFS). An endpoint
+    # is due when any of the dataset links using it is due.
     service_types = service_types or ['OGC-API', 'WFS']
     type_placeholders = ','.join('?' * len(service_types))
     
     cur.execute(f'''
-        SELECT DISTINCT ds.dataset_id, ds.url, ds.service_type, d.title
-        FROM dataset_services ds
-        JOIN datasets d ON ds.dataset_id = d.id
-        LEFT JOIN service_status ss ON ds.url = ss.service_url
-        WHERE ds.service_type IN ({type_placeholders})
-          AND (ss.last_checked IS NULL 
-               OR ss.last_checked < datetime('now', '-{skip_recent_hours} hours'))
+        SELECT e.id, e.url, e.service_type, MAX(d.title), COUNT(DISTINCT ed.dataset_id)
+        FROM service_endpoints e
+        JOIN endpoint_datasets ed ON ed.endpoint_id = e.id
+        JOIN datasets d ON ed.dataset_id = d.id
+        LEFT JOIN service_status ss ON ed.url = ss.service_url
+        WHERE e.service_type IN ({type_placeholders})
+        GROUP BY e.id
+        HAVING MIN(COALESCE(ss.last_checked, '')) < datetime('now', '-{skip_recent_hours} hours')
         ORDER BY 
-            CASE ds.service_type WHEN 'OGC-API' THEN 1 WHEN 'WFS' THEN 2 ELSE 3 END,
-            d.gem_score DESC
+            CASE e.service_type WHEN 'OGC-API' THEN 1 WHEN 'WFS' THEN 2 ELSE 3 END,
+            MAX(d.gem_score) DESC
         LIMIT ?
     ''', (*service_types, limit))
     
-    services = cur.fetchall()
-    print(f"Inspecting {len(services)} services...")
+    endpoints = cur.fetchall()
+    init_schema_tables()
+    schema_counts = {'added': 0, 'changed': 0, 'unchanged': 0}
+    print(f"Inspecting {len(endpoints)} endpoints ({max_workers} workers, {host_rate:g} requests/s per host)...")
     
     results = {'success': 0, 'failed': 0, 'timeout': 0}
+    cache = HttpCache()
+    health = HostHealth()
+    client = make_client(health, HostThrottle(host_rate, HOST_BURST))
+    start = time.time()
     
-    for i, (dataset_id, url, svc_type, title) in enumerate(services):
-        print(f"  [{i+1}/{len(services)}] {svc_type}: {title[:50]}...")
-        
-        if svc_type == 'OGC-API':
-            result, error = discover_ogc_api_fields(url)
-        elif svc_type == 'WFS':
-            result, error = discover_wfs_fields(url)
-        else:
-            result, error = None, f"Unknown service type: {svc_type}"
-        
-        status = update_service_status(conn, dataset_id, url, svc_type, result, error)
-        log_as_feedback(conn, dataset_id, url, svc_type, result, error)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(inspect_endpoint, client, cache, ep): ep for ep in endpoints}
         
-        if result:
-            results['success'] += 1
-            print(f"    ✓ Found {len(result['fields'])} fields")
-        elif error == 'Timeout':
-            results['timeout'] += 1
-            print(f"    ⏱ Timeout")
-        else:
-            results['failed'] += 1
-            print(f"    ✗ {error[:50]}")
-        
-        # Small delay to be nice to servers
-        time.sleep(0.5)
+        # This thread is the only writer; results are committed in batches
+        for i, future in enumerate(as_completed(futures)):
+            endpoint_id, url, svc_type, title, dataset_count = futures[future]
+            result, error = future.result()
+            
+            # Fan the result out to every dataset link using this endpoint
+            cur.execute('SELECT DISTINCT dataset_id, url FROM endpoint_datasets WHERE endpoint_id = ?', (endpoint_id,))
+            links = cur.fetchall()
+            for dataset_id, service_url in links:
+                update_service_status(conn, dataset_id, service_url, svc_type, result, error)
+            log_as_feedback(conn, links[0][0], url, svc_type, result, error)
+            now = datetime.utcnow().isoformat()
+            for ft in (result or {}).get('collections', []):
+                schema_counts[upsert_feature_type(cur, endpoint_id, ft, now)] += 1
+            save_layer_sizes(cur, [(
+                endpoint_id, ft['name'], ft['feature_count'], ft['count_source'],
+                ft['feature_count'] * ft['avg_feature_bytes'], 'sample', now
+            ) for ft in (result or {}).get('collections', []) if ft['feature_count'] is not None])
+            if (i + 1) % WRITE_BATCH == 0:
+                conn.commit()
+            
+            rate = (i + 1) / max(time.time() - start, 0.001)
+            print(f"  [{i+1}/{len(endpoints)}, {rate:.1f}/s] {svc_type}: {title[:50]}... ({dataset_count} datasets)")
+            if result:
+                results['success'] += 1
+                collections = len(result.get('collections', []))
+                more = f" in first of {collections} collections" if collections > 1 else ""
+                print(f"    ✓ Found {len(result['fields'])} fields{more}")
+            elif error == 'Timeout':
+                results['timeout'] += 1
+                print(f"    ⏱ Timeout")
+            else:
+                results['failed'] += 1
+                print(f"    ✗ {error[:50]}")
     
+    conn.commit()
+    elapsed = time.time() - start
+    print(f"\nInspected {len(endpoints)} endpoints in {elapsed:.1f}s ({len(endpoints) / max(elapsed, 0.001):.1f}/s)")
+    print(f"Collection schemas: {schema_counts['added']} added, {schema_counts['changed']} changed, "
+          f"{schema_counts['unchanged']} unchanged")
+    
+    client.close()
+    health.save()
+    print_host_report(client.stats)
+    print_cache_report(cache)
+    print_health_report(health)
+    cache.close()
     conn.close()
     return results
 
+def inspect_endpoint(client, cache, endpoint):
+    """Discover one endpoint's fields. Returns (result, error)."""
+    endpoint_id, url, svc_type, title, dataset_count = endpoint
+    if svc_type == 'OGC-API':
+        return discover_ogc_api_fields(url, client=client)
+    if svc_type == 'WFS':
+        return discover_wfs_fields(url, cache=cache, client=client)
+    return None, f"Unknown service type: {svc_type}"
+
 def get_schema_for_dataset(dataset_id):
     """Get discovered schema for a dataset."""
     conn = get_db()
@@ -317,7 +646,7 @@ def get_schema_for_dataset(dataset_id):
     
     cur.execute('''
         SELECT ss.service_url, ss.service_type, ss.status, ss.sample_fields,
-               ss.last_checked, ss.check_count, ss.success_count
+               ss.last_checked, ss.check_count, ss.success_count, ss.schema_source
         FROM service_status ss
         WHERE ss.dataset_id = ?
         ORDER BY ss.status = 'working' DESC, ss.last_checked DESC
@@ -335,7 +664,8 @@ def get_schema_for_dataset(dataset_id):
             'fields': json.loads(r[3]) if r[3] else None,
             'last_checked': r[4],
             'checks': r[5],
-            'successes': r[6]
+            'successes': r[6],
+            'schema_source': r[7]
         })
     
     return services
@@ -348,6 +678,8 @@ if __name__ == '__main__':
     parser.add_argument('--types', nargs='+', default=['OGC-API', 'WFS'], help='Service types to inspect')
     parser.add_argument('--skip-hours', type=int, default=24, help='Skip services checked within N hours')
     parser.add_argument('--dataset', type=str, help='Inspect specific dataset by ID')
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS, help='Endpoints inspected at once')
+    parser.add_argument('--rate', type=float, default=HOST_RATE, help='Requests per second per host')
     
     args = parser.parse_args()
     
@@ -360,7 +692,9 @@ if __name__ == '__main__':
         results = inspect_services(
             limit=args.limit,
             service_types=args.types,
-            skip_recent_hours=args.skip_hours
+            skip_recent_hours=args.skip_hours,
+            max_workers=args.workers,
+            host_rate=args.rate
         )
         print(f"\n=== Results ===")
         print(f"Success: {results['success']}")
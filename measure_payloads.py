@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Measure API payload sizes for full, projected and compact responses.
+
+Runs against a live server and writes payload_sizes.json, which the
+server publishes at /api/payload-sizes.
+"""
+
+import gzip
+import json
+import urllib.request
+from datetime import datetime
+
+RESULTS_PATH = 'payload_sizes.json'
+
+# (name, path, fields for the projected variant)
+ENDPOINTS = [
+    ('search', '/api/search?q=wasser&limit=50', 'id,title,province,gem_score'),
+    ('gems', '/api/gems?limit=50', 'id,title'),
+    ('topics', '/api/topics', None),
+    ('concepts', '/api/concepts', None),
+    ('browse', '/api/browse', None),
+    ('smart-search', '/api/smart-search?q=wasser', None),
+    ('fields', '/api/fields', None),
+    ('llm search', '/api/llm?action=search&q=wasser', None),
+    ('llm services', '/api/llm?action=services&type=WFS', None),
+    ('llm gems', '/api/llm?action=gems', None),
+]
+
+def fetch_size(url):
+    """Return raw and gzip-compressed size of a response body."""
+    with urllib.request.urlopen(url, timeout=60) as response:
+        body = response.read()
+    return {'bytes': len(body), 'gzip': len(gzip.compress(body))}
+
+def with_params(path, **params):
+    sep = '&' if '?' in path else '?'
+    return path + sep + '&'.join(f'{k}={v}' for k, v in params.items())
+
+def measure(base_url):
+    """Measure every endpoint in each supported encoding."""
+    # Multi-get is measured on the ids of the first search page
+    with urllib.request.urlopen(f'{base_url}/api/search?q=grundwasser&limit=20&fields=id', timeout=60) as response:
+        ids = ','.join(r['id'] for r in json.load(response)['results'])
+    endpoints = list(ENDPOINTS)
+    if ids:
+        endpoints.append(('dataset multi-get', f'/api/dataset?ids={ids}', 'id,title,services'))
+    
+    results = []
+    for name, path, fields in endpoints:
+        variants = {
+            'full': fetch_size(base_url + path),
+            'compact': fetch_size(base_url + with_params(path, format='compact')),
+        }
+        if fields:
+            variants['fields'] = fetch_size(base_url + with_params(path, fields=fields))
+            variants['fields+compact'] = fetch_size(base_url + with_params(path, fields=fields, format='compact'))
+        results.append({'endpoint': name, 'path': path, 'fields': fields, 'variants': variants})
+    
+    return {
+        'measured_at': datetime.utcnow().isoformat(),
+        'base_url': base_url,
+        'endpoints': results,
+    }
+
+if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Measure API payload sizes')
+    parser.add_argument('--url', default='http://localhost:8000', help='Server base URL')
+    
+    args = parser.parse_args()
+    
+    report = measure(args.url.rstrip('/'))
+    with open(RESULTS_PATH, 'w') as f:
+        json.dump(report, f, indent=2)
+    
+    print(f"{'Endpoint':<20} {'Variant':<16} {'Bytes':>10} {'Gzip':>8} {'vs full':>8}")
+    print("-" * 66)
+    for entry in report['endpoints']:
+        full = entry['variants']['full']['bytes']
+        for variant, size in entry['variants'].items():
+            pct = 100 * size['bytes'] / full if full else 0
+            print(f"{entry['endpoint']:<20} {variant:<16} {size['bytes']:>10} {size['gzip']:>8} {pct:>7.0f}%")
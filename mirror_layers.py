@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""Local mirror of small and medium WFS / OGC API layers.
+
+Live provincial servers are slow and often time out. This job copies each
+layer known to hold at most MAX_FEATURES features (or, when its count is
+unknown, at most MAX_BYTES) into its own SQLite file under MIRROR_DIR,
+with an R*Tree index on feature bounding boxes. The server publishes the
+copies at /ogc/collections/{id}/items.
+
+A copy is refreshed when a dataset using its endpoint has a newer
+changeDate than the copy, or when the copy is older than MAX_AGE_DAYS.
+Hosts with an open circuit are skipped and their copies stay in service.
+When the mirror outgrows DISK_BUDGET, the least recently read copies are
+evicted; an evicted layer is only mirrored again when it becomes due.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from federate import fetch_source, make_source
+from host_health import HostHealth, print_health_report
+from http_client import HostThrottle, HttpClient, print_host_report
+
+DB_PATH = 'inspire_austria.db'
+MIRROR_DIR = 'mirror'
+TIMEOUT = 60  # seconds, for hosts without a latency history
+USER_AGENT = 'INSPIRE-Mirror/1.0'
+MAX_FEATURES = 20000  # larger layers are not mirrored
+MAX_BYTES = 50 * 1024 * 1024  # for layers whose feature count is unknown
+DISK_BUDGET = 2 * 1024 * 1024 * 1024
+MAX_AGE_DAYS = 7
+MAX_WORKERS = 4  # layers fetched at once
+HOST_RATE = 1.0  # requests per second per host
+HOST_BURST = 2
+ACCESS_RESOLUTION = 3600  # seconds; reads update last_access at most this often
+
+def init_mirror_table(cur):
+    """One row per mirrored layer; path is NULL once the copy is evicted."""
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS mirror_layers (
+            id TEXT PRIMARY KEY,
+            endpoint_id INTEGER,
+            layer TEXT,
+            title TEXT,
+            path TEXT,
+            features INTEGER,
+            bytes INTEGER,
+            bbox TEXT,
+            source_changed TEXT,
+            fetched_at TEXT,
+            last_access TEXT,
+            status TEXT,
+            error TEXT,
+            UNIQUE (endpoint_id, layer)
+        )
+    ''')
+    rekey_layers(cur)
+
+def collection_id(endpoint_id, layer):
+    """URL-safe collection id for an endpoint layer, e.g. 12-ps-ProtectedSite-1f0a2b3c.
+
+    The readable part alone would give ps:Foo and ps-Foo the same id; the
+    hash of the raw layer name keeps ids distinct.
+    """
+    slug = re.sub(r'[^A-Za-z0-9_.-]+', '-', layer).strip('-')
+    return f"{endpoint_id}-{slug}-{hashlib.sha1(layer.encode('utf-8')).hexdigest()[:8]}"
+
+def rekey_layers(cur):
+    """Give rows written before ids carried a hash their current id."""
+    cur.execute('SELECT id, endpoint_id, layer FROM mirror_layers')
+    for old_id, endpoint_id, layer in cur.fetchall():
+        new_id = collection_id(endpoint_id, layer)
+        if new_id != old_id:
+            cur.execute('UPDATE mirror_layers SET id = ? WHERE id = ?', (new_id, old_id))
+
+def get_candidates(cur, max_features=MAX_FEATURES, max_bytes=MAX_BYTES):
+    """Layers small enough to mirror, with their current mirror state."""
+    cur.execute('''
+        SELECT e.id, e.service_type, e.url, e.host, ls.layer, COALESCE(ft.title, ls.layer),
+               (SELECT MAX(d.update_date) FROM endpoint_datasets ed JOIN datasets d ON d.id = ed.dataset_id
+                WHERE ed.endpoint_id = e.id),
+               m.fetched_at, m.source_changed, m.path
+        FROM layer_sizes ls
+        JOIN service_endpoints e ON e.id = ls.endpoint_id
+        LEFT JOIN wfs_feature_types ft ON ft.endpoint_id = e.id AND ft.type_name = ls.layer
+        LEFT JOIN mirror_layers m ON m.endpoint_id = e.id AND m.layer = ls.layer
+        WHERE e.service_type IN ('WFS', 'OGC-API') AND ls.layer != ''
+          AND (ls.features IS NOT NULL OR ls.bytes IS NOT NULL)
+          AND (ls.features IS NULL OR ls.features <= ?)
+          AND (ls.bytes IS NULL OR ls.bytes <= ?)
+    ''', (max_features, max_bytes))
+    return [{
+        'endpoint_id': r[0], 'type': r[1], 'url': r[2], 'host': r[3], 'layer': r[4], 'title': r[5],
+        'changed': r[6] or '', 'fetched_at': r[7], 'source_changed': r[8] or '', 'path': r[9]
+    } for r in cur.fetchall()]
+
+def is_due(layer, now, max_age_days=MAX_AGE_DAYS):
+    """Never mirrored, source metadata changed since the copy, or copy too old."""
+    if not layer['fetched_at']:
+        return True
+    if layer['changed'] > layer['source_changed']:
+        return True
+    return datetime.fromisoformat(layer['fetched_at']) < now - timedelta(days=max_age_days)
+
+def geometry_bbox(geometry):
+    """(minx, miny, maxx, maxy) of a GeoJSON geometry, or None if it has no coordinates."""
+    xs, ys = [], []
+
+    def walk(coords):
+        if coords and isinstance(coords[0], (int, float)):
+            xs.append(coords[0])
+            ys.append(coords[1])
+        else:
+            for c in coords or []:
+                walk(c)
+
+    if geometry:
+        if geometry.get('type') == 'GeometryCollection':
+            for g in geometry.get('geometries') or []:
+                walk(g.get('coordinates'))
+        else:
+            walk(geometry.get('coordinates'))
+    if not xs:
+        return None
+    return min(xs), min(ys), max(xs), max(ys)
+
+def create_layer_tables(conn):
+    conn.execute('CREATE TABLE features (id INTEGER PRIMARY KEY, fid TEXT, geometry TEXT, properties TEXT)')
+    conn.execute('CREATE VIRTUAL TABLE features_rtree USING rtree(id, minx, maxx, miny, maxy)')
+    conn.execute('CREATE INDEX idx_features_fid ON features(fid)')
+
+def mirror_layer(client, layer, max_features=MAX_FEATURES):
+    """Copy one layer into a fresh file, replacing the old copy only on success.
+
+    Returns (source, stats) where stats is None unless the whole layer
+    was copied. Any failure, including a malformed response or a local
+    SQLite error, fails only this layer; the temporary file is removed.
+    """
+    path = Path(MIRROR_DIR) / f"{layer['id']}.sqlite"
+    tmp = path.with_suffix('.tmp')
+    extent = [float('inf'), float('inf'), float('-inf'), float('-inf')]
+    source = make_source(layer['type'], layer['url'], layer['layer'], max_features)
+    conn = None
+
+    def emit(source, features):
+        cur = conn.cursor()
+        for feature in features:
+            geometry = feature.get('geometry')
+            cur.execute('INSERT INTO features (fid, geometry, properties) VALUES (?, ?, ?)', (
+                None if feature.get('id') is None else str(feature['id']),
+                json.dumps(geometry, ensure_ascii=False),
+                json.dumps(feature.get('properties') or {}, ensure_ascii=False)
+            ))
+            box = geometry_bbox(geometry)
+            if box:
+                cur.execute('INSERT INTO features_rtree VALUES (?, ?, ?, ?, ?)',
+                            (cur.lastrowid, box[0], box[2], box[1], box[3]))
+                extent[:] = [min(extent[0], box[0]), min(extent[1], box[1]),
+                             max(extent[2], box[2]), max(extent[3], box[3])]
+
+    try:
+        tmp.unlink(missing_ok=True)
+        conn = sqlite3.connect(tmp)
+        create_layer_tables(conn)
+        fetch_source(client, source, emit, threading.Event())
+        conn.commit()
+        conn.close()
+        conn = None
+        if source['status'] != 'ok':
+            return source, None
+        os.replace(tmp, path)
+        return source, {
+            'path': str(path), 'bytes': path.stat().st_size,
+            'bbox': json.dumps(extent) if extent[0] != float('inf') else None
+        }
+    except Exception as e:
+        source['status'] = 'error'
+        source['error'] = f'{type(e).__name__}: {e}'[:200]
+        return source, None
+    finally:
+        if conn is not None:
+            conn.close()
+        tmp.unlink(missing_ok=True)
+
+def evict(cur, budget=DISK_BUDGET):
+    """Delete the least recently read copies until the mirror fits the budget."""
+    cur.execute('''
+        SELECT id, path, bytes FROM mirror_layers WHERE path IS NOT NULL
+        ORDER BY COALESCE(last_access, fetched_at)
+    ''')
+    rows = cur.fetchall()
+    total = sum(size or 0 for _, _, size in rows)
+    evicted = 0
+    for layer_id, path, size in rows:
+        if total <= budget:
+            break
+        Path(path).unlink(missing_ok=True)
+        cur.execute("UPDATE mirror_layers SET path = NULL, status = 'evicted' WHERE id = ?", (layer_id,))
+        total -= size or 0
+        evicted += 1
+    return evicted, total
+
+def touch_layer(cur, layer_id):
+    """Record a read for LRU eviction, writing at most once per ACCESS_RESOLUTION."""
+    now = datetime.now(timezone.utc)
+    cur.execute('''
+        UPDATE mirror_layers SET last_access = ?
+        WHERE id = ? AND COALESCE(last_access, '') < ?
+    ''', (now.isoformat(), layer_id, (now - timedelta(seconds=ACCESS_RESOLUTION)).isoformat()))
+
+def open_layer(path):
+    return sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+
+def query_items(conn, bbox=None, limit=100, offset=0):
+    """Features of a copy as (number matched, [(fid, geometry json, properties json)]).
+
+    bbox is (minx, miny, maxx, maxy); features intersecting its envelope
+    match, found through the R*Tree.
+    """
+    if bbox:
+        where = 'WHERE id IN (SELECT id FROM features_rtree WHERE maxx >= ? AND minx <= ? AND maxy >= ? AND miny <= ?)'
+        params = [bbox[0], bbox[2], bbox[1], bbox[3]]
+    else:
+        where, params = '', []
+    cur = conn.cursor()
+    cur.execute(f'SELECT COUNT(*) FROM features {where}', params)
+    matched = cur.fetchone()[0]
+    cur.execute(f'SELECT id, fid, geometry, properties FROM features {where} ORDER BY id LIMIT ? OFFSET ?',
+                params + [limit, offset])
+    return matched, [(fid if fid is not None else str(row_id), geometry, props)
+                     for row_id, fid, geometry, props in cur.fetchall()]
+
+def get_item(conn, fid):
+    """One feature by its id as (fid, geometry json, properties json), or None."""
+    cur = conn.cursor()
+    cur.execute('SELECT id, fid, geometry, properties FROM features WHERE fid = ? ORDER BY id LIMIT 1', (fid,))
+    row = cur.fetchone()
+    if row is None and fid.isdigit():
+        # Features without an id of their own are served under their row id
+        cur.execute('SELECT id, fid, geometry, properties FROM features WHERE id = ? AND fid IS NULL', (int(fid),))
+        row = cur.fetchone()
+    return (fid, row[2], row[3]) if row else None
+
+def run_mirror(limit=None, max_features=MAX_FEATURES, max_bytes=MAX_BYTES, budget=DISK_BUDGET,
+               max_age_days=MAX_AGE_DAYS, workers=MAX_WORKERS):
+    """Refresh due layers, then evict down to the disk budget."""
+    Path(MIRROR_DIR).mkdir(exist_ok=True)
+    conn = sqlite3.connect(DB_PATH)
+    cur = conn.cursor()
+    init_mirror_table(cur)
+    conn.commit()
+
+    now = datetime.now(timezone.utc)
+    health = HostHealth(DB_PATH)
+    open_hosts = set(health.open_hosts())
+    candidates = get_candidates(cur, max_features, max_bytes)
+    due = [c for c in candidates if is_due(c, now, max_age_days)]
+    skipped = [c for c in due if c['host'] in open_hosts]
+    due = [c for c in due if c['host'] not in open_hosts]
+    # Never-mirrored layers first, then the stalest copies
+    due.sort(key=lambda c: c['fetched_at'] or '')
+    if limit:
+        due = due[:limit]
+    print(f"{len(candidates)} layers small enough to mirror, {len(due)} due, "
+          f"{len(skipped)} skipped on hosts with open circuits")
+
+    client = HttpClient(timeout=TIMEOUT, user_agent=USER_AGENT, health=health,
+                        throttle=HostThrottle(HOST_RATE, HOST_BURST))
+    counts = {'ok': 0, 'failed': 0}
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for layer in due:
+                layer['id'] = collection_id(layer['endpoint_id'], layer['layer'])
+                futures[executor.submit(mirror_layer, client, layer, max_features)] = layer
+
+            # This thread is the only writer to the main database
+            for future in as_completed(futures):
+                layer = futures[future]
+                source, stats = future.result()
+                fetched_at = datetime.now(timezone.utc).isoformat()
+                if stats:
+                    counts['ok'] += 1
+                    cur.execute('''
+                        INSERT INTO mirror_layers
+                        (id, endpoint_id, layer, title, path, features, bytes, bbox, source_changed, fetched_at,
+                         status, error)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'ok', NULL)
+                        ON CONFLICT(id) DO UPDATE SET
+                            title = excluded.title, path = excluded.path, features = excluded.features,
+                            bytes = excluded.bytes, bbox = excluded.bbox, source_changed = excluded.source_changed,
+                            fetched_at = excluded.fetched_at, status = 'ok', error = NULL
+                    ''', (layer['id'], layer['endpoint_id'], layer['layer'], layer['title'], stats['path'],
+                          source['features'], stats['bytes'], stats['bbox'], layer['changed'], fetched_at))
+                    if layer['path'] and layer['path'] != stats['path']:
+                        Path(layer['path']).unlink(missing_ok=True)  # copy named after an older id
+                    print(f"  ✓ {layer['id']}: {source['features']} features, {stats['bytes'] // 1024} KB")
+                else:
+                    # A failed refresh keeps the previous copy in service
+                    counts['failed'] += 1
+                    error = source['error'] or f"more than {max_features} features"
+                    cur.execute('''
+                        INSERT INTO mirror_layers (id, endpoint_id, layer, title, status, error)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(id) DO UPDATE SET status = excluded.status, error = excluded.error
+                    ''', (layer['id'], layer['endpoint_id'], layer['layer'], layer['title'], source['status'],
+                          error))
+                    print(f"  ✗ {layer['id']}: {error[:80]}")
+                conn.commit()
+
+        evicted, total = evict(cur, budget)
+        conn.commit()
+    finally:
+        conn.close()
+        client.close()
+        health.save()
+
+    print(f"\nMirrored {counts['ok']} layers, {counts['failed']} failed, {evicted} evicted; "
+          f"mirror holds {total / (1024 * 1024):.1f} MB of {budget / (1024 * 1024):.0f} MB")
+    print_host_report(client.stats)
+    print_health_report(health)
+    return counts
+
+def print_mirror_status():
+    conn = sqlite3.connect(DB_PATH)
+    cur = conn.cursor()
+    init_mirror_table(cur)
+    cur.execute('''
+        SELECT id, status, features, bytes, fetched_at, last_access, error FROM mirror_layers
+        ORDER BY path IS NULL, COALESCE(last_access, fetched_at) DESC
+    ''')
+    print(f"{'Collection':<40} {'Status':<10} {'Features':>8} {'KB':>8} {'Fetched':<20} {'Last read':<20}")
+    for layer_id, status, features, size, fetched_at, last_access, error in cur.fetchall():
+        print(f"{layer_id[:40]:<40} {status:<10} {features or 0:>8} {(size or 0) // 1024:>8} "
+              f"{(fetched_at or '-')[:19]:<20} {(last_access or '-')[:19]:<20}")
+    conn.close()
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Mirror small WFS / OGC API layers locally')
+    parser.add_argument('--limit', type=int, help='Layers to refresh in this run')
+    parser.add_argument('--max-features', type=int, default=MAX_FEATURES, help='Largest layer to mirror')
+    parser.add_argument('--max-mb', type=int, default=MAX_BYTES // (1024 * 1024),
+                        help='Largest layer to mirror when its feature count is unknown')
+    parser.add_argument('--budget-mb', type=int, default=DISK_BUDGET // (1024 * 1024), help='Disk budget')
+    parser.add_argument('--max-age-days', type=int, default=MAX_AGE_DAYS, help='Refresh copies older than this')
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS, help='Layers fetched at once')
+    parser.add_argument('--status', action='store_true', help='List mirrored layers')
+
+    args = parser.parse_args()
+    if args.status:
+        print_mirror_status()
+    else:
+        run_mirror(args.limit, args.max_features, args.max_mb * 1024 * 1024, args.budget_mb * 1024 * 1024,
+                   args.max_age_days, args.workers)
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""Compressed raw record store for harvested catalog records.
+
+raw_data/records.dat holds one zlib-compressed JSON record (the full
+search hit, _source included) per dataset, appended back to back.
+raw_data/records.idx maps each dataset id to the offset and length of its
+current record, so any single record is read from a memory map in O(1)
+without parsing anything else.
+
+Updates append a new record and rewrite the index; superseded records
+stay in the data file until compact() rewrites it. compact() writes a
+new generation of the data file (records.N.dat) which the index names,
+so the index is the only file ever switched: it is replaced atomically
+after the data is written, and readers in other processes always see a
+consistent store. Writers in all processes take an exclusive lock on
+records.lock.
+"""
+
+import fcntl
+import json
+import mmap
+import os
+import threading
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+
+RAW_DIR = 'raw_data'
+DATA_FILE = 'records.dat'
+INDEX_FILE = 'records.idx'
+LOCK_FILE = 'records.lock'
+COMPRESS_LEVEL = 6
+
+# Fields that vary per query rather than per record
+VOLATILE_FIELDS = ('_score', 'sort')
+
+def record_id(hit):
+    return hit.get('_source', {}).get('metadataIdentifier') or hit.get('_id')
+
+def data_file_name(generation):
+    return DATA_FILE if generation == 0 else f'records.{generation}.dat'
+
+def encode_record(hit):
+    record = {k: v for k, v in hit.items() if k not in VOLATILE_FIELDS}
+    data = json.dumps(record, ensure_ascii=False, sort_keys=True).encode('utf-8')
+    return zlib.compress(data, COMPRESS_LEVEL)
+
+class RawStore:
+    """Append-only store of compressed records with an offset index."""
+
+    def __init__(self, raw_dir=RAW_DIR):
+        self.raw_dir = Path(raw_dir)
+        self.data_path = self.raw_dir / DATA_FILE
+        self.index_path = self.raw_dir / INDEX_FILE
+        self._lock = threading.Lock()
+        self._index = {}
+        self._generation = 0
+        self._index_key = None  # (inode, mtime) of the loaded index
+        self._file = None
+        self._map = None
+
+    def exists(self):
+        return self.index_path.exists()
+
+    def _close_map(self):
+        if self._map is not None:
+            self._map.close()
+        if self._file is not None:
+            self._file.close()
+        self._map = self._file = None
+
+    def _refresh(self):
+        """Reload index and memory map if another process updated the store."""
+        for attempt in range(5):
+            try:
+                with open(self.index_path) as f:
+                    st = os.fstat(f.fileno())
+                    key = (st.st_ino, st.st_mtime_ns)
+                    if key == self._index_key:
+                        return
+                    index = json.load(f)
+            except FileNotFoundError:
+                self._close_map()
+                self._index, self._generation, self._index_key = {}, 0, None
+                self.data_path = self.raw_dir / DATA_FILE
+                return
+
+            # Indexes written before compaction kept generations are a bare dict
+            versioned = isinstance(index.get('records'), dict)
+            generation = index.get('generation', 0) if versioned else 0
+            records = index['records'] if versioned else index
+            data_path = self.raw_dir / data_file_name(generation)
+            self._close_map()
+            try:
+                self._file = open(data_path, 'rb')
+            except FileNotFoundError:
+                if attempt == 4:
+                    raise
+                continue  # compacted since the index was read; read the new one
+            if os.fstat(self._file.fileno()).st_size:
+                self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._index, self._generation, self._index_key = records, generation, key
+            self.data_path = data_path
+            return
+
+    @contextmanager
+    def _writing(self):
+        """Exclusive access for updates, across threads and processes."""
+        self.raw_dir.mkdir(parents=True, exist_ok=True)
+        with self._lock, open(self.raw_dir / LOCK_FILE, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._refresh()
+            yield
+
+    def _read(self, ds_id):
+        entry = self._index.get(ds_id)
+        if entry is None or self._map is None:
+            return None
+        offset, length = entry
+        return self._map[offset:offset + length]
+
+    def get_bytes(self, ds_id):
+        """The record as JSON bytes, or None if unknown."""
+        with self._lock:
+            self._refresh()
+            blob = self._read(ds_id)
+        return zlib.decompress(blob) if blob is not None else None
+
+    def get(self, ds_id):
+        data = self.get_bytes(ds_id)
+        return json.loads(data) if data is not None else None
+
+    def ids(self):
+        with self._lock:
+            self._refresh()
+            return list(self._index)
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._index)
+
+    def records(self, ids=None):
+        """Yield records, in file order so reads stay sequential."""
+        with self._lock:
+            self._refresh()
+            wanted = self._index if ids is None else {i: self._index[i] for i in ids if i in self._index}
+            entries = sorted(wanted.items(), key=lambda e: e[1][0])
+            blobs = [(ds_id, self._read(ds_id)) for ds_id, _ in entries]
+        for ds_id, blob in blobs:
+            yield json.loads(zlib.decompress(blob))
+
+    def _save_index(self):
+        tmp = self.index_path.with_name(INDEX_FILE + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'generation': self._generation, 'records': self._index}, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.index_path)
+        self._index_key = None
+
+    def put_many(self, hits):
+        """Store records, skipping unchanged ones. Returns the ids that changed."""
+        with self._writing():
+            changed = []
+            with open(self.data_path, 'ab') as f:
+                offset = f.tell()
+                for hit in hits:
+                    ds_id = record_id(hit)
+                    if not ds_id:
+                        continue
+                    blob = encode_record(hit)
+                    if self._read(ds_id) == blob:
+                        continue
+                    f.write(blob)
+                    self._index[ds_id] = [offset, len(blob)]
+                    offset += len(blob)
+                    changed.append(ds_id)
+                f.flush()
+                os.fsync(f.fileno())
+            if changed or not self.index_path.exists():
+                self._save_index()
+            return changed
+
+    def remove(self, ids):
+        """Drop records from the index. Returns the ids that were present."""
+        with self._writing():
+            removed = [ds_id for ds_id in ids if self._index.pop(ds_id, None) is not None]
+            if removed:
+                self._save_index()
+            return removed
+
+    def garbage_ratio(self):
+        """Fraction of the data file taken by superseded records."""
+        with self._lock:
+            self._refresh()
+            size = len(self._map) if self._map is not None else 0
+            live = sum(length for _, length in self._index.values())
+        return 1 - live / size if size else 0.0
+
+    def compact(self):
+        """Rewrite the current records into the next generation of the data file.
+
+        Readers keep using the old file until the index names the new one;
+        the old file is deleted afterwards (open memory maps stay valid).
+        """
+        with self._writing():
+            old_path = self.data_path
+            generation = self._generation + 1
+            index = {}
+            with open(self.raw_dir / data_file_name(generation), 'wb') as f:
+                for ds_id, (offset, length) in sorted(self._index.items(), key=lambda e: e[1][0]):
+                    index[ds_id] = [f.tell(), length]
+                    f.write(self._map[offset:offset + length])
+                f.flush()
+                os.fsync(f.fileno())
+            self._index, self._generation = index, generation
+            self._save_index()
+            self._close_map()
+            old_path.unlink(missing_ok=True)
+
+def import_pages(raw_dir=RAW_DIR):
+    """Load legacy page_N.json files into the store."""
+    store = RawStore(raw_dir)
+    total = 0
+    for path in sorted(Path(raw_dir).glob('page_*.json')):
+        with open(path) as f:
+            hits = json.load(f).get('hits', {}).get('hits', [])
+        total += len(store.put_many(hits))
+    return total
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Manage the raw record store')
+    parser.add_argument('--dir', default=RAW_DIR, help='Store directory')
+    parser.add_argument('--import-pages', action='store_true', help='Import page_N.json files')
+    parser.add_argument('--compact', action='store_true', help='Drop superseded records')
+    parser.add_argument('--get', metavar='ID', help='Print one record')
+
+    args = parser.parse_args()
+    store = RawStore(args.dir)
+
+    if args.import_pages:
+        print(f"Imported {import_pages(args.dir)} records")
+    if args.compact:
+        store.compact()
+        print("Compacted")
+    if args.get:
+        data = store.get_bytes(args.get)
+        print(data.decode('utf-8') if data else 'not found')
+    else:
+        count = len(store)
+        size = store.data_path.stat().st_size if store.data_path.exists() else 0
+        print(f"{count} records, {size / 1024:.0f} KB, {store.garbage_ratio():.0%} superseded")
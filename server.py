@@ -1,35 +1,381 @@
 #!/usr/bin/env python3
 """INSPIRE Austria Search Server - German Web App with API."""
 
+import csv
+import io
 import json
 import sqlite3
 import random
 from pathlib import Path
-from http.server import HTTPServer, BaseHTTPRequestHandler
-from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, urlencode
 import threading
+import time
+
+import federate
+import mirror_layers
+from change_log import init_change_tables, record_status_change
+from endpoints import ensure_column
+from raw_store import RawStore
+from host_health import init_host_health_table
+from validate_links import init_validation_tables
 
 DB_PATH = 'inspire_austria.db'
+RAW_DIR = 'raw_data'
+MAX_IDS = 200  # ids per multi-get request
+MAX_BATCH = 50  # sub-requests per /api/batch call
+MAX_CHANGES = 1000  # events per /api/changes page
+EXPORT_BATCH = 200  # rows per chunk in /api/export
+PAGE_FEATURES = 1000  # layers with more features than this should be fetched in pages
+OGC_LIMIT = 100  # default and maximum page size of /ogc/collections/{id}/items
+OGC_MAX_LIMIT = 10000
+OGC_CRS84 = 'http://www.opengis.net/def/crs/OGC/1.3/CRS84'
+
+EXPORT_TYPES = {
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+    'geojson': 'application/geo+json; charset=utf-8',
+}
+CSV_COLUMNS = [
+    'id', 'uuid', 'title', 'type', 'province', 'year', 'gem_score', 'is_open_data',
+    'org', 'contact', 'create_date', 'update_date', 'themes', 'topics', 'services', 'inspire_url'
+]
+
+# Endpoints that must not run inside /api/batch (writes or recursion)
+BATCH_EXCLUDED = {'/api/batch', '/api/feedback', '/api/export', '/api/combine/execute'}
+
+_local = threading.local()
+
+# Full original catalog records, read on demand for /api/dataset?raw=1
+raw_store = RawStore(RAW_DIR)
+
+class SnapshotConnection:
+    """Connection shared by all sub-requests of one /api/batch call.
+    
+    Handlers close their connection when done; here that is a no-op so
+    every sub-request reads from the same transaction snapshot.
+    """
+    def __init__(self, conn):
+        self._conn = conn
+    
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+    
+    def close(self):
+        pass
 
 def get_db():
     """Get database connection."""
+    snapshot = getattr(_local, 'snapshot', None)
+    if snapshot is not None:
+        return SnapshotConnection(snapshot)
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     return conn
 
+# Columns /api/search can project with ?fields=; relations are loaded only on request
+SEARCH_COLUMNS = {
+    'id': 'd.id',
+    'title': 'd.title',
+    'abstract': "COALESCE(SUBSTR(d.abstract, 1, 500), '')",
+    'type': 'd.type',
+    'province': 'd.province',
+    'year': 'd.year',
+    'themes': None,
+    'topics': None,
+    'services': None,
+    'gem_score': 'd.gem_score',
+    'is_open_data': 'd.is_open_data',
+    'org': 'd.org',
+}
+
+GEM_COLUMNS = {
+    'id': 'id',
+    'title': 'title',
+    'score': 'gem_score',
+    'province': 'province',
+}
+
+def parse_fields(query, allowed):
+    """Parse ?fields=a,b,c against the allowed field names.
+    
+    Returns the requested names in canonical order, or all of them when
+    no projection was asked for. Raises ValueError on unknown names.
+    """
+    raw = query.get('fields', [''])[0]
+    if not raw:
+        return list(allowed)
+    requested = {f.strip() for f in raw.split(',') if f.strip()}
+    unknown = requested - set(allowed)
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(sorted(unknown))}; allowed: {', '.join(allowed)}")
+    return [f for f in allowed if f in requested]
+
+def compact_records(items):
+    """Column-oriented encoding of a list of dicts: {"cols": [...], "rows": [[...]]}."""
+    cols = list(dict.fromkeys(k for item in items for k in item))
+    return {'cols': cols, 'rows': [[item.get(c) for c in cols] for item in items]}
+
+def paging_hint(service_type, features):
+    """How a client should fetch a layer with this many features."""
+    if features is None:
+        return None
+    if features <= PAGE_FEATURES:
+        return 'single request'
+    if service_type == 'WFS':
+        return f'page with COUNT={PAGE_FEATURES}&STARTINDEX=n'
+    if service_type == 'OGC-API':
+        return f'page with limit={PAGE_FEATURES} and follow next links'
+    return 'download'
+
+def layer_sizes(cur, dataset_ids):
+    """Feature counts and transfer sizes of the layers behind each dataset.
+    
+    Returns {dataset_id: [layer, ...]} from the layer_sizes table the
+    crawlers fill (see endpoints.init_layer_size_table). Layers with a
+    local copy link to it under 'mirror'.
+    """
+    if not dataset_ids:
+        return {}
+    placeholders = ','.join('?' * len(dataset_ids))
+    cur.execute(f'''
+        SELECT DISTINCT ed.dataset_id, e.service_type, e.url, ls.layer, ls.features, ls.features_source,
+               ls.bytes, ls.bytes_source, ls.measured_at, m.id
+        FROM endpoint_datasets ed
+        JOIN service_endpoints e ON e.id = ed.endpoint_id
+        JOIN layer_sizes ls ON ls.endpoint_id = ed.endpoint_id
+        LEFT JOIN mirror_layers m ON m.endpoint_id = ls.endpoint_id AND m.layer = ls.layer AND m.path IS NOT NULL
+        WHERE ed.dataset_id IN ({placeholders})
+        ORDER BY e.url, ls.layer
+    ''', list(dataset_ids))
+    sizes = {}
+    for r in cur.fetchall():
+        sizes.setdefault(r[0], []).append({
+            'type': r[1], 'url': r[2], 'layer': r[3] or None, 'features': r[4], 'features_source': r[5],
+            'bytes': r[6], 'bytes_source': r[7], 'measured_at': r[8], 'paging': paging_hint(r[1], r[4]),
+            'mirror': f'/ogc/collections/{r[9]}/items' if r[9] else None
+        })
+    return sizes
+
+def merge_service_status(doc, status_rows, layers=None):
+    """Merge live service_status rows and layer sizes into an encoded dataset document."""
+    if not status_rows and not layers:
+        return doc
+    result = json.loads(doc)
+    if layers:
+        result['layers'] = layers
+    status_rows = status_rows or []
+    status_map = {r[0]: {'status': r[1], 'fields': json.loads(r[2]) if r[2] else None, 'last_checked': r[3]} for r in status_rows}
+    for svc in result['services']:
+        if svc['url'] in status_map:
+            svc.update(status_map[svc['url']])
+    return json.dumps(result, ensure_ascii=False).encode('utf-8')
+
+def init_db():
+    """Create tables written at runtime (feedback, live service status)."""
+    conn = sqlite3.connect(DB_PATH)
+    cur = conn.cursor()
+    
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS service_status (
+            dataset_id TEXT,
+            service_url TEXT UNIQUE,
+            service_type TEXT,
+            last_checked TEXT,
+            status TEXT,
+            response_time_ms INTEGER,
+            sample_fields TEXT,
+            error_message TEXT,
+            check_count INTEGER DEFAULT 0,
+            success_count INTEGER DEFAULT 0,
+            schema_source TEXT
+        )
+    ''')
+    ensure_column(cur, 'service_status', 'schema_source', 'TEXT')
+    
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS feedback (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT DEFAULT CURRENT_TIMESTAMP,
+            source TEXT,
+            category TEXT,
+            dataset_id TEXT,
+            service_url TEXT,
+            issue_type TEXT,
+            details TEXT,
+            processed BOOLEAN DEFAULT 0,
+            processed_at TEXT,
+            resolution TEXT
+        )
+    ''')
+    
+    # /api/dataset merges live status with a single lookup per dataset
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_status_dataset ON service_status(dataset_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_feedback_dataset ON feedback(dataset_id)')
+    
+    init_change_tables(cur)
+    init_validation_tables(cur)
+    init_host_health_table(cur)
+    mirror_layers.init_mirror_table(cur)
+    
+    conn.commit()
+    conn.close()
+
+def build_search_query(query, columns):
+    """Build the filtered /api/search SQL (without ORDER BY/LIMIT).
+    
+    Shared by /api/search and /api/export so both accept the same
+    q, type, province, topic, service and concept filters. The result
+    rows carry `columns` plus a `rank` column.
+    """
+    q = query.get('q', [''])[0]
+    type_filter = query.get('type', [None])[0]
+    province_filter = query.get('province', [None])[0]
+    topic_filter = query.get('topic', [None])[0]
+    service_filter = query.get('service', [None])[0]
+    concept_filter = query.get('concept', [None])[0]
+    
+    if q:
+        # FTS search with English-German translation support
+        import re
+        
+        EN_DE = {
+            'groundwater': 'grundwasser', 'water': 'wasser', 'soil': 'boden',
+            'forest': 'wald', 'elevation': 'höhe', 'flood': 'hochwasser',
+            'protection': 'schutz', 'cadastre': 'kataster', 'address': 'adresse',
+            'building': 'gebäude', 'population': 'bevölkerung', 'nature': 'natur',
+            'climate': 'klima', 'river': 'fluss', 'lake': 'see', 'quality': 'qualität',
+            'agriculture': 'landwirtschaft', 'precipitation': 'niederschlag',
+        }
+        
+        clean_q = re.sub(r'[/\\\-]', ' ', q)
+        terms = [t for t in clean_q.strip().lower().split() if t and len(t) > 1]
+        
+        # Expand with German translations
+        expanded = []
+        for t in terms:
+            expanded.append(t)
+            if t in EN_DE:
+                expanded.append(EN_DE[t])
+        
+        if expanded:
+            fts_query = ' OR '.join(f'"{t}"*' for t in expanded)
+            sql = f'''
+                SELECT {columns}, fts.rank
+                FROM datasets d
+                JOIN datasets_fts fts ON d.id = fts.id
+                WHERE datasets_fts MATCH ?
+            '''
+            params = [fts_query]
+        else:
+            sql = f'''
+                SELECT {columns}, 0 as rank FROM datasets d
+                WHERE LOWER(d.title) LIKE ? OR LOWER(d.abstract) LIKE ?
+            '''
+            params = [f'%{q.lower()}%', f'%{q.lower()}%']
+    else:
+        sql = f'SELECT {columns}, 0 as rank FROM datasets d WHERE 1=1'
+        params = []
+    
+    if type_filter:
+        sql += ' AND d.type = ?'
+        params.append(type_filter)
+    
+    if province_filter:
+        sql += ' AND d.province = ?'
+        params.append(province_filter)
+    
+    if topic_filter:
+        sql += ' AND d.id IN (SELECT dataset_id FROM dataset_topics WHERE topic = ?)'
+        params.append(topic_filter)
+    
+    if service_filter:
+        sql += ' AND d.id IN (SELECT dataset_id FROM dataset_services WHERE service_type = ?)'
+        params.append(service_filter)
+    
+    if concept_filter:
+        sql += ' AND d.id IN (SELECT dataset_id FROM dataset_concepts WHERE concept_id = ?)'
+        params.append(concept_filter)
+    
+    return sql, params
+
+def bbox_geometry(bbox):
+    """Turn a stored bbox (GeoJSON geometry or [minx, miny, maxx, maxy]) into a geometry."""
+    if isinstance(bbox, dict) and 'type' in bbox and 'coordinates' in bbox:
+        return bbox
+    if isinstance(bbox, list) and len(bbox) == 4 and all(isinstance(v, (int, float)) for v in bbox):
+        minx, miny, maxx, maxy = bbox
+        return {'type': 'Polygon', 'coordinates': [[[minx, miny], [maxx, miny], [maxx, maxy], [minx, maxy], [minx, miny]]]}
+    return None
+
+def csv_row(doc):
+    """Flatten a dataset document into CSV_COLUMNS values."""
+    row = []
+    for col in CSV_COLUMNS:
+        value = doc.get(col)
+        if col == 'services':
+            value = ' | '.join(f"{s['type']} {s['url']}" for s in value or [])
+        elif isinstance(value, list):
+            value = ' | '.join(value)
+        row.append(value)
+    return row
+
 class InspireHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 for keep-alive and chunked streaming; every response sets Content-Length
+    protocol_version = 'HTTP/1.1'
+    
     def send_json(self, data, status=200):
+        self.send_json_bytes(json.dumps(data, ensure_ascii=False).encode('utf-8'), status)
+    
+    def send_json_bytes(self, body, status=200, content_type='application/json; charset=utf-8'):
+        """Send an already-encoded JSON body."""
+        batch = getattr(self, 'batch_responses', None)
+        if batch is not None:
+            batch.append((status, body))
+            return
         self.send_response(status)
-        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Type', content_type)
         self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Content-Length', str(len(body)))
         self.end_headers()
-        self.wfile.write(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+        self.wfile.write(body)
+    
+    def start_chunked(self, content_type, headers=None, status=200):
+        """Send headers for a streamed response; body follows via write_chunk()."""
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+    
+    def write_chunk(self, data):
+        if data:
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+            self.wfile.flush()
+    
+    def end_chunked(self):
+        self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
+    
+    def send_list(self, data, key, query):
+        """Send a response holding a list of records under data[key].
+        
+        With ?format=compact the list is sent column-oriented instead of
+        repeating the object keys in every record.
+        """
+        if query.get('format', [''])[0] == 'compact':
+            data[key] = compact_records(data[key])
+        self.send_json(data)
     
     def send_html(self, content):
+        body = content.encode('utf-8')
         self.send_response(200)
         self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
         self.end_headers()
-        self.wfile.write(content.encode('utf-8'))
+        self.wfile.write(body)
     
     def send_file(self, filepath, content_type):
         try:
@@ -37,6 +383,7 @@ class InspireHandler(BaseHTTPRequestHandler):
                 content = f.read()
             self.send_response(200)
             self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(content)))
             self.end_headers()
             self.wfile.write(content)
         except FileNotFoundError:
@@ -47,6 +394,7 @@ class InspireHandler(BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Content-Length', '0')
         self.end_headers()
     
     def do_POST(self):
@@ -57,6 +405,8 @@ class InspireHandler(BaseHTTPRequestHandler):
         
         if path == '/api/feedback':
             self.handle_feedback(query)
+        elif path == '/api/batch':
+            self.handle_batch()
         else:
             self.send_error(404, 'POST not supported for this endpoint')
     
@@ -73,13 +423,26 @@ class InspireHandler(BaseHTTPRequestHandler):
         elif path == '/app.js':
             self.send_file('static/app.js', 'application/javascript')
         
+        # OGC API Features facade over the local layer mirror
+        elif path == '/ogc' or path.startswith('/ogc/'):
+            self.route_ogc(path, query)
+        
         # API endpoints
-        elif path == '/api/search':
+        elif not self.route_api(path, query):
+            self.send_error(404)
+    
+    def route_api(self, path, query):
+        """Dispatch an API path; returns False if the path is unknown."""
+        if path == '/api/search':
             self.handle_search(query)
+        elif path == '/api/export':
+            self.handle_export(query)
+        elif path == '/api/changes':
+            self.handle_changes(query)
         elif path == '/api/dataset':
             self.handle_dataset(query)
         elif path == '/api/topics':
-            self.handle_topics()
+            self.handle_topics(query)
         elif path == '/api/gems':
             self.handle_gems(query)
         elif path == '/api/summary':
@@ -96,12 +459,14 @@ class InspireHandler(BaseHTTPRequestHandler):
             self.handle_coverage(query)
         elif path == '/api/validation':
             self.handle_validation()
+        elif path == '/api/payload-sizes':
+            self.handle_payload_sizes()
         elif path == '/api/schema':
             self.handle_schema(query)
         elif path == '/api/autocomplete':
             self.handle_autocomplete(query)
         elif path == '/api/browse':
-            self.handle_browse()
+            self.handle_browse(query)
         elif path == '/api/feedback':
             self.handle_feedback(query)
         elif path == '/api/status':
@@ -110,87 +475,30 @@ class InspireHandler(BaseHTTPRequestHandler):
             self.handle_fields(query)
         elif path == '/api/combine':
             self.handle_combine(query)
+        elif path == '/api/combine/execute':
+            self.handle_combine_execute(query)
         elif path == '/api/smart-search':
             self.handle_smart_search(query)
         else:
-            self.send_error(404)
+            return False
+        return True
     
     def handle_search(self, query):
         """Full-text search for datasets."""
-        q = query.get('q', [''])[0]
         limit = int(query.get('limit', ['50'])[0])
         offset = int(query.get('offset', ['0'])[0])
-        type_filter = query.get('type', [None])[0]
-        province_filter = query.get('province', [None])[0]
-        topic_filter = query.get('topic', [None])[0]
-        service_filter = query.get('service', [None])[0]
-        concept_filter = query.get('concept', [None])[0]
+        
+        try:
+            fields = parse_fields(query, list(SEARCH_COLUMNS))
+        except ValueError as e:
+            self.send_json({'error': str(e)}, 400)
+            return
+        columns = ', '.join(['d.id AS id'] + [f'{SEARCH_COLUMNS[f]} AS {f}' for f in fields if SEARCH_COLUMNS[f] and f != 'id'])
+        sql, params = build_search_query(query, columns)
         
         conn = get_db()
         cur = conn.cursor()
         
-        if q:
-            # FTS search with English-German translation support
-            import re
-            
-            EN_DE = {
-                'groundwater': 'grundwasser', 'water': 'wasser', 'soil': 'boden',
-                'forest': 'wald', 'elevation': 'höhe', 'flood': 'hochwasser',
-                'protection': 'schutz', 'cadastre': 'kataster', 'address': 'adresse',
-                'building': 'gebäude', 'population': 'bevölkerung', 'nature': 'natur',
-                'climate': 'klima', 'river': 'fluss', 'lake': 'see', 'quality': 'qualität',
-                'agriculture': 'landwirtschaft', 'precipitation': 'niederschlag',
-            }
-            
-            clean_q = re.sub(r'[/\\\-]', ' ', q)
-            terms = [t for t in clean_q.strip().lower().split() if t and len(t) > 1]
-            
-            # Expand with German translations
-            expanded = []
-            for t in terms:
-                expanded.append(t)
-                if t in EN_DE:
-                    expanded.append(EN_DE[t])
-            
-            if expanded:
-                fts_query = ' OR '.join(f'"{t}"*' for t in expanded)
-                sql = '''
-                    SELECT d.*, fts.rank
-                    FROM datasets d
-                    JOIN datasets_fts fts ON d.id = fts.id
-                    WHERE datasets_fts MATCH ?
-                '''
-                params = [fts_query]
-            else:
-                sql = '''
-                    SELECT d.*, 0 as rank FROM datasets d
-                    WHERE LOWER(d.title) LIKE ? OR LOWER(d.abstract) LIKE ?
-                '''
-                params = [f'%{q.lower()}%', f'%{q.lower()}%']
-        else:
-            sql = 'SELECT d.*, 0 as rank FROM datasets d WHERE 1=1'
-            params = []
-        
-        if type_filter:
-            sql += ' AND d.type = ?'
-            params.append(type_filter)
-        
-        if province_filter:
-            sql += ' AND d.province = ?'
-            params.append(province_filter)
-        
-        if topic_filter:
-            sql += ' AND d.id IN (SELECT dataset_id FROM dataset_topics WHERE topic = ?)'
-            params.append(topic_filter)
-        
-        if service_filter:
-            sql += ' AND d.id IN (SELECT dataset_id FROM dataset_services WHERE service_type = ?)'
-            params.append(service_filter)
-        
-        if concept_filter:
-            sql += ' AND d.id IN (SELECT dataset_id FROM dataset_concepts WHERE concept_id = ?)'
-            params.append(concept_filter)
-        
         # Count total
         count_sql = f'SELECT COUNT(*) FROM ({sql})'
         cur.execute(count_sql, params)
@@ -203,127 +511,336 @@ class InspireHandler(BaseHTTPRequestHandler):
         cur.execute(sql, params)
         rows = cur.fetchall()
         
+        # Load requested relations for the whole page at once
+        ids = [row['id'] for row in rows]
+        placeholders = ','.join('?' * len(ids))
+        related = {}
+        if ids and 'themes' in fields:
+            cur.execute(f'SELECT dataset_id, theme FROM dataset_themes WHERE dataset_id IN ({placeholders})', ids)
+            for r in cur.fetchall():
+                related.setdefault(('themes', r[0]), []).append(r[1])
+        if ids and 'topics' in fields:
+            cur.execute(f'SELECT dataset_id, topic FROM dataset_topics WHERE dataset_id IN ({placeholders})', ids)
+            for r in cur.fetchall():
+                related.setdefault(('topics', r[0]), []).append(r[1])
+        if ids and 'services' in fields:
+            cur.execute(f'SELECT dataset_id, service_type, url FROM dataset_services WHERE dataset_id IN ({placeholders})', ids)
+            for r in cur.fetchall():
+                related.setdefault(('services', r[0]), []).append({'type': r[1], 'url': r[2]})
+        
         results = []
         for row in rows:
-            ds_id = row['id']
-            
-            # Get themes, topics, services
-            cur.execute('SELECT theme FROM dataset_themes WHERE dataset_id = ?', (ds_id,))
-            themes = [r[0] for r in cur.fetchall()]
-            
-            cur.execute('SELECT topic FROM dataset_topics WHERE dataset_id = ?', (ds_id,))
-            topics = [r[0] for r in cur.fetchall()]
+            result = {}
+            for f in fields:
+                if SEARCH_COLUMNS[f] is None:
+                    result[f] = related.get((f, row['id']), [])
+                elif f == 'is_open_data':
+                    result[f] = bool(row[f])
+                else:
+                    result[f] = row[f]
+            results.append(result)
+        
+        conn.close()
+        self.send_list({'total': total, 'results': results}, 'results', query)
+    
+    def handle_export(self, query):
+        """Stream the catalog or a filtered subset: /api/export?format=ndjson|csv|geojson
+        
+        Accepts the same filters as /api/search (q, type, province, topic,
+        service, concept) plus optional limit/offset. Rows are read from
+        the cursor in batches and written as chunks, so memory stays
+        constant and the first bytes go out immediately.
+        """
+        fmt = query.get('format', ['ndjson'])[0]
+        if fmt not in EXPORT_TYPES:
+            self.send_json({'error': f"format must be one of: {', '.join(EXPORT_TYPES)}"}, 400)
+            return
+        
+        sql, params = build_search_query(query, '(SELECT doc FROM dataset_docs WHERE dataset_id = d.id) AS doc')
+        sql += ' ORDER BY d.gem_score DESC, rank'
+        if query.get('limit') or query.get('offset'):
+            sql += ' LIMIT ? OFFSET ?'
+            params.extend([int(query.get('limit', ['-1'])[0]), int(query.get('offset', ['0'])[0])])
+        
+        conn = get_db()
+        cur = conn.cursor()
+        conn.execute('BEGIN')  # one snapshot for the change sequence and the rows
+        cur.execute('SELECT COALESCE(MAX(seq), 0) FROM dataset_changes')
+        change_seq = cur.fetchone()[0]
+        cur.execute(sql, params)
+        
+        self.start_chunked(EXPORT_TYPES[fmt], {'X-Change-Seq': str(change_seq)})
+        try:
+            if fmt == 'csv':
+                buf = io.StringIO()
+                csv.writer(buf).writerow(CSV_COLUMNS)
+                self.write_chunk(buf.getvalue().encode('utf-8'))
+            elif fmt == 'geojson':
+                self.write_chunk(b'{"type": "FeatureCollection", "features": [\n')
             
-            cur.execute('SELECT service_type, url FROM dataset_services WHERE dataset_id = ?', (ds_id,))
-            services = [{'type': r[0], 'url': r[1]} for r in cur.fetchall()]
+            first = True
+            while True:
+                rows = cur.fetchmany(EXPORT_BATCH)
+                if not rows:
+                    break
+                # Datasets without a built document (index mid-rebuild) are skipped
+                docs = [row['doc'] for row in rows if row['doc']]
+                if not docs:
+                    continue
+                
+                if fmt == 'ndjson':
+                    # Documents are stored encoded; pass them through as lines
+                    chunk = b'\n'.join(docs) + b'\n'
+                elif fmt == 'csv':
+                    buf = io.StringIO()
+                    writer = csv.writer(buf)
+                    for raw in docs:
+                        writer.writerow(csv_row(json.loads(raw)))
+                    chunk = buf.getvalue().encode('utf-8')
+                else:
+                    features = []
+                    for raw in docs:
+                        doc = json.loads(raw)
+                        geometry = bbox_geometry(doc.pop('bbox', None))
+                        features.append(json.dumps({'type': 'Feature', 'id': doc['id'], 'geometry': geometry,
+                                                    'properties': doc}, ensure_ascii=False).encode('utf-8'))
+                    chunk = (b'' if first else b',\n') + b',\n'.join(features)
+                
+                self.write_chunk(chunk)
+                first = False
             
-            results.append({
-                'id': row['id'],
-                'title': row['title'],
-                'abstract': row['abstract'][:500] if row['abstract'] else '',
-                'type': row['type'],
-                'province': row['province'],
-                'year': row['year'],
-                'themes': themes,
-                'topics': topics,
-                'services': services,
-                'gem_score': row['gem_score'],
-                'is_open_data': bool(row['is_open_data']),
-                'org': row['org']
-            })
+            if fmt == 'geojson':
+                self.write_chunk(b'\n]}\n')
+            self.end_chunked()
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        finally:
+            conn.close()
+    
+    def handle_changes(self, query):
+        """Get catalog changes after a sequence number.
+        
+        GET /api/changes?since=SEQ&limit=N[&include=doc]
+        
+        Returns events with seq > since in order, at most `limit` (default
+        and max 1000). Continue with since=next while has_more is true.
+        A full mirror starts from /api/export, whose X-Change-Seq header
+        gives the sequence number to continue from.
+        """
+        try:
+            since = int(query.get('since', ['0'])[0])
+            limit = min(int(query.get('limit', [str(MAX_CHANGES)])[0]), MAX_CHANGES)
+        except ValueError:
+            self.send_json({'error': 'since and limit must be integers'}, 400)
+            return
+        if limit < 1:
+            self.send_json({'error': 'limit must be a positive integer'}, 400)
+            return
+        include_docs = query.get('include', [''])[0] == 'doc'
         
+        conn = get_db()
+        cur = conn.cursor()
+        
+        cur.execute('''
+            SELECT seq, dataset_id, change_type, version, details, changed_at
+            FROM dataset_changes WHERE seq > ?
+            ORDER BY seq LIMIT ?
+        ''', (since, limit + 1))
+        rows = cur.fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        changes = [{
+            'seq': r[0], 'id': r[1], 'type': r[2], 'version': r[3],
+            'details': json.loads(r[4]) if r[4] else None, 'at': r[5]
+        } for r in rows]
+        
+        if include_docs:
+            ids = list({c['id'] for c in changes if c['type'] in ('added', 'modified')})
+            docs = {}
+            if ids:
+                placeholders = ','.join('?' * len(ids))
+                cur.execute(f'SELECT dataset_id, doc FROM dataset_docs WHERE dataset_id IN ({placeholders})', ids)
+                docs = {r[0]: json.loads(r[1]) for r in cur.fetchall()}
+            for c in changes:
+                if c['type'] in ('added', 'modified'):
+                    c['doc'] = docs.get(c['id'])
+        
+        cur.execute('SELECT COALESCE(MAX(seq), 0) FROM dataset_changes')
+        latest = cur.fetchone()[0]
         conn.close()
-        self.send_json({'total': total, 'results': results})
+        
+        self.send_list({
+            'since': since,
+            'next': changes[-1]['seq'] if changes else since,
+            'has_more': has_more,
+            'latest': latest,
+            'changes': changes
+        }, 'changes', query)
     
     def handle_dataset(self, query):
-        """Get full dataset details."""
+        """Get full dataset details.
+        
+        Serves the document precomputed by build_index.py; only the live
+        service_status is merged in at request time. ?ids=a,b,c fetches
+        several datasets with set-based queries. ?raw=1 returns the full
+        original catalog record instead.
+        """
+        if query.get('ids'):
+            self.handle_datasets(query)
+            return
+        
         ds_id = query.get('id', [None])[0]
         if not ds_id:
             self.send_json({'error': 'id required'}, 400)
             return
         
+        if query.get('raw', [''])[0] in ('1', 'true'):
+            record = raw_store.get_bytes(ds_id)
+            if record is None:
+                self.send_json({'error': 'not found'}, 404)
+            else:
+                self.send_json_bytes(record)
+            return
+        
         conn = get_db()
         cur = conn.cursor()
         
-        cur.execute('SELECT * FROM datasets WHERE id = ?', (ds_id,))
+        cur.execute('SELECT doc FROM dataset_docs WHERE dataset_id = ?', (ds_id,))
         row = cur.fetchone()
         
         if not row:
+            conn.close()
             self.send_json({'error': 'not found'}, 404)
             return
         
-        # Get all related data
-        cur.execute('SELECT theme FROM dataset_themes WHERE dataset_id = ?', (ds_id,))
-        themes = [r[0] for r in cur.fetchall()]
-        
-        cur.execute('SELECT topic FROM dataset_topics WHERE dataset_id = ?', (ds_id,))
-        topics = [r[0] for r in cur.fetchall()]
-        
-        cur.execute('SELECT keyword FROM dataset_keywords WHERE dataset_id = ?', (ds_id,))
-        keywords = [r[0] for r in cur.fetchall()]
-        
-        cur.execute('SELECT service_type, url, protocol FROM dataset_services WHERE dataset_id = ?', (ds_id,))
-        services = []
-        for r in cur.fetchall():
-            svc = {'type': r[0], 'url': r[1], 'protocol': r[2]}
-            # Detect download format from URL
-            url_lower = r[1].lower() if r[1] else ''
-            if '.gpkg' in url_lower or 'geopackage' in url_lower:
-                svc['format'] = 'GeoPackage'
-            elif '.zip' in url_lower:
-                svc['format'] = 'ZIP'
-            elif '.geojson' in url_lower or 'geojson' in url_lower:
-                svc['format'] = 'GeoJSON'
-            elif '.gml' in url_lower:
-                svc['format'] = 'GML'
-            elif '.shp' in url_lower or 'shapefile' in url_lower:
-                svc['format'] = 'Shapefile'
-            elif '.csv' in url_lower:
-                svc['format'] = 'CSV'
-            services.append(svc)
-        
-        # Also get service status if available
         cur.execute('''
             SELECT service_url, status, sample_fields, last_checked 
             FROM service_status WHERE dataset_id = ?
         ''', (ds_id,))
-        status_map = {r[0]: {'status': r[1], 'fields': json.loads(r[2]) if r[2] else None, 'last_checked': r[3]} for r in cur.fetchall()}
+        status_rows = cur.fetchall()
+        layers = layer_sizes(cur, [ds_id]).get(ds_id)
+        conn.close()
+        
+        self.send_json_bytes(merge_service_status(row[0], status_rows, layers))
+    
+    def handle_datasets(self, query):
+        """Get details for several datasets: /api/dataset?ids=a,b,c"""
+        ids = query.get('ids', [''])[0].split(',')
+        ids = list(dict.fromkeys(i.strip() for i in ids if i.strip()))
+        
+        if not ids:
+            self.send_json({'error': 'ids required'}, 400)
+            return
+        if len(ids) > MAX_IDS:
+            self.send_json({'error': f'at most {MAX_IDS} ids per request'}, 400)
+            return
         
-        # Merge status into services
-        for svc in services:
-            if svc['url'] in status_map:
-                svc.update(status_map[svc['url']])
+        conn = get_db()
+        cur = conn.cursor()
+        placeholders = ','.join('?' * len(ids))
         
-        cur.execute('SELECT format FROM dataset_formats WHERE dataset_id = ?', (ds_id,))
-        formats = [r[0] for r in cur.fetchall()]
+        cur.execute(f'SELECT dataset_id, doc FROM dataset_docs WHERE dataset_id IN ({placeholders})', ids)
+        docs = dict(cur.fetchall())
         
-        result = {
-            'id': row['id'],
-            'uuid': row['uuid'],
-            'title': row['title'],
-            'abstract': row['abstract'],
-            'type': row['type'],
-            'province': row['province'],
-            'year': row['year'],
-            'themes': themes,
-            'topics': topics,
-            'keywords': keywords,
-            'services': services,
-            'formats': formats,
-            'gem_score': row['gem_score'],
-            'is_open_data': bool(row['is_open_data']),
-            'org': row['org'],
-            'contact': row['contact'],
-            'create_date': row['create_date'],
-            'update_date': row['update_date'],
-            'bbox': json.loads(row['bbox']) if row['bbox'] else None,
-            'inspire_url': f"https://geometadatensuche.inspire.gv.at/metadatensuche/inspire/ger/catalog.search#/metadata/{row['uuid']}"
+        cur.execute(f'''
+            SELECT dataset_id, service_url, status, sample_fields, last_checked
+            FROM service_status WHERE dataset_id IN ({placeholders})
+        ''', ids)
+        status_by_id = {}
+        for r in cur.fetchall():
+            status_by_id.setdefault(r[0], []).append(r[1:])
+        sizes = layer_sizes(cur, ids)
+        conn.close()
+        
+        found = [merge_service_status(docs[i], status_by_id.get(i), sizes.get(i)) for i in ids if i in docs]
+        missing = [i for i in ids if i not in docs]
+        
+        if query.get('fields') or query.get('format'):
+            datasets = [json.loads(doc) for doc in found]
+            try:
+                fields = parse_fields(query, list(datasets[0])) if datasets else []
+            except ValueError as e:
+                self.send_json({'error': str(e)}, 400)
+                return
+            datasets = [{f: ds.get(f) for f in fields} for ds in datasets]
+            self.send_list({'datasets': datasets, 'missing': missing}, 'datasets', query)
+            return
+        
+        # Documents are already encoded, so assemble the response as bytes
+        body = (b'{"datasets": [' + b', '.join(found) + b'], "missing": ' +
+                json.dumps(missing, ensure_ascii=False).encode('utf-8') + b'}')
+        self.send_json_bytes(body)
+    
+    def handle_batch(self):
+        """Run several read-only API calls in one round-trip.
+        
+        POST /api/batch with JSON body:
+        {
+            "requests": [
+                "/api/dataset?id=UUID",
+                {"path": "/api/search", "params": {"q": "wald", "limit": 5}}
+            ]
         }
         
-        conn.close()
-        self.send_json(result)
+        All sub-requests share one database snapshot. Returns
+        {"responses": [{"path": ..., "status": ..., "body": ...}, ...]}
+        in request order.
+        """
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+            data = json.loads(self.rfile.read(content_length).decode('utf-8'))
+            calls = data['requests']
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_json({'error': f'invalid batch body: {e}'}, 400)
+            return
+        
+        if not isinstance(calls, list) or len(calls) > MAX_BATCH:
+            self.send_json({'error': f'requests must be a list of at most {MAX_BATCH} calls'}, 400)
+            return
+        
+        conn = get_db()
+        conn.execute('BEGIN')
+        conn.execute('SELECT COUNT(*) FROM sqlite_master')  # pin the read snapshot now
+        _local.snapshot = conn
+        self.batch_responses = []
+        parts = []
+        
+        try:
+            for req in calls:
+                if isinstance(req, str):
+                    parsed = urlparse(req)
+                    path, query = parsed.path, parse_qs(parsed.query)
+                else:
+                    path = req.get('path', '')
+                    params = req.get('params') or {}
+                    query = {k: [str(x) for x in v] if isinstance(v, list) else [str(v)]
+                             for k, v in params.items()}
+                
+                if not path.startswith('/api/') or path in BATCH_EXCLUDED:
+                    self.send_json({'error': 'not allowed in batch'}, 400)
+                else:
+                    try:
+                        if not self.route_api(path, query):
+                            self.send_json({'error': 'unknown endpoint'}, 404)
+                    except Exception as e:
+                        self.send_json({'error': str(e)}, 500)
+                
+                if self.batch_responses:
+                    status, body = self.batch_responses.pop()
+                else:
+                    status, body = 500, b'{"error": "no response"}'
+                parts.append(b'{"path": ' + json.dumps(path, ensure_ascii=False).encode('utf-8') +
+                             b', "status": ' + str(status).encode() + b', "body": ' + body + b'}')
+        finally:
+            self.batch_responses = None
+            _local.snapshot = None
+            conn.rollback()
+            conn.close()
+        
+        self.send_json_bytes(b'{"responses": [' + b', '.join(parts) + b']}')
     
-    def handle_topics(self):
+    def handle_topics(self, query):
         """Get all topics with counts."""
         conn = get_db()
         cur = conn.cursor()
@@ -337,34 +854,41 @@ class InspireHandler(BaseHTTPRequestHandler):
         topics = [{'topic': r[0], 'count': r[1]} for r in cur.fetchall()]
         
         conn.close()
-        self.send_json({'topics': topics})
+        self.send_list({'topics': topics}, 'topics', query)
     
     def handle_gems(self, query):
         """Get top gems, optionally random selection."""
         limit = int(query.get('limit', ['10'])[0])
         random_selection = query.get('random', ['false'])[0] == 'true'
         
+        try:
+            fields = parse_fields(query, list(GEM_COLUMNS))
+        except ValueError as e:
+            self.send_json({'error': str(e)}, 400)
+            return
+        columns = ', '.join(f'{GEM_COLUMNS[f]} AS {f}' for f in fields)
+        
         conn = get_db()
         cur = conn.cursor()
         
         if random_selection:
             # Get all gems with score >= 8, then random sample
-            cur.execute('SELECT id, title, gem_score, province FROM datasets WHERE gem_score >= 8')
+            cur.execute(f'SELECT {columns} FROM datasets WHERE gem_score >= 8')
             all_gems = cur.fetchall()
             selected = random.sample(all_gems, min(limit, len(all_gems)))
-            gems = [{'id': g[0], 'title': g[1], 'score': g[2], 'province': g[3]} for g in selected]
         else:
-            cur.execute('''
-                SELECT id, title, gem_score, province 
+            cur.execute(f'''
+                SELECT {columns}
                 FROM datasets 
                 WHERE gem_score >= 6
                 ORDER BY gem_score DESC 
                 LIMIT ?
             ''', (limit,))
-            gems = [{'id': r[0], 'title': r[1], 'score': r[2], 'province': r[3]} for r in cur.fetchall()]
+            selected = cur.fetchall()
+        gems = [dict(zip(fields, r)) for r in selected]
         
         conn.close()
-        self.send_json({'gems': gems})
+        self.send_list({'gems': gems}, 'gems', query)
     
     def handle_summary(self):
         """Get index summary."""
@@ -454,19 +978,25 @@ class InspireHandler(BaseHTTPRequestHandler):
         
         conn = get_db()
         cur = conn.cursor()
+        placeholders = ','.join('?' * len(ids))
+        
+        cur.execute(f'SELECT id, title, type, province FROM datasets WHERE id IN ({placeholders})', ids)
+        rows = {r[0]: r for r in cur.fetchall()}
+        
+        cur.execute(f'SELECT dataset_id, service_type, url FROM dataset_services WHERE dataset_id IN ({placeholders})', ids)
+        services_by_id = {}
+        for r in cur.fetchall():
+            services_by_id.setdefault(r[0], []).append({'type': r[1], 'url': r[2]})
         
         datasets_info = []
         for ds_id in ids:
-            cur.execute('SELECT title, type, province FROM datasets WHERE id = ?', (ds_id,))
-            row = cur.fetchone()
+            row = rows.get(ds_id)
             if row:
-                cur.execute('SELECT service_type, url FROM dataset_services WHERE dataset_id = ?', (ds_id,))
-                services = [{'type': r[0], 'url': r[1]} for r in cur.fetchall()]
                 datasets_info.append({
-                    'title': row[0],
-                    'type': row[1],
-                    'province': row[2],
-                    'services': services
+                    'title': row[1],
+                    'type': row[2],
+                    'province': row[3],
+                    'services': services_by_id.get(ds_id, [])
                 })
         
         conn.close()
@@ -506,14 +1036,25 @@ class InspireHandler(BaseHTTPRequestHandler):
                 },
                 'endpoints': {
                     'search': '/api/llm?action=search&q=QUERY - Search datasets (returns compact results)',
+                    'export': '/api/export?format=ndjson|csv|geojson - Stream the full catalog (same filters as /api/search)',
+                    'changes': '/api/changes?since=SEQ - Catalog changes since a sequence number (incremental sync)',
                     'concept': '/api/llm?action=concept&id=ID - Get all datasets for a concept (e.g., grundwasser, wald)',
                     'combine': '/api/combine?concept=ID - Get combination analysis with WFS URLs and field mappings',
+                    'combine_execute': '/api/combine/execute?concept=ID&format=geojson|ndjson - Stream the merged, '
+                                       'harmonized layers with a bundesland column; the last record reports each source',
                     'services': '/api/llm?action=services&type=WFS|WMS|OGC-API - List available services',
                     'gems': '/api/llm?action=gems - Top quality datasets',
-                    'access': '/api/llm?action=access&id=UUID - Get service URLs for a specific dataset',
+                    'access': '/api/llm?action=access&id=UUID - Get service URLs for a specific dataset, with layer sizes',
+                    'datasets': '/api/dataset?ids=UUID1,UUID2 - Full details for several datasets in one request',
+                    'raw': '/api/dataset?id=UUID&raw=1 - Complete original catalog record (all metadata fields)',
+                    'batch': 'POST /api/batch {"requests": ["/api/...", ...]} - Run several read-only calls in one round-trip',
+                    'projection': 'Add fields=a,b to /api/search, /api/gems, /api/dataset?ids= to get only those fields',
+                    'compact': 'Add format=compact to any list endpoint for column-oriented {"cols", "rows"} lists',
                     'concepts': '/api/concepts - List all 44 concepts with coverage stats',
                     'coverage': '/api/coverage?concept=ID - Provincial coverage for a concept',
                     'schema': '/api/schema?id=UUID - Get WFS field schema for a dataset',
+                    'mirror': '/ogc/collections - Local copies of small WFS/OGC API layers, served as OGC API Features '
+                              '(/ogc/collections/ID/items?bbox=minx,miny,maxx,maxy&limit=&offset=)',
                     'fields': '/api/fields - Canonical field mappings across provinces'
                 },
                 'key_concepts': [
@@ -545,9 +1086,11 @@ class InspireHandler(BaseHTTPRequestHandler):
                     }
                 },
                 'known_issues': [
-                    'WFS at gis.lfrz.gv.at often times out - prefer Download URLs or OGC API',
+                    'WFS at gis.lfrz.gv.at often times out - prefer a local copy (layers[].mirror, /ogc/collections), '
+                    'Download URLs or OGC API',
                     'haleconnect.com WFS may return empty feature lists',
-                    'Large OGC API requests (>1000 features) may fail - use pagination',
+                    f'Large layers may fail in one request - check layers[].features in /api/combine or '
+                    f'size in action=access and page anything over {PAGE_FEATURES} features',
                     'Check /api/status for current service health'
                 ]
             })
@@ -566,7 +1109,7 @@ class InspireHandler(BaseHTTPRequestHandler):
             ''', (q,))
             results = [{'id': r[0], 't': r[1], 'type': r[2], 'prov': r[3], 'gem': r[4]} for r in cur.fetchall()]
             conn.close()
-            self.send_json({'q': q, 'n': len(results), 'r': results})
+            self.send_list({'q': q, 'n': len(results), 'r': results}, 'r', query)
         
         elif action == 'topic':
             name = query.get('name', [''])[0]
@@ -582,7 +1125,7 @@ class InspireHandler(BaseHTTPRequestHandler):
             ''', (name,))
             results = [{'id': r[0], 't': r[1], 'type': r[2], 'prov': r[3]} for r in cur.fetchall()]
             conn.close()
-            self.send_json({'topic': name, 'n': len(results), 'r': results})
+            self.send_list({'topic': name, 'n': len(results), 'r': results}, 'r', query)
         
         elif action == 'services':
             svc_type = query.get('type', ['WFS'])[0]
@@ -598,7 +1141,7 @@ class InspireHandler(BaseHTTPRequestHandler):
             ''', (svc_type,))
             results = [{'id': r[0], 't': r[1], 'url': r[2]} for r in cur.fetchall()]
             conn.close()
-            self.send_json({'type': svc_type, 'n': len(results), 'r': results})
+            self.send_list({'type': svc_type, 'n': len(results), 'r': results}, 'r', query)
         
         elif action == 'gems':
             conn = get_db()
@@ -612,29 +1155,33 @@ class InspireHandler(BaseHTTPRequestHandler):
             ''')
             results = [{'id': r[0], 't': r[1], 'gem': r[2], 'prov': r[3]} for r in cur.fetchall()]
             conn.close()
-            self.send_json({'n': len(results), 'r': results})
+            self.send_list({'n': len(results), 'r': results}, 'r', query)
         
         elif action == 'access':
             ds_id = query.get('id', [''])[0]
             conn = get_db()
             cur = conn.cursor()
-            cur.execute('SELECT title, uuid, abstract FROM datasets WHERE id = ?', (ds_id,))
+            cur.execute('SELECT doc FROM dataset_docs WHERE dataset_id = ?', (ds_id,))
             row = cur.fetchone()
+            sizes = layer_sizes(cur, [ds_id]).get(ds_id, [])
+            conn.close()
             if not row:
                 self.send_json({'error': 'not found'}, 404)
                 return
             
-            cur.execute('SELECT service_type, url FROM dataset_services WHERE dataset_id = ?', (ds_id,))
-            services = [{'type': r[0], 'url': r[1]} for r in cur.fetchall()]
-            
-            conn.close()
+            doc = json.loads(row[0])
             self.send_json({
                 'id': ds_id,
-                't': row[0],
-                'uuid': row[1],
-                'abs': row[2][:300] if row[2] else '',
-                'svc': services,
-                'inspire': f"https://geometadatensuche.inspire.gv.at/metadatensuche/inspire/ger/catalog.search#/metadata/{row[1]}"
+                't': doc['title'],
+                'uuid': doc['uuid'],
+                'abs': doc['abstract'][:300] if doc['abstract'] else '',
+                'svc': [{'type': s['type'], 'url': s['url']} for s in doc['services']],
+                # Known feature counts and sizes, to pick paging and formats up front
+                'size': [{
+                    'type': layer['type'], 'url': layer['url'], 'l': layer['layer'], 'n': layer['features'],
+                    'b': layer['bytes'], 'page': layer['paging'], 'mirror': layer['mirror']
+                } for layer in sizes],
+                'inspire': doc['inspire_url']
             })
         
         else:
@@ -718,7 +1265,7 @@ class InspireHandler(BaseHTTPRequestHandler):
         conn.close()
         self.send_json({'suggestions': results})
     
-    def handle_browse(self):
+    def handle_browse(self, query):
         """Get all datasets organized by concept for browsing."""
         conn = get_db()
         cur = conn.cursor()
@@ -818,7 +1365,10 @@ class InspireHandler(BaseHTTPRequestHandler):
         result['stats']['wfs'] = total_wfs
         
         conn.close()
-        self.send_json(result)
+        if query.get('format', [''])[0] == 'compact':
+            for concept in result['concepts']:
+                concept['datasets'] = compact_records(concept['datasets'])
+        self.send_list(result, 'uncategorized', query)
     
     def handle_feedback(self, query):
         """Handle feedback from LLM agents and users.
@@ -914,7 +1464,7 @@ class InspireHandler(BaseHTTPRequestHandler):
                         'processed': bool(r[7])
                     })
             
-            self.send_json({'feedback': feedback, 'count': len(feedback)})
+            self.send_list({'feedback': feedback, 'count': len(feedback)}, 'feedback', query)
     
     def process_feedback_async(self, cur, feedback_id, data):
         """Process feedback immediately where possible."""
@@ -923,6 +1473,13 @@ class InspireHandler(BaseHTTPRequestHandler):
         
         category = data.get('category')
         issue_type = data.get('issue_type')
+        service_url = data.get('service_url')
+        
+        old_status = None
+        if service_url:
+            cur.execute('SELECT status FROM service_status WHERE service_url = ?', (service_url,))
+            row = cur.fetchone()
+            old_status = row[0] if row else None
         
         # Update service_status table if it's service feedback
         if category == 'service' and data.get('service_url'):
@@ -980,6 +1537,13 @@ class InspireHandler(BaseHTTPRequestHandler):
                 1 if issue_type == 'success' else 0
             ))
         
+        # Log status transitions to the change feed
+        if category in ('service', 'schema') and service_url:
+            cur.execute('SELECT dataset_id, status FROM service_status WHERE service_url = ?', (service_url,))
+            row = cur.fetchone()
+            if row:
+                record_status_change(cur, row[0], service_url, old_status, row[1])
+        
         # Mark as processed
         cur.execute('''
             UPDATE feedback SET processed = 1, processed_at = ?, resolution = 'auto-processed'
@@ -1012,8 +1576,24 @@ class InspireHandler(BaseHTTPRequestHandler):
                 'response_time_ms': r[4], 'fields': json.loads(r[5]) if r[5] else None,
                 'error': r[6], 'checks': r[7], 'successes': r[8]
             } for r in rows]
+            
+            # Latest link check per service, from the validator's rollup
+            cur.execute('''
+                SELECT l.url, e.service_type, l.status, l.status_code, l.response_time_ms,
+                       l.error_message, l.validated_at, l.status_since
+                FROM link_status_current l
+                JOIN service_endpoints e ON e.id = l.endpoint_id
+                WHERE l.dataset_id = ?
+                  AND EXISTS (SELECT 1 FROM endpoint_datasets ed
+                              WHERE ed.endpoint_id = l.endpoint_id AND ed.dataset_id = l.dataset_id
+                                AND ed.url = l.url)
+            ''', (dataset_id,))
+            links = [{
+                'url': r[0], 'type': r[1], 'status': r[2], 'status_code': r[3], 'response_time_ms': r[4],
+                'error': r[5], 'validated_at': r[6], 'status_since': r[7]
+            } for r in cur.fetchall()]
             conn.close()
-            self.send_json({'dataset_id': dataset_id, 'services': services})
+            self.send_list({'dataset_id': dataset_id, 'services': services, 'links': links}, 'services', query)
         else:
             # Overall stats
             cur.execute('SELECT status, COUNT(*) FROM service_status GROUP BY status')
@@ -1032,12 +1612,32 @@ class InspireHandler(BaseHTTPRequestHandler):
             cur.execute('SELECT COUNT(*) FROM feedback WHERE processed = 0')
             pending_feedback = cur.fetchone()[0]
             
+            cur.execute('SELECT status, COUNT(*) FROM link_status_current GROUP BY status')
+            link_counts = dict(cur.fetchall())
+            
+            # Host health shared by the crawlers: hosts skipped for now, then the slowest
+            cur.execute('''
+                SELECT host, circuit, latency, error_rate, consecutive_failures,
+                       CASE WHEN circuit != 'closed' THEN datetime(open_until, 'unixepoch') END, updated_at
+                FROM host_health
+                ORDER BY circuit = 'closed', latency DESC
+                LIMIT 20
+            ''')
+            hosts = [{
+                'host': r[0], 'circuit': r[1], 'latency_s': round(r[2], 2) if r[2] is not None else None,
+                'error_rate': round(r[3], 2), 'consecutive_failures': r[4],
+                'open_until': r[5],
+                'updated_at': r[6]
+            } for r in cur.fetchall()]
+            
             conn.close()
             self.send_json({
                 'status_counts': status_counts,
                 'recent_checks': recent_checks,
                 'problem_services': problem_services,
-                'pending_feedback': pending_feedback
+                'pending_feedback': pending_feedback,
+                'link_status_counts': link_counts,
+                'hosts': hosts
             })
     
     def handle_concepts(self, query):
@@ -1071,7 +1671,7 @@ class InspireHandler(BaseHTTPRequestHandler):
             })
         
         conn.close()
-        self.send_json({'concepts': concepts})
+        self.send_list({'concepts': concepts}, 'concepts', query)
     
     def handle_coverage(self, query):
         """Get coverage matrix: concept x province."""
@@ -1153,6 +1753,15 @@ class InspireHandler(BaseHTTPRequestHandler):
         except FileNotFoundError:
             self.send_json({'error': 'No validation results yet'})
     
+    def handle_payload_sizes(self):
+        """Get payload-size measurements written by measure_payloads.py."""
+        try:
+            with open('payload_sizes.json') as f:
+                results = json.load(f)
+            self.send_json(results)
+        except FileNotFoundError:
+            self.send_json({'error': 'No payload measurements yet'})
+    
     def handle_schema(self, query):
         """Get schema info for a dataset.
         
@@ -1168,7 +1777,7 @@ class InspireHandler(BaseHTTPRequestHandler):
         if dataset_id:
             # First check service_status for discovered fields (most reliable)
             cur.execute('''
-                SELECT service_url, service_type, status, sample_fields, last_checked
+                SELECT service_url, service_type, status, sample_fields, last_checked, schema_source
                 FROM service_status
                 WHERE dataset_id = ? AND sample_fields IS NOT NULL
                 ORDER BY status = 'working' DESC, last_checked DESC
@@ -1177,7 +1786,7 @@ class InspireHandler(BaseHTTPRequestHandler):
             discovered = cur.fetchall()
             if discovered:
                 services = []
-                for url, svc_type, status, fields_json, last_checked in discovered:
+                for url, svc_type, status, fields_json, last_checked, schema_source in discovered:
                     fields = json.loads(fields_json) if fields_json else []
                     services.append({
                         'service_url': url,
@@ -1185,7 +1794,8 @@ class InspireHandler(BaseHTTPRequestHandler):
                         'status': status,
                         'fields': fields,
                         'last_checked': last_checked,
-                        'source': 'discovered'
+                        'source': 'discovered',
+                        'schema_source': schema_source
                     })
                 conn.close()
                 self.send_json({
@@ -1200,7 +1810,7 @@ class InspireHandler(BaseHTTPRequestHandler):
                 SELECT ft.type_name, ft.inspire_theme, f.field_name, f.field_type, f.is_geometry
                 FROM wfs_feature_types ft
                 LEFT JOIN wfs_fields f ON ft.id = f.feature_type_id
-                WHERE ft.dataset_id = ?
+                WHERE ft.endpoint_id IN (SELECT endpoint_id FROM endpoint_datasets WHERE dataset_id = ?)
             ''', (dataset_id,))
             
             rows = cur.fetchall()
@@ -1302,7 +1912,7 @@ class InspireHandler(BaseHTTPRequestHandler):
                 })
             
             conn.close()
-            self.send_json({'fields': fields})
+            self.send_list({'fields': fields}, 'fields', query)
     
     def handle_combine(self, query):
         """Analyze how to combine datasets across provinces."""
@@ -1330,7 +1940,8 @@ class InspireHandler(BaseHTTPRequestHandler):
                        GROUP_CONCAT(DISTINCT f.field_name) as fields
                 FROM dataset_concepts dc
                 JOIN datasets d ON dc.dataset_id = d.id
-                LEFT JOIN wfs_feature_types ft ON d.id = ft.dataset_id
+                LEFT JOIN endpoint_datasets ed ON ed.dataset_id = d.id
+                LEFT JOIN wfs_feature_types ft ON ft.endpoint_id = ed.endpoint_id
                 LEFT JOIN wfs_fields f ON ft.id = f.feature_type_id
                 LEFT JOIN dataset_services s ON d.id = s.dataset_id
                 WHERE dc.concept_id = ?
@@ -1345,7 +1956,8 @@ class InspireHandler(BaseHTTPRequestHandler):
                        GROUP_CONCAT(DISTINCT s.service_type) as services,
                        GROUP_CONCAT(DISTINCT f.field_name) as fields
                 FROM datasets d
-                LEFT JOIN wfs_feature_types ft ON d.id = ft.dataset_id
+                LEFT JOIN endpoint_datasets ed ON ed.dataset_id = d.id
+                LEFT JOIN wfs_feature_types ft ON ft.endpoint_id = ed.endpoint_id
                 LEFT JOIN wfs_fields f ON ft.id = f.feature_type_id
                 LEFT JOIN dataset_services s ON d.id = s.dataset_id
                 WHERE d.id IN ({placeholders})
@@ -1357,6 +1969,7 @@ class InspireHandler(BaseHTTPRequestHandler):
             return
         
         rows = cur.fetchall()
+        sizes = layer_sizes(cur, [row[0] for row in rows])
         
         # Analyze compatibility
         datasets = []
@@ -1390,7 +2003,10 @@ class InspireHandler(BaseHTTPRequestHandler):
                 wfs_row = cur.fetchone()
                 if wfs_row:
                     wfs_url = wfs_row[0]
-                    has_wfs.append({'id': ds_id, 'title': title, 'province': province, 'url': wfs_url, 'fields': list(field_set)})
+                    has_wfs.append({
+                        'id': ds_id, 'title': title, 'province': province, 'url': wfs_url, 'fields': list(field_set),
+                        'layers': [layer for layer in sizes.get(ds_id, []) if layer['type'] == 'WFS']
+                    })
             
             datasets.append({
                 'id': ds_id,
@@ -1401,9 +2017,14 @@ class InspireHandler(BaseHTTPRequestHandler):
                 'theme': theme,
                 'services': list(svc_set),
                 'fields': list(field_set),
-                'wfs_url': wfs_url
+                'wfs_url': wfs_url,
+                'layers': sizes.get(ds_id, [])
             })
         
+        # Datasets often share endpoints, so count each layer once
+        counted = {(layer['url'], layer['layer']): layer['features']
+                   for layers in sizes.values() for layer in layers if layer['features'] is not None}
+        
         # Common fields = fields appearing in at least 50% of datasets with schemas
         threshold = max(2, datasets_with_fields * 0.5)
         common_fields = set(f for f, count in field_counts.items() if count >= threshold)
@@ -1444,6 +2065,8 @@ class InspireHandler(BaseHTTPRequestHandler):
                 'common_fields': list(common_fields) if common_fields else [],
                 'all_fields': list(all_fields),
                 'field_mappings': field_mappings,
+                'layers_counted': len(counted),
+                'total_features': sum(counted.values()),
                 'combinable': combinable
             },
             'wfs_services': has_wfs
@@ -1455,6 +2078,70 @@ class InspireHandler(BaseHTTPRequestHandler):
         
         self.send_json(result)
     
+    def handle_combine_execute(self, query):
+        """Fetch and merge a concept's layers: /api/combine/execute?concept=ID&format=geojson|ndjson
+        
+        Also accepts ids=a,b,c instead of a concept, and limit=N features per
+        source (at most federate.MAX_FEATURES). Features are streamed as
+        each source page arrives, renamed to canonical field names. The
+        GeoJSON FeatureCollection ends with a "combine" member, NDJSON with
+        a {"type": "summary"} line, giving per-source status, feature
+        counts and errors; a failed source does not fail the response.
+        """
+        concept_id = query.get('concept', [None])[0]
+        ids = [i.strip() for i in query.get('ids', [''])[0].split(',') if i.strip()]
+        fmt = query.get('format', ['geojson'])[0]
+        if fmt not in ('geojson', 'ndjson'):
+            self.send_json({'error': 'format must be one of: geojson, ndjson'}, 400)
+            return
+        if not concept_id and not ids:
+            self.send_json({'error': 'concept or ids required'}, 400)
+            return
+        try:
+            limit = min(int(query.get('limit', [str(federate.MAX_FEATURES)])[0]), federate.MAX_FEATURES)
+            if limit < 1:
+                raise ValueError
+        except ValueError:
+            self.send_json({'error': 'limit must be a positive integer'}, 400)
+            return
+        
+        conn = get_db()
+        cur = conn.cursor()
+        sources = federate.combine_sources(cur, concept_id, ids[:MAX_IDS], limit)
+        renames = federate.field_renames(cur)
+        conn.close()
+        if not sources:
+            self.send_json({'error': 'no WFS or OGC API layers for these datasets'}, 404)
+            return
+        
+        started = time.time()
+        stop = threading.Event()
+        self.start_chunked(EXPORT_TYPES[fmt], {'X-Combine-Sources': str(len(sources))})
+        try:
+            if fmt == 'geojson':
+                self.write_chunk(b'{"type": "FeatureCollection", "features": [\n')
+            
+            first = True
+            for features in federate.merged_pages(sources, renames, stop):
+                if not features:
+                    continue
+                lines = [json.dumps(f, ensure_ascii=False).encode('utf-8') for f in features]
+                if fmt == 'ndjson':
+                    self.write_chunk(b'\n'.join(lines) + b'\n')
+                else:
+                    self.write_chunk((b'' if first else b',\n') + b',\n'.join(lines))
+                first = False
+            
+            result = federate.summary(sources, started)
+            if fmt == 'geojson':
+                self.write_chunk(b'\n], "combine": ' + json.dumps(result, ensure_ascii=False).encode('utf-8') + b'}\n')
+            else:
+                self.write_chunk(json.dumps({'type': 'summary', **result}, ensure_ascii=False).encode('utf-8') + b'\n')
+            self.end_chunked()
+        except (BrokenPipeError, ConnectionResetError):
+            stop.set()
+            self.close_connection = True
+    
     def generate_combination_prompt(self, concept, wfs_services, common_fields, field_mappings):
         """Generate a Shelley prompt for combining datasets (English)."""
         lines = [f"Combine the following {concept} datasets into an Austria-wide dataset:\n"]
@@ -1464,6 +2151,9 @@ class InspireHandler(BaseHTTPRequestHandler):
             lines.append(f"  WFS: {svc['url']}")
             if svc.get('fields'):
                 lines.append(f"  Fields: {', '.join(svc['fields'][:8])}")
+            for layer in svc.get('layers', [])[:3]:
+                if layer['features'] is not None:
+                    lines.append(f"  Size: {layer['layer']} has {layer['features']:,} features ({layer['paging']})")
         
         if common_fields:
             lines.append(f"\n**Common fields:** {', '.join(list(common_fields)[:10])}")
@@ -1483,6 +2173,142 @@ class InspireHandler(BaseHTTPRequestHandler):
         
         return '\n'.join(lines)
     
+    def route_ogc(self, path, query):
+        """OGC API Features facade over the local layer mirror (see mirror_layers.py).
+        
+        /ogc, /ogc/conformance, /ogc/collections, /ogc/collections/{id},
+        /ogc/collections/{id}/items and /ogc/collections/{id}/items/{fid}.
+        """
+        parts = [p for p in path.split('/') if p][1:]
+        if not parts:
+            self.send_json({
+                'title': 'INSPIRE Austria layer mirror',
+                'description': 'Local copies of small WFS / OGC API layers, refreshed by mirror_layers.py',
+                'links': [
+                    {'href': '/ogc/conformance', 'rel': 'conformance', 'type': 'application/json'},
+                    {'href': '/ogc/collections', 'rel': 'data', 'type': 'application/json'}
+                ]
+            })
+        elif parts == ['conformance']:
+            self.send_json({'conformsTo': [
+                'http://www.opengis.net/spec/ogcapi-features-1/1.0/conf/core',
+                'http://www.opengis.net/spec/ogcapi-features-1/1.0/conf/geojson'
+            ]})
+        elif parts == ['collections']:
+            self.handle_ogc_collections()
+        elif parts[0] == 'collections' and len(parts) <= 4 and (len(parts) < 3 or parts[2] == 'items'):
+            self.handle_ogc_collection(parts[1], parts[3] if len(parts) == 4 else None, len(parts) >= 3, query)
+        else:
+            self.send_json({'error': 'not found'}, 404)
+    
+    def ogc_collection(self, row):
+        """OGC API collection document for a mirror_layers row (id, title, features, bbox, fetched_at)."""
+        layer_id, title, features, bbox, fetched_at = row[:5]
+        doc = {
+            'id': layer_id,
+            'title': title,
+            'itemType': 'feature',
+            'crs': [OGC_CRS84],
+            'numberOfFeatures': features,
+            'updated': fetched_at,
+            'links': [{'href': f'/ogc/collections/{layer_id}/items', 'rel': 'items', 'type': 'application/geo+json'}]
+        }
+        if bbox:
+            doc['extent'] = {'spatial': {'bbox': [json.loads(bbox)], 'crs': OGC_CRS84}}
+        return doc
+    
+    def handle_ogc_collections(self):
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute('''
+            SELECT id, title, features, bbox, fetched_at FROM mirror_layers
+            WHERE path IS NOT NULL ORDER BY id
+        ''')
+        collections = [self.ogc_collection(row) for row in cur.fetchall()]
+        conn.close()
+        self.send_json({
+            'collections': collections,
+            'links': [{'href': '/ogc/collections', 'rel': 'self', 'type': 'application/json'}]
+        })
+    
+    def handle_ogc_collection(self, layer_id, fid, items, query):
+        """A collection, a page of its items (bbox, limit, offset) or one item."""
+        try:
+            limit = min(int(query.get('limit', [str(OGC_LIMIT)])[0]), OGC_MAX_LIMIT)
+            offset = int(query.get('offset', ['0'])[0])
+            bbox = [float(v) for v in query['bbox'][0].split(',')] if query.get('bbox') else None
+            if bbox is not None and len(bbox) != 4 or limit < 1 or offset < 0:
+                raise ValueError
+        except ValueError:
+            self.send_json({'error': 'limit and offset must be non-negative integers, bbox minx,miny,maxx,maxy'}, 400)
+            return
+        
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute('''
+            SELECT id, title, features, bbox, fetched_at, path FROM mirror_layers
+            WHERE id = ? AND path IS NOT NULL
+        ''', (layer_id,))
+        row = cur.fetchone()
+        if row and items:
+            # Best effort: the mirror job or an index rebuild may hold the write lock,
+            # and a read should neither wait long for it nor fail
+            try:
+                cur.execute('PRAGMA busy_timeout = 100')
+                mirror_layers.touch_layer(cur, layer_id)
+                conn.commit()
+            except sqlite3.OperationalError:
+                pass
+        conn.close()
+        if not row:
+            self.send_json({'error': 'collection not found'}, 404)
+            return
+        if not items:
+            self.send_json(self.ogc_collection(row))
+            return
+        
+        try:
+            layer = mirror_layers.open_layer(row[5])
+        except sqlite3.OperationalError:
+            self.send_json({'error': 'collection not found'}, 404)  # evicted while we looked
+            return
+        
+        def feature(fid, geometry, props):
+            return (b'{"type": "Feature", "id": ' + json.dumps(fid).encode('utf-8') + b', "geometry": ' +
+                    geometry.encode('utf-8') + b', "properties": ' + props.encode('utf-8') + b'}')
+        
+        try:
+            if fid is not None:
+                item = mirror_layers.get_item(layer, fid)
+                if item is None:
+                    self.send_json({'error': 'feature not found'}, 404)
+                else:
+                    self.send_json_bytes(feature(*item), content_type='application/geo+json; charset=utf-8')
+                return
+            matched, page = mirror_layers.query_items(layer, bbox, limit, offset)
+        finally:
+            layer.close()
+        
+        def page_link(rel, page_offset):
+            params = {'limit': limit, 'offset': page_offset}
+            if bbox:
+                params['bbox'] = query['bbox'][0]
+            return {'href': f'/ogc/collections/{layer_id}/items?' + urlencode(params), 'rel': rel,
+                    'type': 'application/geo+json'}
+        
+        links = [page_link('self', offset)]
+        if offset + limit < matched:
+            links.append(page_link('next', offset + limit))
+        if offset > 0:
+            links.append(page_link('prev', max(0, offset - limit)))
+        
+        head = json.dumps({
+            'type': 'FeatureCollection', 'numberMatched': matched, 'numberReturned': len(page),
+            'timeStamp': row[4], 'links': links
+        }, ensure_ascii=False).encode('utf-8')
+        body = head[:-1] + b', "features": [' + b',\n'.join(feature(*f) for f in page) + b']}'
+        self.send_json_bytes(body, content_type='application/geo+json; charset=utf-8')
+    
     def handle_smart_search(self, query):
         """Enhanced search with concept grouping and combination suggestions."""
         q = query.get('q', [''])[0]
@@ -1590,20 +2416,21 @@ class InspireHandler(BaseHTTPRequestHandler):
         
         conn.close()
         
-        self.send_json({
+        self.send_list({
             'query': q,
             'matched_concepts': matched_concepts,
             'datasets': datasets,
             'by_province': {k: len(v) for k, v in by_province.items()},
             'combinable_groups': combinable_groups,
             'total': len(datasets)
-        })
+        }, 'datasets', query)
     
     def log_message(self, format, *args):
         print(f"[{self.client_address[0]}] {args[0]}")
 
 def run_server(port=8000):
-    server = HTTPServer(('0.0.0.0', port), InspireHandler)
+    init_db()
+    server = ThreadingHTTPServer(('0.0.0.0', port), InspireHandler)
     print(f"Server running on http://localhost:{port}")
     print(f"Public URL: https://inspire-austria.exe.xyz:{port}")
     server.serve_forever()
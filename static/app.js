@@ -455,15 +455,10 @@ async function showFavorites() {
         return;
     }
     
-    // Fetch each favorite
-    const results = [];
-    for (const id of state.favorites) {
-        const res = await fetch(`/api/dataset?id=${encodeURIComponent(id)}`);
-        if (res.ok) {
-            const data = await res.json();
-            results.push(data);
-        }
-    }
+    // Fetch all favorites in one request
+    const ids = Array.from(state.favorites).join(',');
+    const res = await fetch(`/api/dataset?ids=${encodeURIComponent(ids)}`);
+    const results = res.ok ? (await res.json()).datasets : [];
     
     state.results = results;
     state.total = results.length;
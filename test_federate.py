@@ -0,0 +1,112 @@
+import json
+import threading
+import unittest
+from urllib.parse import parse_qs, urlsplit
+
+from federate import fetch_source, make_source, next_page_url, url_layer
+from http_client import Response
+
+class FakeClient:
+    """Answers stream() from a list of pages and records the URLs asked for."""
+
+    def __init__(self, *pages, complete=True):
+        self.pages = list(pages)
+        self.complete = complete
+        self.urls = []
+
+    def stream(self, url, feed, headers=None, max_bytes=None):
+        self.urls.append(url)
+        body = json.dumps(self.pages.pop(0)).encode('utf-8')
+        return Response(url, 200, {}, body, complete=self.complete)
+
+def features(start, count):
+    return [{'type': 'Feature', 'id': i, 'geometry': None, 'properties': {}} for i in range(start, start + count)]
+
+def query(url):
+    return {k.upper(): v[0] for k, v in parse_qs(urlsplit(url).query).items()}
+
+class NextPageUrlTest(unittest.TestCase):
+
+    def test_ogc_follows_next_link(self):
+        source = make_source('OGC-API', 'http://x/ogc', 'roads', limit=100)
+        page = {'features': features(0, 10), 'links': [{'rel': 'self', 'href': 'http://x/a'},
+                                                       {'rel': 'next', 'href': 'http://x/b'}]}
+        self.assertEqual(next_page_url(source, page, 10), 'http://x/b')
+        self.assertIsNone(next_page_url(source, {'features': features(0, 10), 'links': []}, 10))
+
+    def test_wfs_continues_after_full_page(self):
+        source = make_source('WFS', 'http://x/wfs?map=a', 'ns:roads', limit=100)
+        source['page_size'] = 10
+        url = next_page_url(source, {'features': features(0, 10)}, 10)
+        params = query(url)
+        self.assertEqual(params['STARTINDEX'], '10')
+        self.assertEqual(params['TYPENAMES'], 'ns:roads')
+        self.assertEqual(params['SRSNAME'], 'urn:ogc:def:crs:OGC:1.3:CRS84')
+        self.assertEqual(params['MAP'], 'a')
+
+    def test_wfs_stops_on_short_page_or_number_matched(self):
+        source = make_source('WFS', 'http://x/wfs', 'roads', limit=100)
+        source['page_size'] = 10
+        self.assertIsNone(next_page_url(source, {'features': features(0, 9)}, 9))
+        self.assertIsNone(next_page_url(source, {'features': features(10, 10), 'numberMatched': 20}, 20))
+        self.assertIsNotNone(next_page_url(source, {'features': features(10, 10), 'numberMatched': 21}, 20))
+
+class FetchSourceTest(unittest.TestCase):
+
+    def fetch(self, client, source):
+        pages = []
+        fetch_source(client, source, lambda source, feats: pages.append(feats), threading.Event())
+        return pages
+
+    def test_pages_until_short_page(self):
+        source = make_source('WFS', 'http://x/wfs', 'roads', limit=100)
+        source['page_size'] = 10
+        client = FakeClient({'features': features(0, 10)}, {'features': features(10, 4)})
+        pages = self.fetch(client, source)
+        self.assertEqual([len(p) for p in pages], [10, 4])
+        self.assertEqual((source['status'], source['features'], source['pages']), ('ok', 14, 2))
+        self.assertEqual([query(u)['STARTINDEX'] for u in client.urls], ['0', '10'])
+
+    def test_truncates_at_limit(self):
+        source = make_source('OGC-API', 'http://x/ogc', 'roads', limit=15)
+        next_link = {'rel': 'next', 'href': 'http://x/ogc/collections/roads/items?offset=10'}
+        client = FakeClient({'features': features(0, 10), 'links': [next_link]},
+                            {'features': features(10, 10), 'links': [next_link]})
+        pages = self.fetch(client, source)
+        self.assertEqual([len(p) for p in pages], [10, 5])
+        self.assertEqual((source['status'], source['features']), ('truncated', 15))
+        self.assertEqual(len(client.urls), 2)
+
+    def test_limit_reached_with_more_pages_is_truncated(self):
+        source = make_source('WFS', 'http://x/wfs', 'roads', limit=10)
+        client = FakeClient({'features': features(0, 10)})
+        self.fetch(client, source)
+        self.assertEqual((source['status'], source['features']), ('truncated', 10))
+        self.assertEqual(len(client.urls), 1)
+
+    def test_limit_reached_on_last_page_is_ok(self):
+        source = make_source('OGC-API', 'http://x/ogc', 'roads', limit=10)
+        self.fetch(FakeClient({'features': features(0, 10), 'links': []}), source)
+        self.assertEqual((source['status'], source['features']), ('ok', 10))
+
+    def test_incomplete_page_is_an_error(self):
+        source = make_source('WFS', 'http://x/wfs', 'roads', limit=100)
+        pages = self.fetch(FakeClient({'features': features(0, 3)}, complete=False), source)
+        self.assertEqual(pages, [])
+        self.assertEqual(source['status'], 'error')
+        self.assertIn('larger than', source['error'])
+
+    def test_not_a_feature_collection(self):
+        source = make_source('WFS', 'http://x/wfs', 'roads', limit=100)
+        self.fetch(FakeClient([1, 2, 3]), source)
+        self.assertEqual(source['status'], 'error')
+
+class UrlLayerTest(unittest.TestCase):
+
+    def test_layers(self):
+        self.assertEqual(url_layer('OGC-API', 'http://x/ogc/collections/stra%C3%9Fen/items'), 'straßen')
+        self.assertEqual(url_layer('WFS', 'http://x/wfs?service=WFS&typeNames=ns:a,ns:b'), 'ns:a')
+        self.assertIsNone(url_layer('WFS', 'http://x/wfs?service=WFS'))
+
+if __name__ == '__main__':
+    unittest.main()
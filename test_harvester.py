@@ -0,0 +1,69 @@
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+
+import harvester
+from harvester import DELTA_FILE, HarvestError, StubSearchHandler, harvest_delta, save_state
+from raw_store import RawStore
+
+def record(ds_id, changed='2024-01-01T00:00:00Z'):
+    return {'_id': ds_id, '_source': {'metadataIdentifier': ds_id, 'changeDate': changed, 'title': ds_id}}
+
+class HarvestDeltaTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.catalog = self.tmp / 'catalog'
+        self.raw_dir = self.tmp / 'raw'
+
+        # The catalog has deleted c and added d since the last harvest
+        RawStore(self.catalog).put_many([record('a'), record('b'), record('d')])
+        RawStore(self.raw_dir).put_many([record('a'), record('b'), record('c')])
+        save_state(self.raw_dir, {'complete': True, 'watermark': '2024-06-01T00:00:00Z'})
+
+        handler = type('Handler', (StubSearchHandler,), {'source_dir': str(self.catalog), 'fail_rate': 0.0})
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/_search'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp)
+
+    def delta(self):
+        with open(self.raw_dir / DELTA_FILE) as f:
+            return json.load(f)
+
+    def test_removes_and_adds(self):
+        self.assertTrue(harvest_delta(self.url, self.raw_dir))
+        self.assertEqual(sorted(RawStore(self.raw_dir).ids()), ['a', 'b', 'd'])
+        delta = self.delta()
+        self.assertEqual((delta['changed'], delta['removed']), (['d'], ['c']))
+
+    def test_failed_fetch_keeps_deletions_for_the_next_run(self):
+        with mock.patch.object(harvester, 'fetch_records', side_effect=HarvestError('HTTP 503 from search API')):
+            with self.assertRaises(HarvestError):
+                harvest_delta(self.url, self.raw_dir)
+        self.assertIn('c', RawStore(self.raw_dir).ids())
+        self.assertFalse((self.raw_dir / DELTA_FILE).exists())
+
+        self.assertTrue(harvest_delta(self.url, self.raw_dir))
+        self.assertNotIn('c', RawStore(self.raw_dir).ids())
+        self.assertEqual(self.delta()['removed'], ['c'])
+
+    def test_pending_delta_is_merged(self):
+        self.assertTrue(harvest_delta(self.url, self.raw_dir))
+        RawStore(self.catalog).put_many([record('b', '2024-07-01T00:00:00Z')])
+        RawStore(self.catalog).remove(['a'])
+        self.assertTrue(harvest_delta(self.url, self.raw_dir))
+        delta = self.delta()
+        self.assertEqual((delta['changed'], delta['removed']), (['b', 'd'], ['a', 'c']))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from http_client import HttpClient, InvalidUrlError
+
+class EchoPathHandler(BaseHTTPRequestHandler):
+    """Answers every request with the request target it received."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = self.path.encode('ascii')
+        self.send_response(200)
+        self.send_header('Content-Length', len(body))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', 0)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+class RequestTargetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), EchoPathHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.client = HttpClient(timeout=5, retries=0)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_non_ascii_path_is_percent_encoded(self):
+        resp = self.client.get(self.base + '/Gewässer/Flüsse?name=Mur Fluss&x=ä')
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(resp.text(), '/Gew%C3%A4sser/Fl%C3%BCsse?name=Mur%20Fluss&x=%C3%A4')
+        self.assertEqual(self.client.request('HEAD', self.base + '/Gewässer').status, 200)
+
+    def test_encoded_target_is_sent_unchanged(self):
+        target = "/ows?SERVICE=WFS&TYPENAMES=ps:Prot%20Site&BBOX=1,2,3,4&f=(a)~'b'*"
+        self.assertEqual(self.client.get(self.base + target).text(), target)
+
+    def test_invalid_urls(self):
+        for url in ('http://127.0.0.1:99999/', 'ftp://127.0.0.1/', 'http://hä\udc80st/'):
+            with self.assertRaises(InvalidUrlError, msg=url):
+                self.client.get(url)
+
+if __name__ == '__main__':
+    unittest.main()
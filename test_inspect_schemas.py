@@ -0,0 +1,92 @@
+import json
+import unittest
+
+from inspect_schemas import FeatureSampler, union_fields
+
+def collection(count, number_matched=None, first=True):
+    """A GeoJSON FeatureCollection with numberMatched before or after the features."""
+    features = [{'type': 'Feature', 'id': i, 'geometry': None,
+                 'properties': {'name': f'road "{i}" \\ {{x}}', 'lanes': [i, {'n': i}]}} for i in range(count)]
+    parts = ['"type": "FeatureCollection"']
+    if number_matched is not None and first:
+        parts.append(f'"numberMatched": {number_matched}')
+    parts.append('"features": ' + json.dumps(features))
+    if number_matched is not None and not first:
+        parts.append(f'"numberMatched": {number_matched}')
+    parts.append('"links": [{"rel": "next", "href": "http://x/items?offset=10"}]')
+    return ('{' + ', '.join(parts) + '}').encode('utf-8'), features
+
+def feed(sampler, body, size):
+    for i in range(0, len(body), size):
+        if sampler.feed(body[i:i + size]):
+            return True
+    return False
+
+class FeatureSamplerTest(unittest.TestCase):
+
+    def test_number_matched_before_features(self):
+        body, features = collection(10, 1500, first=True)
+        for size in (1, 3, 7, 64, len(body)):
+            sampler = FeatureSampler(3)
+            feed(sampler, body, size)
+            self.assertEqual(sampler.features, features[:3], size)
+            self.assertEqual(sampler.number_matched, 1500, size)
+
+    def test_number_matched_after_features(self):
+        body, features = collection(10, 1500, first=False)
+        for size in (1, 3, 7, 64, len(body)):
+            sampler = FeatureSampler(3)
+            feed(sampler, body, size)
+            self.assertEqual(sampler.features, features[:3], size)
+            self.assertEqual(sampler.number_matched, 1500, size)
+            self.assertTrue(sampler.done, size)
+
+    def test_stops_once_sample_and_count_are_in(self):
+        body, _ = collection(10, 1500, first=True)
+        sampler = FeatureSampler(3)
+        self.assertTrue(feed(sampler, body + b'x' * 1000, 16))
+        self.assertFalse(sampler.finished)
+
+    def test_without_number_matched(self):
+        body, features = collection(5)
+        for size in (1, 5, len(body)):
+            sampler = FeatureSampler(10)
+            self.assertTrue(feed(sampler, body, size), size)
+            self.assertEqual(sampler.features, features, size)
+            self.assertIsNone(sampler.number_matched, size)
+            self.assertTrue(sampler.finished, size)
+
+    def test_feature_bytes(self):
+        body, features = collection(4)
+        sampler = FeatureSampler(2)
+        feed(sampler, body, 5)
+        self.assertEqual(sampler.feature_bytes, sum(len(json.dumps(f).encode('utf-8')) for f in features[:2]))
+
+class UnionFieldsTest(unittest.TestCase):
+
+    def test_types_and_nullability(self):
+        features = [
+            {'geometry': {'type': 'Point', 'coordinates': [1, 2]}, 'properties': {'ref': 'A1', 'lanes': 2}},
+            {'geometry': None, 'properties': {'ref': 'A2', 'lanes': 2.5, 'note': None}},
+        ]
+        fields = {f['name']: f for f in union_fields(features)}
+        self.assertEqual(list(fields), ['ref', 'lanes', 'note', 'geometry'])
+        self.assertEqual((fields['ref']['is_nullable'], fields['ref']['sample_value']), (False, 'A1'))
+        self.assertEqual(fields['lanes']['type'], 'decimal')
+        self.assertEqual((fields['note']['type'], fields['note']['is_nullable']), ('string', True))
+        self.assertEqual((fields['geometry']['is_geometry'], fields['geometry']['is_nullable']), (True, True))
+
+    def test_geometry_property_is_kept(self):
+        props = {'geometry': 'Polygon', 'id': 1}
+        features = [{'geometry': {'type': 'Point', 'coordinates': [1, 2]}, 'properties': props}]
+        fields = union_fields(features)
+        self.assertEqual(props, {'geometry': 'Polygon', 'id': 1})
+        self.assertEqual([(f['name'], f['type'], f['is_geometry']) for f in fields],
+                         [('geometry', 'string', False), ('id', 'integer', False), ('_geometry', 'geometry', True)])
+
+    def test_without_geometry(self):
+        fields = union_fields([{'geometry': None, 'properties': {'a': 1}}])
+        self.assertEqual([f['name'] for f in fields], ['a'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from mirror_layers import collection_id, create_layer_tables, geometry_bbox, get_item, open_layer, query_items
+
+def point(fid, x, y):
+    return {'id': fid, 'geometry': {'type': 'Point', 'coordinates': [x, y]}, 'properties': {'n': fid}}
+
+class QueryItemsTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        conn = sqlite3.connect(self.path)
+        create_layer_tables(conn)
+        # a 10 x 10 grid of points at (x, y) = (0..9, 0..9), then a line and a feature without geometry
+        features = [point(f'p{x}-{y}', x, y) for y in range(10) for x in range(10)]
+        features.append({'id': None, 'geometry': {'type': 'LineString', 'coordinates': [[20, 20], [30, 25]]},
+                         'properties': {}})
+        features.append({'id': 'none', 'geometry': None, 'properties': {}})
+        for feature in features:
+            cur = conn.execute('INSERT INTO features (fid, geometry, properties) VALUES (?, ?, ?)', (
+                feature['id'], json.dumps(feature['geometry']), json.dumps(feature['properties'])))
+            box = geometry_bbox(feature['geometry'])
+            if box:
+                conn.execute('INSERT INTO features_rtree VALUES (?, ?, ?, ?, ?)',
+                             (cur.lastrowid, box[0], box[2], box[1], box[3]))
+        conn.commit()
+        conn.close()
+        self.conn = open_layer(self.path)
+
+    def tearDown(self):
+        self.conn.close()
+        os.unlink(self.path)
+
+    def test_all_features(self):
+        matched, rows = query_items(self.conn, limit=1000)
+        self.assertEqual(matched, 102)
+        self.assertEqual(len(rows), 102)
+        self.assertEqual(rows[0][0], 'p0-0')
+        self.assertEqual(rows[100][0], '101')  # served under its row id
+
+    def test_bbox(self):
+        matched, rows = query_items(self.conn, bbox=(2, 3, 4, 4.5), limit=1000)
+        self.assertEqual(matched, 6)
+        self.assertEqual([fid for fid, _, _ in rows], ['p2-3', 'p3-3', 'p4-3', 'p2-4', 'p3-4', 'p4-4'])
+
+    def test_bbox_intersects_envelope(self):
+        matched, rows = query_items(self.conn, bbox=(24, 21, 26, 22))
+        self.assertEqual(matched, 1)
+        self.assertEqual(json.loads(rows[0][1])['type'], 'LineString')
+        self.assertEqual(query_items(self.conn, bbox=(40, 40, 50, 50)), (0, []))
+
+    def test_paging(self):
+        seen = []
+        for offset in range(0, 102, 25):
+            matched, rows = query_items(self.conn, limit=25, offset=offset)
+            self.assertEqual(matched, 102)
+            seen.extend(fid for fid, _, _ in rows)
+        self.assertEqual(len(seen), 102)
+        self.assertEqual(len(set(seen)), 102)
+
+    def test_bbox_paging(self):
+        matched, first = query_items(self.conn, bbox=(0, 0, 9, 1), limit=15)
+        _, rest = query_items(self.conn, bbox=(0, 0, 9, 1), limit=15, offset=15)
+        self.assertEqual(matched, 20)
+        self.assertEqual((len(first), len(rest)), (15, 5))
+        self.assertFalse({r[0] for r in first} & {r[0] for r in rest})
+
+    def test_get_item(self):
+        fid, geometry, props = get_item(self.conn, 'p3-4')
+        self.assertEqual(json.loads(geometry)['coordinates'], [3, 4])
+        self.assertEqual(json.loads(props), {'n': 'p3-4'})
+        self.assertIsNotNone(get_item(self.conn, '101'))
+        self.assertIsNone(get_item(self.conn, '1'))  # row 1 has an id of its own
+        self.assertIsNone(get_item(self.conn, 'missing'))
+
+class CollectionIdTest(unittest.TestCase):
+
+    def test_distinct_for_layers_with_the_same_slug(self):
+        # Both slugify to ns-roads; only the hash of the raw name tells them apart
+        self.assertTrue(collection_id(7, 'ns:roads').startswith('7-ns-roads-'))
+        self.assertTrue(collection_id(7, 'ns-roads').startswith('7-ns-roads-'))
+        self.assertNotEqual(collection_id(7, 'ns:roads'), collection_id(7, 'ns-roads'))
+        self.assertNotEqual(collection_id(7, 'ps:Foo'), collection_id(7, 'ps-Foo'))
+        self.assertEqual(collection_id(7, 'ns:roads'), collection_id(7, 'ns:roads'))
+
+if __name__ == '__main__':
+    unittest.main()
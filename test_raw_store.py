@@ -0,0 +1,82 @@
+import json
+import multiprocessing
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from raw_store import DATA_FILE, INDEX_FILE, RawStore, encode_record
+
+def record(ds_id, version=1):
+    return {'_id': ds_id, '_source': {'metadataIdentifier': ds_id, 'title': f'{ds_id} v{version}'}}
+
+def put_batches(raw_dir, start, count):
+    store = RawStore(raw_dir)
+    for i in range(start, start + count, 5):
+        store.put_many([record(f'w{j}') for j in range(i, i + 5)])
+
+class RawStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_put_get_remove(self):
+        store = RawStore(self.dir)
+        self.assertEqual(store.put_many([record('a'), record('b')]), ['a', 'b'])
+        self.assertEqual(store.put_many([record('a'), record('b', 2)]), ['b'])
+        self.assertEqual(store.get('b')['_source']['title'], 'b v2')
+        self.assertEqual(store.remove(['a', 'x']), ['a'])
+        self.assertEqual(RawStore(self.dir).ids(), ['b'])
+
+    def test_compaction_switches_generation(self):
+        store = RawStore(self.dir)
+        store.put_many([record(i) for i in 'abc'])
+        store.put_many([record(i, 2) for i in 'ab'])
+        reader = RawStore(self.dir)
+        self.assertEqual(reader.get('a')['_source']['title'], 'a v2')
+
+        store.compact()
+        self.assertFalse((self.dir / DATA_FILE).exists())
+        self.assertTrue((self.dir / 'records.1.dat').exists())
+        self.assertEqual(store.garbage_ratio(), 0.0)
+        # The reader mapped the old file before compaction and follows the index to the new one
+        self.assertEqual({i: reader.get(i)['_source']['title'] for i in 'abc'},
+                         {'a': 'a v2', 'b': 'b v2', 'c': 'c v1'})
+
+        store.put_many([record('c', 3)])
+        store.compact()
+        self.assertEqual(sorted(p.name for p in self.dir.glob('*.dat')), ['records.2.dat'])
+        self.assertEqual(RawStore(self.dir).get('c')['_source']['title'], 'c v3')
+
+    def test_reads_legacy_index(self):
+        blobs = [encode_record(record(i)) for i in 'ab']
+        with open(self.dir / DATA_FILE, 'wb') as f:
+            f.write(b''.join(blobs))
+        with open(self.dir / INDEX_FILE, 'w') as f:
+            json.dump({'a': [0, len(blobs[0])], 'b': [len(blobs[0]), len(blobs[1])]}, f)
+
+        store = RawStore(self.dir)
+        self.assertEqual(store.get('b')['_source']['title'], 'b v1')
+        store.compact()
+        self.assertEqual(sorted(r['_id'] for r in RawStore(self.dir).records()), ['a', 'b'])
+
+    def test_concurrent_writers_lose_nothing(self):
+        store = RawStore(self.dir)
+        store.put_many([record(f'w{j}') for j in range(5)])
+        writer = multiprocessing.get_context('fork').Process(target=put_batches, args=(self.dir, 5, 300))
+        writer.start()
+        while writer.is_alive():
+            store.put_many([record('w0', len(store))])
+            store.compact()
+        writer.join()
+        self.assertEqual(writer.exitcode, 0)
+
+        reader = RawStore(self.dir)
+        self.assertEqual(len(reader), 305)
+        self.assertEqual(sum(1 for _ in reader.records()), 305)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,36 +1,106 @@
 #!/usr/bin/env python3
 """Background job to validate service links and update database."""
 
+import asyncio
+import heapq
 import sqlite3
 import json
 import time
-import urllib.request
-import urllib.error
-import ssl
-import re
-from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import sys
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from endpoints import ensure_column, init_layer_size_table, probe_url, save_layer_sizes
+from host_health import HostHealth, print_health_report
+from http_client import HttpClient, HttpError, print_host_report
 
 DB_PATH = 'inspire_austria.db'
 RESULTS_PATH = 'link_validation_results.json'
-TIMEOUT = 15  # seconds
-MAX_WORKERS = 10  # parallel requests
+TIMEOUT = 15  # seconds, for hosts without a latency history
+USER_AGENT = 'INSPIRE-Austria-Validator/1.0'
+RETRIES = 1  # a link is rechecked on schedule anyway
+MAX_CONCURRENCY = 64  # requests in flight overall
+HOST_START = 2  # initial requests in flight per host
+HOST_MAX = 8  # per-host ceiling for the adaptive window
+PROBE_BYTES = 4096  # capabilities / landing page bytes to read
+RANGE_BYTES = 2048  # download bytes to request when HEAD is refused
+
+# Scheduling: a plain link is rechecked weekly; weights shorten that
+BASE_INTERVAL_HOURS = 7 * 24
+MIN_INTERVAL_HOURS = 12
+MAX_INTERVAL_HOURS = 30 * 24
+TYPE_WEIGHTS = {'WFS': 3, 'OGC-API': 3, 'WMS': 2, 'WMTS': 2}
+FAILURE_DECAY = 0.3  # weight of the latest check in the failure rate
+RETENTION_DAYS = 30  # raw checks kept before folding into daily rows
 
-# Create SSL context that doesn't verify (some gov sites have cert issues)
-ssl_context = ssl.create_default_context()
-ssl_context.check_hostname = False
-ssl_context.verify_mode = ssl.CERT_NONE
+LINK_TABLES = ('link_status_current', 'link_status_daily')
 
 def init_validation_table():
-    """Create table to store validation results."""
+    """Create tables to store validation results."""
     conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
+    init_validation_tables(cur)
+    conn.commit()
+    conn.close()
+
+def init_validation_tables(cur):
+    """Raw check history, the latest status per link, and daily rollups.
     
+    A link is keyed on (endpoint_id, dataset_id, url). dataset_services ids
+    restart with every full index rebuild, but endpoint ids and dataset ids
+    survive it, so statuses stay attached to the right datasets.
+    """
     cur.execute('''
         CREATE TABLE IF NOT EXISTS link_validations (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            service_id INTEGER,
+            endpoint_id INTEGER,
+            dataset_id TEXT,
+            url TEXT,
+            status TEXT,
+            status_code INTEGER,
+            response_time_ms INTEGER,
+            content_type TEXT,
+            error_message TEXT,
+            validated_at TEXT,
+            FOREIGN KEY (endpoint_id) REFERENCES service_endpoints(id)
+        )
+    ''')
+    
+    # Tables created before endpoints existed, or keyed on dataset_services ids
+    ensure_column(cur, 'link_validations', 'endpoint_id', 'INTEGER')
+    ensure_column(cur, 'link_validations', 'dataset_id', 'TEXT')
+    if 'service_id' in table_columns(cur, 'link_validations'):
+        cur.execute('''
+            UPDATE link_validations SET dataset_id = (
+                SELECT ed.dataset_id FROM endpoint_datasets ed
+                WHERE ed.service_id = link_validations.service_id AND ed.url = link_validations.url
+            )
+            WHERE dataset_id IS NULL AND service_id IS NOT NULL
+        ''')
+    
+    # When each endpoint was last checked and is next due
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS link_schedule (
+            endpoint_id INTEGER PRIMARY KEY,
+            checks INTEGER,
+            failure_rate REAL,
+            last_status TEXT,
+            last_checked TEXT,
+            next_due TEXT,
+            FOREIGN KEY (endpoint_id) REFERENCES service_endpoints(id)
+        )
+    ''')
+    
+    # Status tables keyed on service_id are moved aside and rekeyed below
+    legacy = [t for t in LINK_TABLES if 'service_id' in table_columns(cur, t)]
+    for table in legacy:
+        cur.execute(f'ALTER TABLE {table} RENAME TO {table}_legacy')
+    
+    # Latest result per dataset link, maintained on write
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS link_status_current (
+            endpoint_id INTEGER,
+            dataset_id TEXT,
             url TEXT,
             status TEXT,
             status_code INTEGER,
@@ -38,20 +108,127 @@ def init_validation_table():
             content_type TEXT,
             error_message TEXT,
             validated_at TEXT,
-            FOREIGN KEY (service_id) REFERENCES dataset_services(id)
+            status_since TEXT,
+            PRIMARY KEY (endpoint_id, dataset_id, url),
+            FOREIGN KEY (endpoint_id) REFERENCES service_endpoints(id)
+        )
+    ''')
+    
+    # Raw history older than the retention window, one row per link and day
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS link_status_daily (
+            endpoint_id INTEGER,
+            dataset_id TEXT,
+            url TEXT,
+            day TEXT,
+            checks INTEGER,
+            up INTEGER,
+            down INTEGER,
+            p50_ms INTEGER,
+            p95_ms INTEGER,
+            max_ms INTEGER,
+            PRIMARY KEY (endpoint_id, dataset_id, url, day)
         )
     ''')
     
-    cur.execute('CREATE INDEX IF NOT EXISTS idx_validations_service ON link_validations(service_id)')
+    for table in legacy:
+        migrate_link_table(cur, table)
+    
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_validations_link ON link_validations(endpoint_id, dataset_id)')
     cur.execute('CREATE INDEX IF NOT EXISTS idx_validations_status ON link_validations(status)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_validations_time ON link_validations(validated_at)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_link_status_status ON link_status_current(status)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_link_status_dataset ON link_status_current(dataset_id)')
     
-    conn.commit()
-    conn.close()
+    # Download sizes from the probes' Content-Length
+    init_layer_size_table(cur)
+    
+    # Databases from before link_status_current: seed it from the history once
+    cur.execute('SELECT 1 FROM link_status_current LIMIT 1')
+    if cur.fetchone() is None:
+        cur.execute('''
+            INSERT INTO link_status_current
+            SELECT endpoint_id, dataset_id, url, status, status_code, response_time_ms, content_type,
+                   error_message, validated_at, validated_at
+            FROM link_validations
+            WHERE id IN (
+                SELECT MAX(id) FROM link_validations
+                WHERE endpoint_id IS NOT NULL AND dataset_id IS NOT NULL
+                GROUP BY endpoint_id, dataset_id, url
+            )
+        ''')
+
+def table_columns(cur, table):
+    cur.execute(f'PRAGMA table_info({table})')
+    return [row[1] for row in cur.fetchall()]
+
+def migrate_link_table(cur, table):
+    """Copy a status table keyed on service_id into its rekeyed replacement.
+    
+    Current statuses whose service_id no longer names the same URL (the
+    index was rebuilt since) cannot be placed and are dropped. Daily rows
+    carry no URL, so they are mapped through today's service ids.
+    """
+    if table == 'link_status_current':
+        columns = 'status, status_code, response_time_ms, content_type, error_message, validated_at, status_since'
+        match = 'ed.service_id = l.service_id AND ed.url = l.url'
+    else:
+        columns = 'day, checks, up, down, p50_ms, p95_ms, max_ms'
+        match = 'ed.service_id = l.service_id'
+    cur.execute(f'''
+        INSERT OR IGNORE INTO {table}
+        SELECT ed.endpoint_id, ed.dataset_id, ed.url, {', '.join('l.' + c for c in columns.split(', '))}
+        FROM {table}_legacy l
+        JOIN endpoint_datasets ed ON {match}
+    ''')
+    cur.execute(f'DROP TABLE {table}_legacy')
+
+def sniff_capabilities(sample):
+    """Classify the start of a capabilities response."""
+    text = sample.lower()
+    if 'exceptionreport' in text or 'serviceexception' in text:
+        return 'error_response'
+    return 'working'
+
+def probe(client, url, service_type):
+    """Request just enough of a link to tell whether it works.
+    
+    OGC services get their capabilities (or OGC-API landing page) read up
+    to PROBE_BYTES, enough to spot an exception report. Everything else,
+    including downloads that may be gigabytes, gets a HEAD; servers that
+    reject HEAD get a GET for the first RANGE_BYTES.
+    
+    Returns (Response, status).
+    """
+    if service_type in ('WFS', 'WMS', 'WMTS'):
+        resp = client.stream(url, lambda chunk: False, max_bytes=PROBE_BYTES)
+        if resp.status == 200:
+            return resp, sniff_capabilities(resp.text())
+        return resp, 'http_error'
+    
+    if service_type == 'OGC-API':
+        resp = client.stream(url, lambda chunk: False, {'Accept': 'application/json'}, PROBE_BYTES)
+        return resp, 'working' if resp.status == 200 else 'http_error'
+    
+    resp = client.request('HEAD', url)
+    if resp.status >= 400 and resp.status not in (404, 410):
+        resp = client.stream(url, lambda chunk: False, {'Range': f'bytes=0-{RANGE_BYTES - 1}'}, RANGE_BYTES)
+    return resp, 'working' if resp.status < 400 else 'http_error'
 
-def validate_url(service_id, url, service_type):
+def content_size(resp):
+    """Full size of a probed download, from a HEAD or ranged GET response."""
+    if resp.status == 206:
+        total = (resp.headers.get('Content-Range') or '').rpartition('/')[2]
+        return int(total) if total.isdigit() else None
+    length = resp.headers.get('Content-Length') or ''
+    if resp.status == 200 and length.isdigit():
+        return int(length)
+    return None
+
+def validate_url(client, endpoint_id, url, service_type):
     """Validate a single URL and return results."""
     result = {
-        'service_id': service_id,
+        'endpoint_id': endpoint_id,
         'url': url,
         'service_type': service_type,
         'status': 'unknown',
@@ -59,6 +236,7 @@ def validate_url(service_id, url, service_type):
         'response_time_ms': None,
         'content_type': None,
         'error_message': None,
+        'content_length': None,
         'validated_at': datetime.utcnow().isoformat()
     }
     
@@ -67,119 +245,231 @@ def validate_url(service_id, url, service_type):
         result['error_message'] = 'Empty or anchor URL'
         return result
     
+    start = time.time()
     try:
-        start = time.time()
-        
-        # Build request
-        req = urllib.request.Request(
-            url,
-            headers={'User-Agent': 'INSPIRE-Austria-Validator/1.0'}
-        )
-        
-        # Make request
-        response = urllib.request.urlopen(req, timeout=TIMEOUT, context=ssl_context)
-        
-        elapsed = int((time.time() - start) * 1000)
-        result['response_time_ms'] = elapsed
-        result['status_code'] = response.getcode()
-        result['content_type'] = response.headers.get('Content-Type', '')
-        
-        # Check if it's actually a service response
-        content_type = result['content_type'].lower()
-        
-        if result['status_code'] == 200:
-            # Read a bit of content to verify
-            try:
-                content_sample = response.read(2000).decode('utf-8', errors='ignore')
-            except:
-                content_sample = ''
-            
-            # Check for WFS/WMS capabilities
-            if service_type in ('WFS', 'WMS', 'WMTS'):
-                if 'capabilities' in content_sample.lower() or 'wfs' in content_sample.lower() or 'wms' in content_sample.lower():
-                    result['status'] = 'working'
-                elif 'exception' in content_sample.lower() or 'error' in content_sample.lower():
-                    result['status'] = 'error_response'
-                    result['error_message'] = 'Service returned error'
-                else:
-                    result['status'] = 'working'  # Assume OK if 200
-            elif service_type == 'OGC-API':
-                if 'collections' in content_sample.lower() or 'conformsTo' in content_sample:
-                    result['status'] = 'working'
-                else:
-                    result['status'] = 'working'
-            elif 'xml' in content_type or 'json' in content_type or 'html' in content_type:
-                result['status'] = 'working'
+        resp, result['status'] = probe(client, url, service_type)
+        result['status_code'] = resp.status
+        result['content_type'] = resp.headers.get('Content-Type', '')
+        if result['status'] == 'error_response':
+            result['error_message'] = 'Service returned error'
+        if service_type not in ('WFS', 'WMS', 'WMTS', 'OGC-API'):
+            result['content_length'] = content_size(resp)
+    except HttpError as e:
+        # circuit_open: not sent, the host failed repeatedly in this or an earlier job
+        result['status'] = e.kind if e.kind in ('timeout', 'circuit_open') else 'connection_error'
+        result['error_message'] = f'{e.kind}: {e}'[:200]
+    result['response_time_ms'] = int((time.time() - start) * 1000)
+    
+    return result
+
+class AdaptiveLimit:
+    """Requests allowed in flight to one host, adjusted AIMD-style.
+    
+    The window grows by about one request per window of successes and is
+    halved when the host times out, drops the connection or answers
+    429/503, so slow providers are backed off while healthy ones speed up.
+    """
+    
+    def __init__(self, start=HOST_START, ceiling=HOST_MAX):
+        self.window = float(start)
+        self.ceiling = ceiling
+        self.in_flight = 0
+        self.cond = asyncio.Condition()
+    
+    async def acquire(self):
+        async with self.cond:
+            await self.cond.wait_for(lambda: self.in_flight < int(self.window))
+            self.in_flight += 1
+    
+    async def release(self, congested):
+        async with self.cond:
+            self.in_flight -= 1
+            if congested:
+                self.window = max(1.0, self.window / 2)
             else:
-                result['status'] = 'working'
-        else:
-            result['status'] = 'http_error'
-            
-    except urllib.error.HTTPError as e:
-        result['status'] = 'http_error'
-        result['status_code'] = e.code
-        result['error_message'] = str(e.reason)
-        
-    except urllib.error.URLError as e:
-        result['status'] = 'connection_error'
-        result['error_message'] = str(e.reason)[:200]
-        
-    except TimeoutError:
-        result['status'] = 'timeout'
-        result['error_message'] = f'Timeout after {TIMEOUT}s'
+                self.window = min(self.ceiling, self.window + 1 / self.window)
+            self.cond.notify_all()
+
+class Validator:
+    """Runs probes from the event loop with a global cap and per-host windows."""
+    
+    def __init__(self, client, max_concurrency=MAX_CONCURRENCY, host_max=HOST_MAX):
+        self.client = client
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.host_max = host_max
+        self.hosts = {}
+    
+    async def validate(self, endpoint_id, url, service_type):
+        host = urlparse(url).hostname or ''
+        if host not in self.hosts:
+            self.hosts[host] = AdaptiveLimit(min(HOST_START, self.host_max), self.host_max)
+        limit = self.hosts[host]
         
-    except Exception as e:
-        result['status'] = 'error'
-        result['error_message'] = str(e)[:200]
+        # Wait for the host first so a throttled host never holds a global slot
+        await limit.acquire()
+        try:
+            async with self.slots:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self.executor, validate_url, self.client,
+                                                    endpoint_id, url, service_type)
+        except BaseException:
+            await limit.release(True)
+            raise
+        await limit.release(result['status'] in ('timeout', 'connection_error')
+                            or result['status_code'] in (429, 503))
+        return result
     
-    return result
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.client.close()
+
+async def validate_all(services, validator, verbose=True):
+    """Validate every endpoint concurrently, in the given priority order."""
+    tasks = [asyncio.create_task(validator.validate(svc[0], svc[1], svc[2])) for svc in services]
+    results = []
+    
+    for future in asyncio.as_completed(tasks):
+        results.append(await future)
+        if verbose and len(results) % 50 == 0:
+            print(f"  Progress: {len(results)}/{len(services)} ({100*len(results)//len(services)}%)")
+    
+    return results
+
+def check_interval(service_type, gem_score, failure_rate):
+    """Hours until a link is due again.
+    
+    Important service types, high-value datasets and links with a history
+    of failures are rechecked sooner.
+    """
+    weight = TYPE_WEIGHTS.get(service_type, 1) * (1 + (gem_score or 0) / 10) * (1 + 2 * failure_rate)
+    return min(MAX_INTERVAL_HOURS, max(MIN_INTERVAL_HOURS, BASE_INTERVAL_HOURS / weight))
 
-def get_services_to_validate(limit=None, service_types=None):
-    """Get services that need validation."""
+def get_services_to_validate(budget=None, service_types=None, check_all=False):
+    """Pick the endpoints to validate in this run.
+    
+    Every endpoint is scored by how far past its due time it is (time since
+    the last check over its check interval); endpoints never checked come
+    first. Only due endpoints are taken unless check_all, highest score
+    first, up to budget.
+    
+    Returns (endpoint_id, probe_url, service_type, dataset_count) rows.
+    """
     conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
     
     sql = '''
-        SELECT s.id, s.url, s.service_type, d.title
-        FROM dataset_services s
-        JOIN datasets d ON s.dataset_id = d.id
-        WHERE s.url IS NOT NULL AND s.url != ''
+        SELECT e.id, e.url, e.service_type, COUNT(DISTINCT ed.dataset_id), MAX(d.gem_score),
+               ls.last_checked, ls.next_due
+        FROM service_endpoints e
+        JOIN endpoint_datasets ed ON ed.endpoint_id = e.id
+        LEFT JOIN datasets d ON d.id = ed.dataset_id
+        LEFT JOIN link_schedule ls ON ls.endpoint_id = e.id
     '''
     
     if service_types:
         placeholders = ','.join('?' * len(service_types))
-        sql += f' AND s.service_type IN ({placeholders})'
+        sql += f' WHERE e.service_type IN ({placeholders})'
         params = list(service_types)
     else:
         params = []
     
-    # Prioritize important service types
-    sql += ' ORDER BY CASE s.service_type WHEN "WFS" THEN 1 WHEN "OGC-API" THEN 2 WHEN "WMS" THEN 3 ELSE 4 END'
-    
-    if limit:
-        sql += f' LIMIT {limit}'
-    
+    sql += ' GROUP BY e.id'
     cur.execute(sql, params)
-    services = cur.fetchall()
+    rows = cur.fetchall()
     conn.close()
     
-    return services
+    now = datetime.utcnow()
+    scored = []
+    for eid, url, svc_type, count, gem, last_checked, next_due in rows:
+        weight = TYPE_WEIGHTS.get(svc_type, 1) * (1 + (gem or 0) / 10)
+        if last_checked is None:
+            score = float('inf')
+        else:
+            last = datetime.fromisoformat(last_checked)
+            interval = (datetime.fromisoformat(next_due) - last).total_seconds()
+            score = (now - last).total_seconds() / max(interval, 1)
+            if score < 1 and not check_all:
+                continue
+        # Ties (never-checked links) go to important, widely used endpoints
+        scored.append(((score, weight, count), (eid, probe_url(url, svc_type), svc_type, count)))
+    
+    if budget is None:
+        budget = len(scored)
+    return [svc for _, svc in heapq.nlargest(budget, scored, key=lambda item: item[0])]
+
+def update_schedule(cur, results):
+    """Record each check and set the endpoint's next due time."""
+    for r in results:
+        failed = r['status'] != 'working'
+        cur.execute('SELECT checks, failure_rate FROM link_schedule WHERE endpoint_id = ?', (r['endpoint_id'],))
+        row = cur.fetchone()
+        checks, failure_rate = row if row else (0, 0.0)
+        # Recent checks count most, so a link that recovers cools down again
+        failure_rate = float(failed) if not checks else (1 - FAILURE_DECAY) * failure_rate + FAILURE_DECAY * failed
+        
+        cur.execute('''
+            SELECT MAX(d.gem_score) FROM endpoint_datasets ed
+            JOIN datasets d ON d.id = ed.dataset_id
+            WHERE ed.endpoint_id = ?
+        ''', (r['endpoint_id'],))
+        gem = cur.fetchone()[0]
+        
+        checked = datetime.fromisoformat(r['validated_at'])
+        hours = check_interval(r['service_type'], gem, failure_rate)
+        cur.execute('''
+            INSERT INTO link_schedule (endpoint_id, checks, failure_rate, last_status, last_checked, next_due)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(endpoint_id) DO UPDATE SET
+                checks = excluded.checks,
+                failure_rate = excluded.failure_rate,
+                last_status = excluded.last_status,
+                last_checked = excluded.last_checked,
+                next_due = excluded.next_due
+        ''', (r['endpoint_id'], checks + 1, failure_rate, r['status'], r['validated_at'],
+              (checked + timedelta(hours=hours)).isoformat()))
 
 def save_results(results):
-    """Save validation results to database and JSON file."""
+    """Save validation results to database and JSON file.
+    
+    Each endpoint was checked once; the result is recorded for every
+    dataset link to it.
+    """
     conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
     
     for r in results:
-        cur.execute('''
-            INSERT INTO link_validations 
-            (service_id, url, status, status_code, response_time_ms, content_type, error_message, validated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            r['service_id'], r['url'], r['status'], r['status_code'],
+        cur.execute('SELECT DISTINCT dataset_id, url FROM endpoint_datasets WHERE endpoint_id = ?',
+                    (r['endpoint_id'],))
+        rows = [(
+            r['endpoint_id'], dataset_id, url, r['status'], r['status_code'],
             r['response_time_ms'], r['content_type'], r['error_message'], r['validated_at']
-        ))
+        ) for dataset_id, url in cur.fetchall()]
+        cur.executemany('''
+            INSERT INTO link_validations 
+            (endpoint_id, dataset_id, url, status, status_code, response_time_ms, content_type, error_message, validated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        cur.executemany('''
+            INSERT INTO link_status_current
+            (endpoint_id, dataset_id, url, status, status_code, response_time_ms, content_type, error_message,
+             validated_at, status_since)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(endpoint_id, dataset_id, url) DO UPDATE SET
+                status_since = CASE WHEN status = excluded.status THEN status_since ELSE excluded.status_since END,
+                status = excluded.status,
+                status_code = excluded.status_code,
+                response_time_ms = excluded.response_time_ms,
+                content_type = excluded.content_type,
+                error_message = excluded.error_message,
+                validated_at = excluded.validated_at
+        ''', [row + (r['validated_at'],) for row in rows])
     
+    save_layer_sizes(cur, [
+        (r['endpoint_id'], '', None, None, r['content_length'], 'content-length', r['validated_at'])
+        for r in results if r.get('content_length') is not None
+    ])
+    update_schedule(cur, results)
     conn.commit()
     conn.close()
     
@@ -208,32 +498,110 @@ def save_results(results):
     
     return summary
 
-def run_validation(limit=None, service_types=None, verbose=True):
-    """Run the validation job."""
+def percentile(values, pct):
+    """Nearest-rank percentile of a sorted list."""
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def rollup_history(retention_days=RETENTION_DAYS):
+    """Fold raw checks older than retention_days into daily rows and purge them.
+    
+    Only whole days are folded, so each day is summarized from all of its
+    checks. Returns the number of raw rows removed.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cur = conn.cursor()
+    cutoff = (datetime.utcnow() - timedelta(days=retention_days)).date().isoformat()
+    
+    cur.execute('''
+        SELECT endpoint_id, dataset_id, url, substr(validated_at, 1, 10), status, response_time_ms
+        FROM link_validations
+        WHERE validated_at < ? AND endpoint_id IS NOT NULL AND dataset_id IS NOT NULL
+    ''', (cutoff,))
+    days = {}
+    for endpoint_id, dataset_id, url, day, status, ms in cur.fetchall():
+        d = days.setdefault((endpoint_id, dataset_id, url, day), {'up': 0, 'down': 0, 'ms': []})
+        d['up' if status == 'working' else 'down'] += 1
+        if ms is not None:
+            d['ms'].append(ms)
+    
+    rows = []
+    for link_day, d in days.items():
+        ms = sorted(d['ms'])
+        rows.append((*link_day, d['up'] + d['down'], d['up'], d['down'],
+                     percentile(ms, 50), percentile(ms, 95), ms[-1] if ms else None))
+    
+    # A day folded twice (retention shortened later) keeps counts exact and
+    # check-weighted percentiles
+    cur.executemany('''
+        INSERT INTO link_status_daily VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(endpoint_id, dataset_id, url, day) DO UPDATE SET
+            p50_ms = (p50_ms * checks + excluded.p50_ms * excluded.checks) / (checks + excluded.checks),
+            p95_ms = (p95_ms * checks + excluded.p95_ms * excluded.checks) / (checks + excluded.checks),
+            max_ms = MAX(max_ms, excluded.max_ms),
+            checks = checks + excluded.checks,
+            up = up + excluded.up,
+            down = down + excluded.down
+    ''', rows)
+    cur.execute('DELETE FROM link_validations WHERE validated_at < ?', (cutoff,))
+    purged = cur.rowcount
+    conn.commit()
+    conn.close()
+    return purged
+
+def prune_link_status():
+    """Drop statuses and rollups of links no longer in the index.
+    
+    Returns the number of links whose current status was dropped.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cur = conn.cursor()
+    pruned = 0
+    for table in LINK_TABLES:
+        cur.execute(f'''
+            DELETE FROM {table} WHERE NOT EXISTS (
+                SELECT 1 FROM endpoint_datasets ed
+                WHERE ed.endpoint_id = {table}.endpoint_id AND ed.dataset_id = {table}.dataset_id
+                  AND ed.url = {table}.url
+            )
+        ''')
+        if table == 'link_status_current':
+            pruned = cur.rowcount
+    conn.commit()
+    conn.close()
+    return pruned
+
+def run_validation(budget=None, service_types=None, verbose=True, max_concurrency=MAX_CONCURRENCY,
+                   host_max=HOST_MAX, check_all=False, retention_days=RETENTION_DAYS):
+    """Run the validation job on the endpoints most in need of a check."""
     init_validation_table()
     
-    services = get_services_to_validate(limit, service_types)
+    purged = rollup_history(retention_days)
+    if verbose and purged:
+        print(f"Folded {purged} checks older than {retention_days} days into daily rollups")
+    pruned = prune_link_status()
+    if verbose and pruned:
+        print(f"Dropped the status of {pruned} links no longer in the index")
+    
+    services = get_services_to_validate(budget, service_types, check_all)
     total = len(services)
     
     if verbose:
-        print(f"Validating {total} service links...")
-    
-    results = []
+        links = sum(svc[3] for svc in services)
+        print(f"Validating {total} endpoints used by {links} datasets...")
+    if not services:
+        return None
     
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = {
-            executor.submit(validate_url, svc[0], svc[1], svc[2]): svc
-            for svc in services
-        }
-        
-        completed = 0
-        for future in as_completed(futures):
-            result = future.result()
-            results.append(result)
-            completed += 1
-            
-            if verbose and completed % 50 == 0:
-                print(f"  Progress: {completed}/{total} ({100*completed//total}%)")
+    health = HostHealth()
+    client = HttpClient(timeout=TIMEOUT, user_agent=USER_AGENT, health=health, retries=RETRIES)
+    validator = Validator(client, max_concurrency, host_max)
+    start = time.time()
+    try:
+        results = asyncio.run(validate_all(services, validator, verbose))
+    finally:
+        validator.close()
+        health.save()
     
     summary = save_results(results)
     
@@ -247,6 +615,9 @@ def run_validation(limit=None, service_types=None, verbose=True):
         for svc_type, data in summary['by_service_type'].items():
             pct = 100 * data['working'] / data['total'] if data['total'] > 0 else 0
             print(f"  {svc_type}: {data['working']}/{data['total']} working ({pct:.0f}%)")
+        print(f"\nFinished in {time.time() - start:.0f}s")
+        print_host_report(validator.client.stats)
+        print_health_report(health)
     
     return summary
 
@@ -256,15 +627,14 @@ def get_broken_links():
     cur = conn.cursor()
     
     cur.execute('''
-        SELECT v.url, v.status, v.error_message, v.status_code, d.title, s.service_type
-        FROM link_validations v
-        JOIN dataset_services s ON v.service_id = s.id
-        JOIN datasets d ON s.dataset_id = d.id
-        WHERE v.status NOT IN ('working')
-        AND v.id IN (
-            SELECT MAX(id) FROM link_validations GROUP BY service_id
-        )
-        ORDER BY s.service_type, v.status
+        SELECT l.url, l.status, l.error_message, l.status_code, d.title, e.service_type
+        FROM link_status_current l
+        JOIN service_endpoints e ON l.endpoint_id = e.id
+        JOIN datasets d ON l.dataset_id = d.id
+        WHERE l.status != 'working'
+          AND EXISTS (SELECT 1 FROM endpoint_datasets ed
+                      WHERE ed.endpoint_id = l.endpoint_id AND ed.dataset_id = l.dataset_id AND ed.url = l.url)
+        ORDER BY e.service_type, l.status
     ''')
     
     results = cur.fetchall()
@@ -276,9 +646,14 @@ if __name__ == '__main__':
     import argparse
     
     parser = argparse.ArgumentParser(description='Validate INSPIRE service links')
-    parser.add_argument('--limit', type=int, help='Limit number of links to validate')
+    parser.add_argument('--budget', type=int, help='Most endpoints to check this run (default: all due)')
+    parser.add_argument('--all', action='store_true', help='Check endpoints even if not yet due')
     parser.add_argument('--types', nargs='+', help='Service types to validate (WFS, WMS, OGC-API, etc.)')
     parser.add_argument('--report', action='store_true', help='Show broken links report')
+    parser.add_argument('--concurrency', type=int, default=MAX_CONCURRENCY, help='Requests in flight overall')
+    parser.add_argument('--per-host', type=int, default=HOST_MAX, help='Most requests in flight per host')
+    parser.add_argument('--retention-days', type=int, default=RETENTION_DAYS,
+                        help='Days of raw checks to keep before folding into daily rollups')
     
     args = parser.parse_args()
     
@@ -292,4 +667,5 @@ if __name__ == '__main__':
             if error:
                 print(f"  Error: {error[:60]}")
     else:
-        run_validation(limit=args.limit, service_types=args.types)
+        run_validation(budget=args.budget, service_types=args.types, check_all=args.all, max_concurrency=args.concurrency,
+                       host_max=args.per_host, retention_days=args.retention_days)